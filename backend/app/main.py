@@ -4,7 +4,8 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.routes import router
-from app.utils.persistence import load_workflows_from_disk, get_storage_summary
+from app.utils.persistence import load_workflows_from_disk, get_storage_summary, flush_saves, initialize_run_store, close_run_store
+from app.services import node_execution, api_consumer_service, workflow_service
 
 # Configure logging
 logging.basicConfig(
@@ -18,10 +19,23 @@ async def lifespan(app_instance: FastAPI):
     # Code here runs on startup
     logger.info("Starting Mini Workflow Engine Backend...")
     load_workflows_from_disk()
+    # With RUNS_STORE_TYPE=redis, recent runs come from Redis (shared by all workers) instead of the runs file
+    await initialize_run_store()
     logger.info(f"Loaded {get_storage_summary()}")
+    # Shared HTTP clients and the warm code executor container are set up once, not on first use
+    await node_execution.initialize()
+    await api_consumer_service.initialize()
+    await workflow_service.initialize()
     yield
     # Code here runs on shutdown (if any)
     logger.info("Mini Workflow Engine Backend shutting down...")
+    # Stop runs first: they use the shared clients closed below
+    await workflow_service.shutdown()
+    await api_consumer_service.shutdown()
+    await node_execution.shutdown()
+    # Write out any debounced save so a shutdown right after a run doesn't lose it
+    await flush_saves()
+    await close_run_store()
 
 # Create FastAPI application
 app = FastAPI(title="Mini Workflow Engine Backend", lifespan=lifespan)
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, ConfigDict
-from typing import List, Dict, Any, Optional
+from pydantic import BaseModel, ConfigDict, PrivateAttr
+from typing import List, Dict, Any, Optional, FrozenSet, Tuple
 from datetime import datetime
 
 class Node(BaseModel):
@@ -40,8 +40,31 @@ class Workflow(BaseModel):
         result = super().model_dump(**kwargs)
         return result
 
+    # id -> Node lookup, built lazily on first use (not serialized)
+    _node_index: Optional[Dict[str, Node]] = PrivateAttr(default=None)
+    # {{variable}} names referenced by node templates, filled in by the node executor (not serialized)
+    _template_vars: Optional[FrozenSet[str]] = PrivateAttr(default=None)
+    # (structure key, analyzed graph), filled in by the workflow service (not serialized)
+    _graph: Optional[Tuple[Any, Any]] = PrivateAttr(default=None)
+
+    def build_index(self) -> Dict[str, Node]:
+        """(Re)build the node lookup table. Call again after replacing or adding nodes."""
+        index: Dict[str, Node] = {}
+        for node in self.nodes:
+            index.setdefault(node.id, node) # First node wins, like a linear scan would
+        self._node_index = index
+        return index
+
+    def get_node(self, node_id: str) -> Optional[Node]:
+        """Look up a node by id without scanning the node list."""
+        if self._node_index is None:
+            self.build_index()
+        return self._node_index.get(node_id)
+
 class NodeExecutionResult(BaseModel):
     output: Any
+    # Copy of the output kept for later template references; may omit full response bodies
+    context_output: Any = None
     next_node_id: Optional[str] = None  # For simple linear flow for now
     # Later: Add support for multiple outputs/branching (e.g., based on sourceHandle)
 
@@ -3,6 +3,7 @@ from pydantic import BaseModel
 from typing import Any, Dict, Optional, List
 
 from app.services.node_execution import test_code_node_in_docker
+from app.utils import serialization
 
 import logging
 
@@ -59,7 +60,7 @@ async def test_code_execution_endpoint(payload: CodeTestPayload = Body(...)):
         # The test_code_node_in_docker function is expected to return a dict
         # that matches the CodeTestResponse structure.
         if execution_result.get("status") == "success":
-            logger.info(f"Code test successful for node_id: {payload.node_id or 'N/A'}. Result: {str(execution_result.get('result'))[:100]}...")
+            logger.info(f"Code test successful for node_id: {payload.node_id or 'N/A'}. Result: {serialization.summarize(execution_result.get('result'))}")
             return CodeTestResponse(**execution_result)
         else:
             logger.error(f"Code test failed for node_id: {payload.node_id or 'N/A'}. Error: {execution_result.get('error')}, Details: {execution_result.get('details')}")
@@ -8,6 +8,7 @@ import uuid
 from datetime import datetime
 
 from app.models.workflow import WebhookRegistration
+from app.utils import serialization
 from app.utils.persistence import webhook_payloads, webhook_registry, webhook_mapping, workflows_db, save_webhooks_to_disk
 from app.services.workflow_service import run_workflow, signal_webhook_data_for_test, active_webhooks_expecting_test_data
 import app.services.workflow_service as workflow_service
@@ -38,19 +39,23 @@ async def register_webhook(data: Dict[str, str]):
     
     # Generate a UUID for the user-friendly webhook path
     webhook_id = str(uuid.uuid4())
+    # Integer nanoseconds since the epoch: cheap to take and serializes as a plain number
+    created_at = time.time_ns()
     
     # Store in registry (in-memory for now)
     webhook_registry[full_path_identifier] = {
         "workflow_id": workflow_id, 
         "node_id": node_id,
-        "webhook_id": webhook_id
+        "webhook_id": webhook_id,
+        "created_at": created_at
     }
     
     # Also store in webhook_mapping for the user-friendly routes
     webhook_mapping[webhook_id] = {
         "workflow_id": workflow_id,
         "node_id": node_id,
-        "internal_path": full_path_identifier
+        "internal_path": full_path_identifier,
+        "created_at": created_at
     }
     
     # Initialize the payload store for this webhook
@@ -117,7 +122,7 @@ async def handle_webhook_callback(
     payload = None
     
     # Log the incoming request for debugging
-    logger.info(f"Received webhook request to: /{webhook_specific_path}")
+    logger.info("Received webhook request to: /%s", webhook_specific_path)
     
     # Determine the method
     method = request.method.lower()
@@ -125,29 +130,34 @@ async def handle_webhook_callback(
     # Try to parse JSON payload if it's a POST/PUT/PATCH
     if method in ["post", "put", "patch"]:
         try:
-            payload = await request.json()
-            logger.info(f"Successfully parsed webhook payload: {payload}")
+            # Parse the raw bytes with orjson; request.json() would decode to str and use the stdlib parser
+            payload = serialization.loads(await request.body())
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(f"Successfully parsed webhook payload: {serialization.summarize(payload, 1000)}")
         except Exception as e:
             logger.warning(f"Failed to parse JSON payload: {str(e)}")
             # Try to get form data instead
             try:
                 form_data = await request.form()
                 payload = dict(form_data)
-                logger.info(f"Successfully parsed form data: {payload}")
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info(f"Successfully parsed form data: {serialization.summarize(payload, 1000)}")
             except Exception as e2:
                 logger.warning(f"Failed to parse form data: {str(e2)}")
                 try:
                     # Last resort: try to get raw body
                     body = await request.body()
                     payload = {"raw": body.decode('utf-8', errors='ignore')}
-                    logger.info(f"Using raw body as payload: {payload}")
+                    if logger.isEnabledFor(logging.INFO):
+                        logger.info(f"Using raw body as payload: {serialization.summarize(payload, 1000)}")
                 except Exception as e3:
                     logger.error(f"Failed to get request body: {str(e3)}")
                     payload = {}
     elif method == "get":
         # For GET requests, use query parameters as payload
         payload = dict(request.query_params)
-        logger.info(f"Using query parameters as payload: {payload}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"Using query parameters as payload: {serialization.summarize(payload, 1000)}")
     else:
         payload = {}
         
@@ -170,7 +180,8 @@ async def handle_webhook_callback(
             "status": status,
             "success": is_success
         }
-        logger.info(f"Webhook event: {log_entry}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"Webhook event: {log_entry}")
         # This could be extended to store logs or send them to websockets in the future
         return log_entry
 
@@ -234,17 +245,13 @@ async def handle_webhook_callback(
             "details": {
                 "received_at": datetime.now().isoformat(),
                 "payload_size": len(str(payload)),
-                "payload_preview": str(payload)[:100] + ("..." if len(str(payload)) > 100 else ""),
+                "payload_preview": serialization.summarize(payload),
                 "workflow_continuing": True
             }
         }
     
-    # Try to match with a registered webhook from the registry
-    matched_webhook = None
-    for webhook_id, webhook_info in webhook_registry.items():
-        if webhook_specific_path == webhook_id:
-            matched_webhook = webhook_info
-            break
+    # Try to match with a registered webhook from the registry (a dict lookup, not a scan of every registration)
+    matched_webhook = webhook_registry.get(webhook_specific_path)
             
     # Try auto-registering if it has a standard format (wh_{workflow_id}_{node_id})
     # This approach allows clients to use deterministic webhook URLs without explicit registration
@@ -330,7 +337,7 @@ async def handle_webhook_callback(
                 "workflow_id": workflow_id,
                 "node_id": node_id,
                 "payload_size": len(str(payload)),
-                "payload_preview": str(payload)[:100] + ("..." if len(str(payload)) > 100 else "")
+                "payload_preview": serialization.summarize(payload)
             }
         }
     
@@ -342,6 +349,6 @@ async def handle_webhook_callback(
             "path": webhook_specific_path,
             "suggestion": "This webhook may exist but isn't connected to any active workflow. Data was captured for debugging.",
             "received_at": datetime.now().isoformat(),
-            "payload_preview": str(payload)[:100] + ("..." if len(str(payload)) > 100 else "")
+            "payload_preview": serialization.summarize(payload)
         }
     } 
\ No newline at end of file
@@ -8,8 +8,8 @@ import os
 import json
 
 from app.models.workflow import Workflow
-from app.services.workflow_service import run_workflow, log_stream_generator, test_workflow
-from app.utils.persistence import workflows_db, workflow_runs, save_workflows_to_disk, get_run_logs, runs_dir
+from app.services.workflow_service import run_workflow, log_stream_generator, test_workflow, prepare_workflow
+from app.utils.persistence import workflows_db, workflow_runs, save_workflows_to_disk, get_run_logs, refresh_run_history, runs_dir
 
 router = APIRouter(prefix="/api/workflows", tags=["workflows"])
 logger = logging.getLogger(__name__)
@@ -32,6 +32,7 @@ async def save_workflow(workflow: Workflow):
             workflow.tested = old_workflow.tested
             workflow.last_tested = old_workflow.last_tested
     
+    prepare_workflow(workflow) # Runs (e.g. from webhooks) start without analyzing the graph
     workflows_db[workflow.id] = workflow
     save_workflows_to_disk()
     return {"message": "Workflow saved successfully", "workflow_id": workflow.id}
@@ -53,7 +54,8 @@ async def import_single_workflow(workflow_to_import: Workflow = Body(...)):
         # FastAPI automatically parses the request body into the Workflow Pydantic model.
         # This includes validation against the model's schema.
         
-        # Add or update the workflow in the in-memory database
+        # Add or update the workflow in the in-memory database, ready to run
+        prepare_workflow(workflow_to_import)
         workflows_db[workflow_to_import.id] = workflow_to_import
         
         # Persist all changes (including this import) to disk
@@ -151,6 +153,7 @@ async def get_workflow_runs(
         raise HTTPException(status_code=404, detail="Workflow not found")
     
     # Use the new function to retrieve logs with metadata
+    await refresh_run_history(workflow_id)
     runs = get_run_logs(workflow_id, limit, include_archived)
     return runs 
 
@@ -160,7 +163,8 @@ async def get_workflow_run_by_id(workflow_id: str, run_id: str):
     if workflow_id not in workflows_db:
         raise HTTPException(status_code=404, detail="Workflow not found")
     
-    # First check in-memory runs
+    # First check in-memory runs (including those other workers stored in the Redis run store)
+    await refresh_run_history(workflow_id)
     for run_log in workflow_runs.get(workflow_id, []):
         # Find the run with matching run_id
         if run_log and len(run_log) > 0 and run_log[0].get('run_id') == run_id:
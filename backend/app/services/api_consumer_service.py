@@ -1,12 +1,37 @@
 import logging
 import json
-import requests
+import httpx
 import base64
 from typing import Dict, Any
 from urllib.parse import urlencode
 
+from app.utils import serialization
+
 logger = logging.getLogger(__name__)
 
+# Shared async client: connection tests don't block the event loop and reuse pooled connections
+def _new_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=10.0,
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=5)
+    )
+
+_CLIENT = _new_http_client()
+
+# Binary responses are only previewed; bytes past this are counted but not kept in memory
+_BINARY_PREVIEW_BYTES = 10000
+
+async def initialize() -> None:
+    """Recreates the shared client if a previous shutdown closed it; called from the app lifespan."""
+    global _CLIENT
+    if _CLIENT.is_closed:
+        _CLIENT = _new_http_client()
+
+async def shutdown() -> None:
+    """Closes pooled connections; called from the app lifespan on shutdown."""
+    await _CLIENT.aclose()
+
 async def test_api_connection(api_config: Dict[str, Any]) -> Dict[str, Any]:
     """Test an API connection by sending a request with the specified configuration."""
     url = api_config.get('url')
@@ -25,7 +50,7 @@ async def test_api_connection(api_config: Dict[str, Any]) -> Dict[str, Any]:
     # Parse the headers if it's a string
     if isinstance(headers, str):
         try:
-            headers = json.loads(headers)
+            headers = serialization.loads(headers)
         except json.JSONDecodeError:
             logger.warning("Invalid headers JSON, using empty headers")
             headers = {}
@@ -34,7 +59,7 @@ async def test_api_connection(api_config: Dict[str, Any]) -> Dict[str, Any]:
     query_params = api_config.get('query_params', '{}')
     if isinstance(query_params, str):
         try:
-            query_params = json.loads(query_params)
+            query_params = serialization.loads(query_params)
         except json.JSONDecodeError:
             logger.warning("Invalid query params JSON, using empty params")
             query_params = {}
@@ -52,7 +77,7 @@ async def test_api_connection(api_config: Dict[str, Any]) -> Dict[str, Any]:
     request_body = body
     if isinstance(request_body, str) and request_body.strip():
         try:
-            request_body = json.loads(request_body)
+            request_body = serialization.loads(request_body)
         except json.JSONDecodeError:
             logger.warning("Invalid body JSON, sending as raw string")
     
@@ -80,7 +105,7 @@ async def test_api_connection(api_config: Dict[str, Any]) -> Dict[str, Any]:
     elif auth_type == 'basic':
         username = api_config.get('basic_username', '')
         password = api_config.get('basic_password', '')
-        auth = requests.auth.HTTPBasicAuth(username, password)
+        auth = httpx.BasicAuth(username, password)
     
     elif auth_type == 'oauth2':
         # For OAuth2, we would need to get a token first
@@ -91,7 +116,7 @@ async def test_api_connection(api_config: Dict[str, Any]) -> Dict[str, Any]:
         
         if token_url:
             try:
-                token_response = requests.post(
+                token_response = await _CLIENT.post(
                     token_url,
                     data={
                         'grant_type': 'client_credentials',
@@ -101,7 +126,7 @@ async def test_api_connection(api_config: Dict[str, Any]) -> Dict[str, Any]:
                     },
                     timeout=timeout
                 )
-                token_data = token_response.json()
+                token_data = serialization.loads(token_response.content)
                 access_token = token_data.get('access_token')
                 if access_token:
                     headers['Authorization'] = f"Bearer {access_token}"
@@ -118,37 +143,50 @@ async def test_api_connection(api_config: Dict[str, Any]) -> Dict[str, Any]:
             'method': method,
             'url': request_url,
             'headers': headers,
-            'timeout': timeout,
-            'auth': auth
+            'timeout': timeout
         }
         
         # Add body for methods that support it
         if method in ['POST', 'PUT', 'PATCH']:
             if isinstance(request_body, (dict, list)):
                 request_kwargs['json'] = request_body
+            elif isinstance(request_body, (str, bytes)) and request_body:
+                request_kwargs['content'] = request_body
             elif request_body:
                 request_kwargs['data'] = request_body
         
         logger.info(f"Sending {method} request to {request_url}")
-        response = requests.request(**request_kwargs)
+        # Stream the response so binary bodies can be previewed without buffering them whole
+        response = await _CLIENT.send(_CLIENT.build_request(**request_kwargs), auth=auth, stream=True)
+        try:
+            if response_handling == 'binary':
+                content_preview = bytearray()
+                content_length = 0
+                async for chunk in response.aiter_bytes():
+                    content_length += len(chunk)
+                    if len(content_preview) < _BINARY_PREVIEW_BYTES:
+                        content_preview += chunk[:_BINARY_PREVIEW_BYTES - len(content_preview)]
+            else:
+                await response.aread()
+        finally:
+            await response.aclose()
         
         # Process the response based on the specified handling method
         if response_handling == 'json':
             try:
-                response_data = response.json()
-            except json.JSONDecodeError:
+                response_data = serialization.loads(response.content)
+            except ValueError:
                 response_data = response.text
                 logger.warning("Could not parse response as JSON, returning as text")
         elif response_handling == 'text':
             response_data = response.text
         elif response_handling == 'binary':
             # Return a preview of binary data as base64
-            content_preview = response.content[:10000]  # Limit size for preview
             response_data = {
-                'data_preview': base64.b64encode(content_preview).decode('utf-8'),
+                'data_preview': base64.b64encode(content_preview).decode('ascii'),
                 'encoding': 'base64',
                 'content_type': response.headers.get('Content-Type'),
-                'content_length': len(response.content),
+                'content_length': content_length,
                 'preview_size': len(content_preview)
             }
         else:
@@ -159,7 +197,7 @@ async def test_api_connection(api_config: Dict[str, Any]) -> Dict[str, Any]:
             "status_code": response.status_code,
             "response": response_data,
             "headers": dict(response.headers),
-            "url": response.url,
+            "url": str(response.url),
             "request": {
                 "method": method,
                 "url": request_url,
@@ -169,7 +207,7 @@ async def test_api_connection(api_config: Dict[str, Any]) -> Dict[str, Any]:
         
         return result
         
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"API request failed: {e}")
         raise ConnectionError(f"API request failed: {str(e)}")
     except Exception as e:
@@ -1,5 +1,8 @@
 import logging
 import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any
 
 from litellm import completion as litellm_completion
@@ -7,6 +10,9 @@ from litellm import completion as litellm_completion
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# litellm's sync completion blocks, so it runs on a bounded pool instead of the event loop thread
+_LLM_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get('LLM_WORKERS', 32)), thread_name_prefix="llm-sync")
+
 async def test_model_config(model_config: Dict[str, Any]) -> Dict[str, Any]:
     """Test a model configuration by sending a simple message."""
     logger.info(f"Testing model configuration: {model_config.get('config_name')}")
@@ -32,12 +38,14 @@ async def test_model_config(model_config: Dict[str, Any]) -> Dict[str, Any]:
         ]
         
         logger.info(f"Test: Calling model '{model}'...")
-        response = litellm_completion(
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(_LLM_EXECUTOR, functools.partial(
+            litellm_completion,
             model=model,
             messages=messages,
             api_key=api_key,
             api_base=custom_api_base if custom_api_base else None
-        )
+        ))
         
         # Extract the response content
         output_content = response.choices[0].message.content
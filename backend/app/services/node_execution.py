@@ -1,110 +1,480 @@
 import logging
 import time
-import requests
+import asyncio
+import random
+import httpx
 import os
 import json
-from typing import Any, Dict, Optional, List
+from typing import Any, Awaitable, Callable, Dict, Optional, List, Tuple, FrozenSet, Mapping, Union
 import base64
 from urllib.parse import urlencode
 import re # Added for templating
-import shutil # For directory operations
-import tempfile # For temporary directories
 import subprocess # For running Docker commands
 import uuid # For unique naming
+import hashlib
+from collections import OrderedDict, ChainMap
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 from app.models.workflow import Node, Workflow, NodeExecutionResult
 from app.utils.persistence import webhook_payloads
-from litellm import completion as litellm_completion
+from app.utils import serialization
+import litellm
 from litellm import acompletion as litellm_acompletion
 
 # Define the name of the code executor Docker container
 CODE_EXECUTOR_CONTAINER_NAME = "workflow-code-executor"
+# Image used when the executor container has to be created by the backend (docker-compose normally starts it)
+CODE_EXECUTOR_IMAGE = os.environ.get("CODE_EXECUTOR_IMAGE", "python:3.9-slim")
+# Requirements are installed with `pip install --user`; this named volume keeps them across executor restarts
+CODE_EXECUTOR_PACKAGES_VOLUME = "code-executor-packages"
+CODE_EXECUTOR_PACKAGES_DIR = "/root/.local"
+# Resource limits for a backend-created executor container; user code shares these, so a runaway
+# snippet (fork bomb, memory leak) cannot take down the host. Mirrors docker-compose.yml.
+CODE_EXECUTOR_CPUS = os.environ.get("CODE_EXECUTOR_CPUS", "1")
+CODE_EXECUTOR_MEMORY = os.environ.get("CODE_EXECUTOR_MEMORY", "512m")
+CODE_EXECUTOR_PIDS_LIMIT = os.environ.get("CODE_EXECUTOR_PIDS_LIMIT", "64")
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-def _render_prompt_template(template_string: str, context: Dict[str, Any]) -> str:
+# Shared async HTTP client so webhook/API nodes reuse pooled TCP/TLS connections across calls
+# without blocking the event loop. The transport retries failed connection attempts itself;
+# the API consumer node's retry policy handles retryable HTTP statuses on top of that.
+def _new_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=30.0,
+        follow_redirects=True,
+        transport=httpx.AsyncHTTPTransport(
+            retries=2,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+        )
+    )
+
+_CLIENT = _new_http_client()
+
+# HTTP/2 lets concurrent LLM calls to one provider share a connection; it needs the optional h2 package
+try:
+    import h2  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except ImportError:  # pragma: no cover - depends on the environment
+    _HTTP2_AVAILABLE = False
+
+def _new_llm_client() -> httpx.AsyncClient:
+    """Long-lived client litellm sends LLM calls through (as `litellm.aclient_session`), keeping connections warm between calls."""
+    return httpx.AsyncClient(
+        timeout=600.0, # litellm's own default request timeout
+        http2=_HTTP2_AVAILABLE,
+        limits=httpx.Limits(max_keepalive_connections=32, keepalive_expiry=60)
+    )
+
+litellm.aclient_session = _new_llm_client()
+
+# OAuth2 client-credentials tokens: {(token_url, client_id, scope): (access_token, expires_at)}
+_TOKEN_CACHE: Dict[tuple, tuple] = {}
+# One lock per token key so concurrent nodes wait for a single refresh instead of each fetching a token
+_TOKEN_LOCKS: Dict[tuple, asyncio.Lock] = {}
+# Tokens are refreshed this many seconds before they actually expire
+_TOKEN_EXPIRY_MARGIN = 30
+_DEFAULT_TOKEN_TTL = 3600
+
+# Response bodies larger than this are truncated instead of being read fully into memory.
+# Can be overridden per API consumer / webhook action node via `max_response_bytes`.
+DEFAULT_MAX_RESPONSE_BYTES = 10 * 1024 * 1024
+_RESPONSE_CHUNK_SIZE = 64 * 1024
+
+# Upper bounds on in-flight calls, so wide fan-outs and batch nodes don't trip provider rate limits.
+# LLM calls are limited per provider (model prefix), HTTP node calls per target host.
+MAX_LLM_CONCURRENCY = int(os.environ.get('MAX_LLM_CONCURRENCY', 16))
+MAX_API_CONCURRENCY = int(os.environ.get('MAX_API_CONCURRENCY', 32))
+_LLM_SEMAPHORES: "OrderedDict[str, asyncio.Semaphore]" = OrderedDict()
+_API_SEMAPHORES: "OrderedDict[str, asyncio.Semaphore]" = OrderedDict()
+# Pools kept per map; hosts come from user-configured URLs, so idle pools beyond this are dropped (oldest first)
+_MAX_SEMAPHORE_POOLS = 256
+
+# Backoff delays (seconds) for the API consumer 'exponential' retry policy, indexed by attempt
+_EXPONENTIAL_BACKOFF_DELAYS = (0.5, 1, 2, 4, 8)
+# HTTP statuses the API consumer retries; other error statuses (400, 401, 404, ...) fail fast
+_RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+def _configure_llm_cache() -> None:
+    """
+    Enables litellm's response cache when LLM_CACHE_TYPE is set to 'local' (in-process) or 'redis'
+    (REDIS_HOST / REDIS_PORT / REDIS_PASSWORD). Identical LLM calls are then served from the cache.
+    """
+    cache_type = os.environ.get('LLM_CACHE_TYPE', '').strip().lower()
+    if not cache_type:
+        return
+    try:
+        from litellm.caching import Cache
+        if cache_type == 'redis':
+            litellm.cache = Cache(
+                type="redis",
+                host=os.environ.get('REDIS_HOST', 'localhost'),
+                port=os.environ.get('REDIS_PORT', '6379'),
+                password=os.environ.get('REDIS_PASSWORD')
+            )
+        else:
+            litellm.cache = Cache(type="local")
+        logger.info(f"LLM response cache enabled ({cache_type}).")
+    except Exception as e:
+        logger.warning(f"Could not enable LLM response cache ({cache_type}): {e}")
+
+_configure_llm_cache()
+
+def _supports_prompt_caching(model: str) -> bool:
+    """Anthropic models accept cache_control markers to cache a shared prompt prefix provider-side."""
+    model = model.lower()
+    return model.startswith('anthropic/') or model.startswith('claude')
+
+# Template variables look like {{variable_name}}; compiled once instead of on every render
+_TEMPLATE_RE = re.compile(r"{{([\w\d_-]+)}}")
+
+def _stringify_template_value(value: Any, _cache: Optional[Dict[int, Any]] = None) -> str:
+    """
+    Converts a context value to its template representation (pretty JSON for dicts/lists, str otherwise).
+    When a cache is given, each object is serialized only once; entries keep a reference to the
+    value so its id cannot be reused by another object while the cache is alive.
+    """
+    if _cache is not None:
+        cached = _cache.get(id(value))
+        if cached is not None and cached[0] is value:
+            return cached[1]
+    rendered = serialization.dumps(value, indent=True) if isinstance(value, (dict, list)) else str(value)
+    if _cache is not None:
+        _cache[id(value)] = (value, rendered)
+    return rendered
+
+@lru_cache(maxsize=1024)
+def _compile_template(template_string: str) -> Tuple[Tuple[str, Optional[str]], ...]:
+    """
+    Splits a template once into (literal, variable_name_or_None) segments.
+    Prompts are fixed per node, so repeated executions reuse the compiled form instead of re-scanning it.
+    """
+    # split() with a capturing group alternates literal, variable, literal, ..., ending with a literal
+    tokens = _TEMPLATE_RE.split(template_string)
+    return tuple(
+        (tokens[i], tokens[i + 1] if i + 1 < len(tokens) else None)
+        for i in range(0, len(tokens), 2)
+    )
+
+@lru_cache(maxsize=1024)
+def _compile_format_template(template_string: str) -> Tuple[str, Tuple[str, ...]]:
+    """
+    Converts a template to a str.format() string with one positional field per distinct variable,
+    e.g. "Hi {{name}}, bye {{name}}" -> ("Hi {0}, bye {0}", ("name",)).
+    Positional fields keep any variable name safe (node ids may be numeric or contain dashes) and
+    literal braces are escaped, so substitution happens in a single C-level format call.
+    """
+    format_parts = []
+    var_names: List[str] = []
+    for literal, var_name in _compile_template(template_string):
+        format_parts.append(literal.replace("{", "{{").replace("}", "}}"))
+        if var_name is None:
+            continue
+        if var_name not in var_names:
+            var_names.append(var_name)
+        format_parts.append(f"{{{var_names.index(var_name)}}}")
+    return "".join(format_parts), tuple(var_names)
+
+def _render_prompt_template(template_string: str, context: Mapping[str, Any], _cache: Optional[Dict[int, Any]] = None) -> str:
     """
     Renders a template string using a given context.
     Variables are in the format {{variable_name}}.
     If a variable is found in the context, it's replaced by its JSON stringified value.
     If not found, it's replaced by an empty string.
+    Pass the same `_cache` dict across renders to serialize each referenced value only once.
     """
+    if "{{" not in template_string:
+        return template_string # Plain prompt, nothing to substitute
     
-    def replace_match(match):
-        var_name = match.group(1)
+    format_string, var_names = _compile_format_template(template_string)
+    values = []
+    for var_name in var_names:
         if var_name in context:
-            value = context[var_name]
-            if isinstance(value, (dict, list)):
-                return json.dumps(value, indent=2)
-            return str(value)
+            values.append(_stringify_template_value(context[var_name], _cache))
         else:
             logger.warning(f"Template variable '{{{{{var_name}}}}}' not found in context. Replacing with empty string.")
-            return ""
+            values.append("")
+    return format_string.format(*values)
+
+def _usage_dict(response: Any) -> Optional[Dict[str, Any]]:
+    """Token usage of a litellm response as a plain dict, if the response carries it."""
+    usage = getattr(response, 'usage', None)
+    return usage.dict() if hasattr(usage, 'dict') else None
+
 
-    return re.sub(r"{{([\w\d_-]+)}}", replace_match, template_string)
+@lru_cache(maxsize=256)
+def _basic_auth_header(username: str, password: str) -> str:
+    """Builds the `Authorization` header value for HTTP Basic auth once per credential pair."""
+    token = base64.b64encode(f"{username}:{password}".encode('utf-8')).decode('ascii')
+    return f"Basic {token}"
+
+@lru_cache(maxsize=512)
+def _parse_json_field(raw: str) -> Any:
+    """
+    Parses a JSON string from node configuration (headers, query_params, body), once per distinct value.
+    The result is shared between executions, so callers must copy it before mutating.
+    Invalid JSON raises json.JSONDecodeError as usual (errors are not cached).
+    """
+    return serialization.loads(raw)
+
+@lru_cache(maxsize=512)
+def _encoded_query_params(raw: str) -> str:
+    """URL-encoded form of a node's query params JSON string, computed once per distinct string."""
+    query_params = serialization.loads(raw)
+    return urlencode(query_params) if query_params else ''
+
+def _append_query(url: str, encoded_params: str) -> str:
+    """Appends already-encoded query parameters to a URL that may have a query string of its own."""
+    if not encoded_params:
+        return url
+    return f"{url}&{encoded_params}" if '?' in url else f"{url}?{encoded_params}"
+
+async def _read_capped_body(response: httpx.Response, max_bytes: int, as_base64: bool = False) -> Tuple[Any, bool]:
+    """
+    Reads a streamed response body up to `max_bytes` and closes the response.
+    Returns (body, truncated); body is bytes, or a base64 string when `as_base64` is set.
+    Base64 output is encoded incrementally in 3-byte-aligned pieces, so the raw body is never held in full.
+    """
+    parts = []
+    pending = b''
+    received = 0
+    truncated = False
+    try:
+        async for chunk in response.aiter_bytes(chunk_size=_RESPONSE_CHUNK_SIZE):
+            if received + len(chunk) > max_bytes:
+                chunk = chunk[:max_bytes - received]
+                truncated = True
+            received += len(chunk)
+            if as_base64:
+                pending += chunk
+                aligned = len(pending) - len(pending) % 3
+                if aligned:
+                    parts.append(base64.b64encode(pending[:aligned]).decode('ascii'))
+                    pending = pending[aligned:]
+            else:
+                parts.append(chunk)
+            if truncated:
+                break
+    finally:
+        await response.aclose()
+
+    if as_base64:
+        if pending:
+            parts.append(base64.b64encode(pending).decode('ascii'))
+        return ''.join(parts), truncated
+    return b''.join(parts), truncated
+
+def _llm_semaphore(model: str) -> asyncio.Semaphore:
+    """Concurrency slot pool for a model's provider, e.g. 'anthropic' for 'anthropic/claude-3'."""
+    provider = model.split('/', 1)[0] if '/' in model else 'default'
+    return _pooled_semaphore(_LLM_SEMAPHORES, provider, MAX_LLM_CONCURRENCY)
+
+def _api_semaphore(url: Any) -> asyncio.Semaphore:
+    """Concurrency slot pool for the host an HTTP node calls."""
+    host = httpx.URL(url).host
+    return _pooled_semaphore(_API_SEMAPHORES, host, MAX_API_CONCURRENCY)
+
+def _pooled_semaphore(pools: "OrderedDict[str, asyncio.Semaphore]", key: str, limit: int) -> asyncio.Semaphore:
+    """
+    Returns the pool for `key`, creating it if needed. Beyond _MAX_SEMAPHORE_POOLS pools the least recently
+    used idle ones are dropped; a pool with calls in flight (or waiting) is kept so it keeps limiting them.
+    """
+    semaphore = pools.get(key)
+    if semaphore is not None:
+        pools.move_to_end(key)
+        return semaphore
+    semaphore = pools[key] = asyncio.Semaphore(limit)
+    excess = len(pools) - _MAX_SEMAPHORE_POOLS
+    if excess > 0:
+        # A semaphore at its full count has no holders and no waiters
+        idle_keys = [pool_key for pool_key, pool in pools.items() if pool._value == limit and pool_key != key]
+        for idle_key in idle_keys[:excess]:
+            del pools[idle_key]
+    return semaphore
+
+async def _limited_acompletion(**llm_kwargs: Any) -> Any:
+    """litellm acompletion call that waits for a free slot of the model provider's pool first."""
+    async with _llm_semaphore(llm_kwargs.get('model', '')):
+        return await litellm_acompletion(**llm_kwargs)
+
+def _parse_json_body(body: bytes, charset: Optional[str]) -> Any:
+    """
+    Parses a JSON response body straight from bytes, skipping the intermediate text copy for UTF-8 bodies.
+    Raises ValueError (JSONDecodeError/UnicodeDecodeError) if the body isn't valid JSON.
+    """
+    if charset and charset.lower() not in ('utf-8', 'utf8', 'ascii', 'us-ascii'):
+        return serialization.loads(body.decode(charset, errors='replace'))
+    return serialization.loads(body)
+
+async def _get_oauth2_token(token_url: str, client_id: str, client_secret: str, scope: str, timeout: float) -> Optional[str]:
+    """Returns a cached client-credentials access token, requesting a new one only when missing or about to expire."""
+    key = (token_url, client_id, scope)
+    token, expires_at = _TOKEN_CACHE.get(key, (None, 0))
+    if token and time.time() < expires_at - _TOKEN_EXPIRY_MARGIN:
+        return token
+
+    lock = _TOKEN_LOCKS.setdefault(key, asyncio.Lock())
+    async with lock:
+        # Another coroutine may have refreshed the token while we were waiting for the lock
+        token, expires_at = _TOKEN_CACHE.get(key, (None, 0))
+        if token and time.time() < expires_at - _TOKEN_EXPIRY_MARGIN:
+            return token
+
+        token_response = await _CLIENT.post(
+            token_url,
+            data={
+                'grant_type': 'client_credentials',
+                'client_id': client_id,
+                'client_secret': client_secret,
+                'scope': scope
+            },
+            timeout=timeout
+        )
+        token_data = serialization.loads(token_response.content)
+        access_token = token_data.get('access_token')
+        if access_token:
+            try:
+                expires_in = float(token_data.get('expires_in', _DEFAULT_TOKEN_TTL))
+            except (TypeError, ValueError):
+                expires_in = _DEFAULT_TOKEN_TTL
+            _TOKEN_CACHE[key] = (access_token, time.time() + expires_in)
+            _prune_expired_oauth2_tokens()
+        else:
+            _TOKEN_CACHE.pop(key, None)
+    # Nothing to serialize once no token is cached: don't keep a lock per failed or dropped key
+    if key not in _TOKEN_CACHE:
+        _drop_idle_token_lock(key)
+    return access_token
+
+def _invalidate_oauth2_token(token_url: str, client_id: str, scope: str, access_token: str) -> None:
+    """Drops a cached token the API rejected, unless another request has already replaced it."""
+    key = (token_url, client_id, scope)
+    if _TOKEN_CACHE.get(key, (None, 0))[0] == access_token:
+        del _TOKEN_CACHE[key]
+        _drop_idle_token_lock(key)
+
+def _drop_idle_token_lock(key: tuple) -> None:
+    """Removes a token key's lock, unless a refresh holds it (its waiters then still share it)."""
+    lock = _TOKEN_LOCKS.get(key)
+    if lock is not None and not lock.locked():
+        del _TOKEN_LOCKS[key]
+
+def _prune_expired_oauth2_tokens() -> None:
+    """Drops expired tokens, and their locks, of keys no longer in use; called when a new token is cached."""
+    now = time.time()
+    for key in [key for key, (_, expires_at) in _TOKEN_CACHE.items() if expires_at <= now]:
+        del _TOKEN_CACHE[key]
+        _drop_idle_token_lock(key)
+
+def _with_json_content_type(headers: Any) -> Any:
+    """Headers for a pre-serialized JSON body: adds Content-Type unless the node already sets one."""
+    if any(name.lower() == 'content-type' for name in headers):
+        return headers
+    return {**headers, 'Content-Type': 'application/json'}
+
+# Output keys that carry complete (potentially huge) response bodies
+_FULL_RESPONSE_KEYS = ('full_response', 'full_response_body')
+
+def _without_full_response(output_data: Any) -> Any:
+    """Returns a copy of a node output without its full response body fields (summaries are kept)."""
+    if not isinstance(output_data, dict) or not any(key in output_data for key in _FULL_RESPONSE_KEYS):
+        return output_data
+    return {key: value for key, value in output_data.items() if key not in _FULL_RESPONSE_KEYS}
 
-def execute_node(node: Node, input_data: Any, workflow: Workflow, run_outputs: Dict[str, Any]) -> NodeExecutionResult:
-    """Executes a single node based on its type."""
+def get_referenced_template_vars(workflow: Workflow) -> FrozenSet[str]:
+    """
+    Names referenced as {{variable}} anywhere in the workflow's node configuration.
+    Computed once per Workflow object and cached on it.
+    """
+    if workflow._template_vars is None:
+        referenced = set()
+        for node in workflow.nodes:
+            for value in node.data.values():
+                if isinstance(value, str) and "{{" in value:
+                    referenced.update(var for _, var in _compile_template(value) if var is not None)
+        workflow._template_vars = frozenset(referenced)
+    return workflow._template_vars
+
+async def execute_node(node: Node, input_data: Any, workflow: Workflow, run_outputs: Dict[str, Any],
+                       render_cache: Optional[Dict[int, Any]] = None) -> NodeExecutionResult:
+    """
+    Executes a single node based on its type.
+    Template renders of this execution share one serialization cache (`render_cache`), so an upstream output
+    referenced several times is serialized once. Don't share it between executions: outputs can be
+    mutated in place later in a run (e.g. by a code node given them as input), which the cache can't see.
+    """
     node_label = node.data.get('webhook_name', node.data.get('node_name', node.data.get('label', node.id)))
-    logger.info(f"Executing node {node.id} ({node_label} - {node.type}) with input: {str(input_data)[:100]}...")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f"Executing node {node.id} ({node_label} - {node.type}) with input: {serialization.summarize(input_data)}")
     
     output_data = None
     node_type = node.type
     node_data = node.data
+    if render_cache is None:
+        # Serialized context values, shared by every template render of this node execution
+        render_cache = {}
 
     try:
         # Execute the node based on its type
-        if node_type == 'llm':
-            output_data = execute_llm_node(node, input_data, workflow, run_outputs)
-        elif node_type == 'code':
-            output_data = execute_code_node(node_data, input_data)
-        elif node_type == 'api_consumer':
-            output_data = execute_api_consumer_node(node, input_data, run_outputs)
-        elif node_type == 'model_config':
-            output_data = input_data #As this node is not executed, it should pass the input through
-        else:
+        handler = _NODE_HANDLERS.get(node_type)
+        if handler is None:
             logger.warning(f"Node {node.id} ({node_label}): Unknown node type '{node_type}'. Passing input through.")
-            output_data = input_data # Pass data through for unknown types
+            handler = _passthrough_node # Pass data through for unknown types
+        output_data = await handler(node, input_data, workflow, run_outputs, render_cache)
 
         # Ensure output_data is not None before returning
-        if output_data is None and node_type != 'model_config': # model_config intentionally skipped in loop
-             logger.warning(f"Node {node.id} ({node_type}) logic resulted in None output. Passing original input.")
-             output_data = input_data
-        elif output_data is None and node_type == 'model_config':
-             # This case should ideally not happen based on above logic, but as fallback:
-             output_data = {"status": "Configured", "message": "Model configuration node processed."} 
+        if output_data is None:
+            if node_type == 'model_config':
+                # This case should ideally not happen based on above logic, but as fallback:
+                output_data = {"status": "Configured", "message": "Model configuration node processed."}
+            else:
+                logger.warning(f"Node {node.id} ({node_type}) logic resulted in None output. Passing original input.")
+                output_data = input_data
+
+        # Nodes may opt out of keeping large response bodies around for the rest of the run.
+        # The full output still goes to the directly connected next node; only the stored copy is slimmed,
+        # and only when no template in the workflow references this node.
+        retained_output = output_data
+        if node_data.get('truncate_full_response') and node.id not in get_referenced_template_vars(workflow):
+            retained_output = _without_full_response(output_data)
 
         # Update node status
         node_data['status'] = 'completed'
-        node_data['output'] = output_data
+        node_data['output'] = retained_output
 
-        return NodeExecutionResult(output=output_data)
+        return NodeExecutionResult(output=output_data, context_output=retained_output)
 
     except Exception as e:
         logger.error(f"Error during execution of node {node.id} ({node_label} - {node_type}): {e}", exc_info=True)
         raise # Re-raise to be caught by the main execute_workflow_logic loop
 
-def execute_llm_node(node: Node, input_data: Any, workflow: Workflow, run_outputs: Dict[str, Any]) -> Any:
-    """Execute an LLM node"""
+def _find_model_config(node: Node, workflow: Workflow) -> Optional[Dict[str, Any]]:
+    """Returns the data of the model_config node an LLM node references, if any."""
+    model_config_id = node.data.get('model_config_id')
+    if not model_config_id:
+        return None
+    # Find the referenced model config node
+    model_config_node = workflow.get_node(model_config_id)
+    if model_config_node and model_config_node.type == 'model_config':
+        logger.info(f"LLM Node {node.id}: Using model config '{model_config_node.data.get('config_name', model_config_id)}'")
+        return model_config_node.data
+    logger.warning(f"LLM Node {node.id}: Referenced model config {model_config_id} not found in workflow nodes.")
+    return None
+
+def _build_llm_kwargs(node: Node, current_input: Any, run_outputs: Dict[str, Any],
+                      model_config_data: Optional[Dict[str, Any]] = None,
+                      render_cache: Optional[Dict[int, Any]] = None) -> Dict[str, Any]:
+    """
+    Resolves model, credentials and sampling settings for an LLM node and renders its messages,
+    returning the keyword arguments for a single litellm acompletion call.
+    """
     node_data = node.data
-    
-    # Check if this node references a model configuration
-    model_config_id = node_data.get('model_config_id')
-    model_config_data = None
-    
-    if model_config_id:
-        # Find the referenced model config node
-        model_config_nodes = [n for n in workflow.nodes if n.id == model_config_id and n.type == 'model_config']
-        if model_config_nodes:
-            model_config_data = model_config_nodes[0].data
-            logger.info(f"LLM Node {node.id}: Using model config '{model_config_data.get('config_name', model_config_id)}'")
-        else:
-            logger.warning(f"LLM Node {node.id}: Referenced model config {model_config_id} not found in workflow nodes.")
-    
     prompt_template = node_data.get('prompt', 'Respond to the input.')
     temperature = float(node_data.get('temperature', 0.7))
     max_tokens = int(node_data.get('max_tokens', 150))
+    use_cache = bool(node_data.get('caching', True)) # Per-node opt-out of response/prompt caching
     
     # Use model config if available, otherwise use node's own configuration
     if model_config_data:
@@ -127,65 +497,139 @@ def execute_llm_node(node: Node, input_data: Any, workflow: Workflow, run_output
         else:
             logger.warning(f"Node {node.id}: Using API key from environment variable.")
 
-    templating_context = {"current_input": input_data}
-    templating_context.update(run_outputs)
-
-    final_prompt = _render_prompt_template(prompt_template, templating_context)
+    # Layered view instead of a copy of run_outputs; node outputs still shadow 'current_input'
+    templating_context = ChainMap(run_outputs, {"current_input": current_input})
+    final_prompt = _render_prompt_template(prompt_template, templating_context, render_cache)
+    input_str = _stringify_template_value(current_input, render_cache)
+
+    system_content: Any = final_prompt
+    if use_cache and _supports_prompt_caching(model):
+        # The rendered system prompt is the stable prefix across runs; only the user input varies
+        system_content = [{"type": "text", "text": final_prompt, "cache_control": {"type": "ephemeral"}}]
+
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_content},
+            {"role": "user", "content": f"Contextual Input (available as 'current_input' in prompt templates):\n```json\n{input_str}\n```"}
+        ],
+        "api_key": api_key,
+        "api_base": custom_api_base if custom_api_base else None, # Pass api_base if provided
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "caching": use_cache # Only takes effect when a litellm cache is configured
+    }
+
+def _llm_details(node: Node, llm_kwargs: Dict[str, Any], model_config_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """The `details` block reported with LLM node outputs."""
+    return {
+        "model_used": llm_kwargs["model"],
+        "config_source": f"from node data" if not model_config_data else f"from config node '{model_config_data.get('config_name', node.data.get('model_config_id'))}'",
+        "api_base": llm_kwargs["api_base"] or 'default',
+        "temperature": llm_kwargs["temperature"],
+        "max_tokens": llm_kwargs["max_tokens"]
+    }
+
+def _finalize_llm_output(node: Node, response: Any, llm_kwargs: Dict[str, Any],
+                         model_config_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Turns a litellm completion response into the LLM node's output."""
+    # Extract the response content
+    # Structure might vary slightly, check litellm docs for details
+    llm_output_content = response.choices[0].message.content
+    usage_dict = _usage_dict(response)
     
-    input_str = json.dumps(input_data, indent=2) if isinstance(input_data, (dict, list)) else str(input_data)
-    
-    messages = [
-        {"role": "system", "content": final_prompt},
-        {"role": "user", "content": f"Contextual Input (available as 'current_input' in prompt templates):\n```json\n{input_str}\n```"}
-    ]
+    output_data = {
+        "status": "success",
+        "response_summary": serialization.summarize(llm_output_content),
+        "full_response": llm_output_content,
+        "details": {**_llm_details(node, llm_kwargs, model_config_data), "usage": usage_dict}
+    }
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f"LLM Node {node.id}: Call successful. Output length: {len(llm_output_content)}, Usage: {usage_dict}")
+    return output_data
+
+def _llm_call_error(model: str, llm_exc: Exception) -> ConnectionError:
+    """Maps a failed completion to the ConnectionError raised by the LLM node."""
+    # Improve error message for common issues
+    if "auth" in str(llm_exc).lower():
+        return ConnectionError(f"Authentication failed for model {model}. Check API key/Base URL.")
+    return ConnectionError(f"Failed to call model {model}: {llm_exc}")
+
+async def execute_llm_node(node: Node, input_data: Any, workflow: Workflow, run_outputs: Dict[str, Any],
+                           render_cache: Optional[Dict[int, Any]] = None) -> Any:
+    """Execute an LLM node"""
+    model_config_data = _find_model_config(node, workflow)
+    if render_cache is None:
+        render_cache = {}
+
+    if node.data.get('batch') is True and isinstance(input_data, list) and input_data:
+        return await _execute_llm_batch(node, input_data, run_outputs, model_config_data, render_cache)
+
+    llm_kwargs = _build_llm_kwargs(node, input_data, run_outputs, model_config_data, render_cache)
+    model = llm_kwargs["model"]
     
-    logger.info(f"LLM Node {node.id}: Calling model '{model}' (Base: {custom_api_base or 'default'}). Temp: {temperature}, MaxTokens: {max_tokens}")
+    logger.info(f"LLM Node {node.id}: Calling model '{model}' (Base: {llm_kwargs['api_base'] or 'default'}). Temp: {llm_kwargs['temperature']}, MaxTokens: {llm_kwargs['max_tokens']}")
     try:
-        # Note: litellm.completion is synchronous by default.
-        # For production, consider using litellm.acompletion for async or running in a thread pool.
-        response = litellm_completion(
-            model=model,
-            messages=messages,
-            api_key=api_key,
-            api_base=custom_api_base if custom_api_base else None, # Pass api_base if provided
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
-        
-        # Extract the response content
-        # Structure might vary slightly, check litellm docs for details
-        llm_output_content = response.choices[0].message.content
-        
-        output_data = {
-            "status": "success",
-            "response_summary": llm_output_content[:100] + ('...' if len(llm_output_content) > 100 else ''),
-            "full_response": llm_output_content,
-            "details": {
-                "model_used": model,
-                "config_source": f"from node data" if not model_config_data else f"from config node '{model_config_data.get('config_name', model_config_id)}'",
-                "api_base": custom_api_base or 'default',
-                "temperature": temperature,
-                "max_tokens": max_tokens,
-                "usage": response.usage.dict() if hasattr(response, 'usage') and hasattr(response.usage, 'dict') else None
-            }
-        }
-        logger.info(f"LLM Node {node.id}: Call successful. Output length: {len(llm_output_content)}, Usage: {response.usage.dict() if hasattr(response, 'usage') and hasattr(response.usage, 'dict') else None}")
-        return output_data
+        response = await _limited_acompletion(**llm_kwargs)
+        return _finalize_llm_output(node, response, llm_kwargs, model_config_data)
 
     except Exception as llm_exc:
         logger.error(f"LLM Node {node.id}: API call failed for model {model}: {llm_exc}", exc_info=True)
-        # Improve error message for common issues
-        if "auth" in str(llm_exc).lower():
-            raise ConnectionError(f"Authentication failed for model {model}. Check API key/Base URL.")
-        raise ConnectionError(f"Failed to call model {model}: {llm_exc}")
+        raise _llm_call_error(model, llm_exc)
 
-def execute_webhook_action_node(node: Node, input_data: Any, run_outputs: Dict[str, Any]) -> Any:
+async def _execute_llm_batch(node: Node, inputs: List[Any], run_outputs: Dict[str, Any],
+                             model_config_data: Optional[Dict[str, Any]],
+                             render_cache: Optional[Dict[int, Any]] = None) -> Dict[str, Any]:
+    """
+    Batch mode of the LLM node: applies the same prompt to every item of a list input.
+    All completions are submitted together and collected afterwards; each item succeeds or fails on its own.
+    """
+    kwargs_per_item = [_build_llm_kwargs(node, item, run_outputs, model_config_data, render_cache) for item in inputs]
+    model = kwargs_per_item[0]["model"]
+    logger.info(f"LLM Node {node.id}: Batch calling model '{model}' for {len(inputs)} inputs")
+    responses = await asyncio.gather(
+        *(_limited_acompletion(**llm_kwargs) for llm_kwargs in kwargs_per_item),
+        return_exceptions=True
+    )
+
+    items = []
+    failed = 0
+    for index, response in enumerate(responses):
+        if isinstance(response, BaseException) and not isinstance(response, Exception):
+            raise response
+        if isinstance(response, Exception):
+            failed += 1
+            logger.error(f"LLM Node {node.id}: Batch item {index} failed for model {model}: {response}")
+            items.append({"status": "error", "error": str(response)})
+            continue
+        content = response.choices[0].message.content
+        items.append({
+            "status": "success",
+            "response_summary": serialization.summarize(content),
+            "full_response": content,
+            "usage": _usage_dict(response)
+        })
+
+    if failed == len(inputs):
+        # Nothing usable came back; fail the node like a single failed call would
+        raise ConnectionError(f"Failed to call model {model} for all {failed} batch inputs: {items[0]['error']}")
+
+    logger.info(f"LLM Node {node.id}: Batch finished, {len(inputs) - failed}/{len(inputs)} items succeeded")
+    return {
+        "status": "success" if not failed else "partial",
+        "response_summary": f"{len(inputs) - failed}/{len(inputs)} batch items succeeded",
+        "responses": items,
+        "details": {**_llm_details(node, kwargs_per_item[0], model_config_data), "batch_size": len(inputs), "failed_items": failed}
+    }
+
+async def execute_webhook_action_node(node: Node, input_data: Any, run_outputs: Dict[str, Any]) -> Any:
     """Execute a webhook action node"""
     node_data = node.data
     url = node_data.get('url')
     method = node_data.get('method', 'POST').upper()
     headers_str = node_data.get('headers', '{}')
     body_template = node_data.get('body', None)
+    max_response_bytes = int(node_data.get('max_response_bytes', DEFAULT_MAX_RESPONSE_BYTES))
 
     if not url:
         logger.error(f"Webhook Action node {node.id}: URL is missing.")
@@ -195,7 +639,7 @@ def execute_webhook_action_node(node: Node, input_data: Any, run_outputs: Dict[s
     try:
         # Parse headers from JSON string
         try:
-            headers = json.loads(headers_str) if isinstance(headers_str, str) else headers_str
+            headers = _parse_json_field(headers_str) if isinstance(headers_str, str) else headers_str
             if not isinstance(headers, dict):
                 headers = {}
                 logger.warning(f"Webhook Action {node.id}: Invalid headers format, using empty.")
@@ -205,20 +649,24 @@ def execute_webhook_action_node(node: Node, input_data: Any, run_outputs: Dict[s
 
         # Prepare payload: use body template if provided, otherwise send raw input
         payload = None
-        if body_template and isinstance(body_template, str):
+        if body_template and isinstance(body_template, str) and "{{" not in body_template:
+            # Static body: nothing to substitute, so the parsed JSON is cached per distinct body (it is only read)
             try:
-                templating_context = {"input_data": input_data} 
-                templating_context.update(run_outputs)
-                
-                body_template_intermediate = body_template
+                payload = _parse_json_field(body_template)
+            except json.JSONDecodeError:
+                logger.warning(f"Webhook Action {node.id}: Body is not valid JSON. Sending raw body string.")
+                payload = body_template
+        elif body_template and isinstance(body_template, str):
+            try:
+                # {{input_data}} always refers to this node's direct input (even if a node is named 'input_data')
+                # and is inserted as compact JSON, so it is pre-serialized here and substituted in the same pass
+                templating_context: Mapping[str, Any] = run_outputs
                 if "{{input_data}}" in body_template:
-                    # Ensure {{input_data}} specifically uses the direct input_data, JSON stringified
-                    # The general _render_prompt_template might stringify it differently or another value if 'input_data' key exists in run_outputs
-                    body_template_intermediate = body_template.replace("{{input_data}}", json.dumps(input_data))
+                    templating_context = ChainMap({"input_data": serialization.dumps(input_data)}, run_outputs)
                 
-                payload_str = _render_prompt_template(body_template_intermediate, templating_context)
+                payload_str = _render_prompt_template(body_template, templating_context)
                 
-                payload = json.loads(payload_str)
+                payload = serialization.loads(payload_str)
             except json.JSONDecodeError:
                 logger.warning(f"Webhook Action {node.id}: Failed to parse body template as JSON after substitution. Sending raw template string: {payload_str}")
                 payload = payload_str 
@@ -228,42 +676,53 @@ def execute_webhook_action_node(node: Node, input_data: Any, run_outputs: Dict[s
         else:
             payload = input_data # Default to sending the input data directly
         
-        response = requests.request(
+        send_json_body = method in ['POST', 'PUT', 'PATCH'] and payload is not None
+        request = _CLIENT.build_request(
             method=method,
             url=url,
-            json=payload if method in ['POST', 'PUT', 'PATCH'] else None, # Send as JSON body for these methods
+            # Send as JSON body for these methods, serialized straight to bytes
+            content=serialization.dumps_bytes(payload) if send_json_body else None,
             params=payload if method == 'GET' else None, # Send as query params for GET
-            headers=headers, 
+            headers=_with_json_content_type(headers) if send_json_body else headers,
             timeout=15 # Timeout of 15 seconds
         )
-        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+        # Stream the response so an oversized body is cut off at max_response_bytes instead of buffered whole
+        async with _api_semaphore(request.url):
+            response = await _CLIENT.send(request, stream=True)
+            if response.is_error:
+                await response.aclose()
+            response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+            response_body, response_truncated = await _read_capped_body(response, max_response_bytes)
+        if response_truncated:
+            logger.warning(f"Webhook Action {node.id}: Response body exceeded {max_response_bytes} bytes and was truncated")
         
         # Try to parse JSON response, fall back to text
         try:
-            response_data = response.json()
-        except requests.exceptions.JSONDecodeError:
-            response_data = response.text
+            response_data = _parse_json_body(response_body, response.charset_encoding)
+        except ValueError:
+            response_data = response_body.decode(response.charset_encoding or 'utf-8', errors='replace')
 
         output_data = {
             "status": "success",
             "status_code": response.status_code,
-            "response_body_summary": str(response_data)[:100] + ('...' if len(str(response_data)) > 100 else ''),
+            "response_body_summary": serialization.summarize(response_data),
             "full_response_body": response_data,
             "request_details": {
                 "url": url,
                 "method": method,
-                "payload_type": "Raw Input Data" if not body_template else "Processed Body Template (JSON)"
+                "payload_type": "Raw Input Data" if not body_template else "Processed Body Template (JSON)",
+                "response_truncated": response_truncated
             }
         }
         logger.info(f"Webhook Action {node.id}: Request successful (Status: {response.status_code})")
         return output_data
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Webhook Action {node.id}: Request failed: {e}")
         # Propagate the error to stop workflow execution on this path
         raise ConnectionError(f"Failed to send webhook to {url}: {e}") 
 
-def execute_api_consumer_node(node: Node, input_data: Any, run_outputs: Dict[str, Any]) -> Any:
+async def execute_api_consumer_node(node: Node, input_data: Any, run_outputs: Dict[str, Any]) -> Any:
     """Execute an API consumer node with support for various authentication methods"""
     node_data = node.data
     url = node_data.get('url')
@@ -274,36 +733,36 @@ def execute_api_consumer_node(node: Node, input_data: Any, run_outputs: Dict[str
     timeout = int(node_data.get('timeout', 30000)) / 1000  # Convert from ms to seconds
     retry_policy = node_data.get('retry_policy', 'none')
     response_handling = node_data.get('response_handling', 'json')
+    max_response_bytes = int(node_data.get('max_response_bytes', DEFAULT_MAX_RESPONSE_BYTES))
     
     # Parse the headers if it's a string
     if isinstance(headers, str):
         try:
-            headers = json.loads(headers)
+            headers = _parse_json_field(headers)
         except json.JSONDecodeError:
             headers = {}
             logger.warning(f"API Consumer node {node.id}: Invalid headers JSON, using empty headers")
+    # Auth handling below adds headers; copy so neither the parse cache nor the stored node data is modified
+    headers = dict(headers) if isinstance(headers, dict) else {}
     
-    # Process query parameters
+    # Process query parameters (the encoded form of the node's JSON string is cached)
     query_params = node_data.get('query_params', '{}')
-    if isinstance(query_params, str):
-        try:
-            query_params = json.loads(query_params)
-        except json.JSONDecodeError:
-            query_params = {}
-            logger.warning(f"API Consumer node {node.id}: Invalid query params JSON, using empty params")
+    try:
+        if isinstance(query_params, str):
+            url_params = _encoded_query_params(query_params)
+        else:
+            url_params = urlencode(query_params) if query_params else ''
+    except json.JSONDecodeError:
+        url_params = ''
+        logger.warning(f"API Consumer node {node.id}: Invalid query params JSON, using empty params")
     
     # Build the full URL with query parameters
-    if query_params:
-        url_params = urlencode(query_params)
-        if '?' in url:
-            url = f"{url}&{url_params}"
-        else:
-            url = f"{url}?{url_params}"
+    url = _append_query(url, url_params)
     
     # Process the body if it's a string and meant to be JSON
     if isinstance(body, str) and body.strip():
         try:
-            body = json.loads(body)
+            body = _parse_json_field(body)
         except json.JSONDecodeError:
             logger.warning(f"API Consumer node {node.id}: Invalid body JSON, sending as raw string")
             # Keep as string if not valid JSON
@@ -313,7 +772,6 @@ def execute_api_consumer_node(node: Node, input_data: Any, run_outputs: Dict[str
         body = input_data
     
     # Apply authentication based on the type
-    auth = None
     if auth_type == 'api_key':
         api_key_name = node_data.get('api_key_name', 'X-API-Key')
         api_key_value = node_data.get('api_key_value', '')
@@ -323,11 +781,7 @@ def execute_api_consumer_node(node: Node, input_data: Any, run_outputs: Dict[str
             headers[api_key_name] = api_key_value
         elif api_key_location == 'query':
             # Add to URL if not already added with other query params
-            param = urlencode({api_key_name: api_key_value})
-            if '?' in url:
-                url = f"{url}&{param}"
-            else:
-                url = f"{url}?{param}"
+            url = _append_query(url, urlencode({api_key_name: api_key_value}))
     
     elif auth_type == 'bearer':
         bearer_token = node_data.get('bearer_token', '')
@@ -336,11 +790,10 @@ def execute_api_consumer_node(node: Node, input_data: Any, run_outputs: Dict[str
     elif auth_type == 'basic':
         username = node_data.get('basic_username', '')
         password = node_data.get('basic_password', '')
-        auth = requests.auth.HTTPBasicAuth(username, password)
+        headers['Authorization'] = _basic_auth_header(username, password)
     
     elif auth_type == 'oauth2':
-        # For OAuth2, we would need to get a token first, but this is a simplified version
-        # In a real implementation, you would handle token acquisition, refresh, etc.
+        # Client-credentials tokens are cached until shortly before they expire (see _get_oauth2_token)
         client_id = node_data.get('oauth_client_id', '')
         client_secret = node_data.get('oauth_client_secret', '')
         token_url = node_data.get('oauth_token_url', '')
@@ -349,18 +802,7 @@ def execute_api_consumer_node(node: Node, input_data: Any, run_outputs: Dict[str
         # Simple implementation - get token and use it
         if token_url:
             try:
-                token_response = requests.post(
-                    token_url,
-                    data={
-                        'grant_type': 'client_credentials',
-                        'client_id': client_id,
-                        'client_secret': client_secret,
-                        'scope': scope
-                    },
-                    timeout=timeout
-                )
-                token_data = token_response.json()
-                access_token = token_data.get('access_token')
+                access_token = await _get_oauth2_token(token_url, client_id, client_secret, scope, timeout)
                 if access_token:
                     headers['Authorization'] = f"Bearer {access_token}"
                 else:
@@ -377,7 +819,10 @@ def execute_api_consumer_node(node: Node, input_data: Any, run_outputs: Dict[str
     
     # Execute the request with retries
     attempt = 0
+    oauth_token_refreshed = False
     response = None
+    response_body = None
+    response_truncated = False
     last_error = None
     
     while attempt <= max_retries:
@@ -389,34 +834,64 @@ def execute_api_consumer_node(node: Node, input_data: Any, run_outputs: Dict[str
                 'method': method,
                 'url': url,
                 'headers': headers,
-                'timeout': timeout,
-                'auth': auth
+                'timeout': timeout
             }
             
             # Add body for methods that support it
             if method in ['POST', 'PUT', 'PATCH']:
                 if isinstance(body, (dict, list)):
-                    request_kwargs['json'] = body
+                    request_kwargs['content'] = serialization.dumps_bytes(body)
+                    request_kwargs['headers'] = _with_json_content_type(headers)
+                elif isinstance(body, (str, bytes)):
+                    request_kwargs['content'] = body
                 else:
                     request_kwargs['data'] = body
             
-            response = requests.request(**request_kwargs)
-            response.raise_for_status()
+            # Stream the response so oversized bodies are cut off at max_response_bytes instead of buffered whole
+            request = _CLIENT.build_request(**request_kwargs)
+            # Retry delays are spent outside the host's concurrency slot
+            async with _api_semaphore(request.url):
+                response = await _CLIENT.send(request, stream=True)
+                try:
+                    response.raise_for_status()
+                finally:
+                    # Always drain (capped) and release the connection; the last response is still reported on HTTP errors
+                    response_body, response_truncated = await _read_capped_body(
+                        response, max_response_bytes, as_base64=(response_handling == 'binary')
+                    )
             break  # Success, exit retry loop
             
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             last_error = e
             logger.warning(f"API Consumer {node.id}: Request failed (attempt {attempt+1}): {e}")
             
-            if attempt >= max_retries:
+            # A cached OAuth2 token can be revoked before it expires: fetch a new one and resend once
+            if (auth_type == 'oauth2' and token_url and not oauth_token_refreshed
+                    and isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 401):
+                oauth_token_refreshed = True
+                rejected_token = headers.get('Authorization', '')[len('Bearer '):]
+                _invalidate_oauth2_token(token_url, client_id, scope, rejected_token)
+                try:
+                    access_token = await _get_oauth2_token(token_url, client_id, client_secret, scope, timeout)
+                except Exception as token_error:
+                    logger.error(f"API Consumer node {node.id}: OAuth2 token refresh failed: {token_error}")
+                    access_token = None
+                if access_token and access_token != rejected_token:
+                    headers['Authorization'] = f"Bearer {access_token}"
+                    continue
+            
+            # Transport errors and throttling/server errors may succeed on retry; other client errors won't
+            retryable = (not isinstance(e, httpx.HTTPStatusError)
+                         or e.response.status_code in _RETRYABLE_STATUS_CODES)
+            if attempt >= max_retries or not retryable:
                 break
             
-            # Calculate delay for exponential backoff
+            # Exponential or simple fixed delay, plus up to 25% jitter so concurrent retries don't line up
             if retry_policy == 'exponential':
-                delay = (2 ** attempt) * 0.5  # 0.5, 1, 2, 4, 8 seconds
-                time.sleep(delay)
+                delay = _EXPONENTIAL_BACKOFF_DELAYS[min(attempt, len(_EXPONENTIAL_BACKOFF_DELAYS) - 1)]
             else:
-                time.sleep(1)  # Simple fixed delay
+                delay = 1
+            await asyncio.sleep(delay + random.uniform(0, 0.25 * delay))
             
             attempt += 1
     
@@ -425,34 +900,37 @@ def execute_api_consumer_node(node: Node, input_data: Any, run_outputs: Dict[str
         logger.error(f"API Consumer {node.id}: All requests failed after {max_retries+1} attempts")
         raise ConnectionError(f"Failed to connect to API: {last_error}")
     
+    if response_truncated:
+        logger.warning(f"API Consumer {node.id}: Response body exceeded {max_response_bytes} bytes and was truncated")
+    
     # Process the response based on the specified handling method
     try:
-        if response_handling == 'json':
-            try:
-                response_data = response.json()
-            except json.JSONDecodeError:
-                logger.warning(f"API Consumer {node.id}: Could not parse response as JSON, falling back to text")
-                response_data = response.text
-        elif response_handling == 'text':
-            response_data = response.text
-        elif response_handling == 'binary':
-            # Encode binary data as base64 string
-            response_data = {'data': base64.b64encode(response.content).decode('utf-8'), 'encoding': 'base64'}
+        if response_handling == 'binary':
+            # Body was already base64-encoded while reading
+            response_data = {'data': response_body, 'encoding': 'base64'}
         else:
-            # Default to treating as text
-            response_data = response.text
+            response_data = None
+            if response_handling == 'json':
+                try:
+                    response_data = _parse_json_body(response_body, response.charset_encoding)
+                except ValueError:
+                    logger.warning(f"API Consumer {node.id}: Could not parse response as JSON, falling back to text")
+            if response_data is None:
+                # 'text', unknown handling modes and non-JSON bodies are returned as text
+                response_data = response_body.decode(response.charset_encoding or 'utf-8', errors='replace')
         
         output_data = {
             "status_code": response.status_code,
-            "response_summary": str(response_data)[:100] + ('...' if len(str(response_data)) > 100 else ''),
+            "response_summary": serialization.summarize(response_data),
             "full_response": response_data,
             "details": {
-                "url_called": response.url,
+                "url_called": str(response.url),
                 "method": method,
                 "auth_used": auth_type,
                 "retry_policy": f"{retry_policy} ({max_retries} attempts)",
                 "attempts_made": attempt + 1,
                 "response_handling": response_handling,
+                "response_truncated": response_truncated,
                 "headers_received": dict(response.headers)
             }
         }
@@ -464,6 +942,20 @@ def execute_api_consumer_node(node: Node, input_data: Any, run_outputs: Dict[str
         logger.error(f"API Consumer {node.id}: Error processing response: {e}")
         raise 
 
+def _find_model_config_in_node_dicts(workflow_nodes: List[Dict[str, Any]], model_config_id: str) -> Optional[Dict[str, Any]]:
+    """Data of the first model_config node with the given id in a frontend node list, stopping at the match."""
+    for node_dict in workflow_nodes:
+        if node_dict.get('id') == model_config_id and node_dict.get('type') == 'model_config':
+            return node_dict.get('data', {})
+    return None
+
+def _template_data_of_node_dict(node_dict: Dict[str, Any]) -> Any:
+    """What {{node_id}} stands for when testing a prompt: the node data, or a webhook trigger's last payload."""
+    data = node_dict.get('data', {})
+    if node_dict.get('type') == 'webhook_trigger' and 'last_payload' in data:
+        return data['last_payload']
+    return data
+
 async def test_llm_node(node_data: Dict[str, Any], workflow_nodes: List[Dict[str, Any]] = None) -> Dict[str, Any]:
     """Test an LLM node configuration by sending a simple message."""
     logger.info(f"Testing LLM node configuration: {node_data.get('node_name', 'Unnamed LLM Node')}")
@@ -474,47 +966,35 @@ async def test_llm_node(node_data: Dict[str, Any], workflow_nodes: List[Dict[str
     
     if model_config_id and workflow_nodes:
         # Find the referenced model config node
-        model_config_nodes = [n for n in workflow_nodes if n['id'] == model_config_id and n['type'] == 'model_config']
-        if model_config_nodes:
-            model_config = model_config_nodes[0].get('data', {})
+        model_config = _find_model_config_in_node_dicts(workflow_nodes, model_config_id)
+        if model_config is not None:
             logger.info(f"LLM Node Test: Using model config '{model_config.get('config_name', 'Unnamed')}'")
     
     # Use the actual user-defined prompt
     test_prompt = node_data.get('prompt', 'Say hello')
     
-    # Create a node_data_map for template replacements
-    node_data_map = {}
-    if workflow_nodes:
-        for node in workflow_nodes:
-            node_id = node.get('id')
-            node_data_map[node_id] = node.get('data', {})
-            # For webhook_trigger nodes, we're particularly interested in the last_payload
-            if node.get('type') == 'webhook_trigger' and 'last_payload' in node.get('data', {}):
-                node_data_map[node_id] = node['data']['last_payload']
-    
-    # Replace template variables with actual node data
-    import re
-    
-    # Find all template variables like {{dndnode_X}}
-    template_vars = re.findall(r"{{([\w\d_-]+)}}", test_prompt)
-    
-    # Replace each template variable with actual data if available
-    for var in template_vars:
-        if var in node_data_map:
-            replacement = json.dumps(node_data_map[var], indent=2)
-            logger.info(f"LLM Node Test: Replacing template variable {{{{{var}}}}} with actual node data")
-            test_prompt = test_prompt.replace(f"{{{{{var}}}}}", replacement)
-        else:
-            logger.warning(f"LLM Node Test: Template variable {{{{{var}}}}} not found in workflow data")
-            # Create a fallback sample payload
-            sample_payload = {
-                "event": "test.event",
-                "data": {
-                    "message": "This is a test message for missing node data",
-                    "node_id": var
+    # Replace template variables like {{dndnode_X}} with actual node data.
+    # Each referenced variable is serialized once, then the compiled template is rendered in one pass.
+    if "{{" in test_prompt:
+        # id -> node lookup, only needed when the prompt references other nodes (later duplicates win)
+        nodes_by_id = {node.get('id'): node for node in workflow_nodes or ()}
+        test_context: Dict[str, str] = {}
+        for var in _compile_format_template(test_prompt)[1]:
+            if var in nodes_by_id:
+                logger.info(f"LLM Node Test: Replacing template variable {{{{{var}}}}} with actual node data")
+                test_context[var] = serialization.dumps(_template_data_of_node_dict(nodes_by_id[var]), indent=True)
+            else:
+                logger.warning(f"LLM Node Test: Template variable {{{{{var}}}}} not found in workflow data")
+                # Create a fallback sample payload
+                sample_payload = {
+                    "event": "test.event",
+                    "data": {
+                        "message": "This is a test message for missing node data",
+                        "node_id": var
+                    }
                 }
-            }
-            test_prompt = test_prompt.replace(f"{{{{{var}}}}}", json.dumps(sample_payload, indent=2))
+                test_context[var] = serialization.dumps(sample_payload, indent=True)
+        test_prompt = _render_prompt_template(test_prompt, test_context)
     
     # Use model config if available, otherwise use node's own configuration
     if model_config:
@@ -542,11 +1022,11 @@ async def test_llm_node(node_data: Dict[str, Any], workflow_nodes: List[Dict[str
         # Basic message structure
         messages = [
             {"role": "system", "content": test_prompt}, 
-            {"role": "user", "content": f"Input Data:\n```json\n{json.dumps(input_data, indent=2)}\n```"}
+            {"role": "user", "content": f"Input Data:\n```json\n{serialization.dumps(input_data, indent=True)}\n```"}
         ]
         
         logger.info(f"LLM Node Test: Calling model '{model}'...")
-        response = litellm_completion(
+        response = await litellm_acompletion(
             model=model,
             messages=messages,
             api_key=api_key,
@@ -560,7 +1040,7 @@ async def test_llm_node(node_data: Dict[str, Any], workflow_nodes: List[Dict[str
             "status": "success",
             "response": output_content,
             "model_used": model,
-            "usage": response.usage.dict() if hasattr(response, 'usage') and hasattr(response.usage, 'dict') else None
+            "usage": _usage_dict(response)
         }
         
     except Exception as e:
@@ -575,7 +1055,15 @@ async def test_llm_node(node_data: Dict[str, Any], workflow_nodes: List[Dict[str
             "model": model
         } 
 
-def execute_code_node(node_data: Dict[str, Any], input_data: Any) -> Any:
+@lru_cache(maxsize=512)
+def _compile_user_code(code: str, node_id: str):
+    """
+    Compiles code node source once; repeated runs of the same code reuse the code object.
+    The node id in the filename shows up in tracebacks. Syntax errors are raised, not cached.
+    """
+    return compile(code, f"<code_node:{node_id}>", "exec")
+
+def execute_code_node(node_data: Dict[str, Any], input_data: Any, node_id: str = '') -> Any:
     """Execute a code node with the given input data."""
     code = node_data.get('code', '')
     if not code:
@@ -589,8 +1077,9 @@ def execute_code_node(node_data: Dict[str, Any], input_data: Any) -> Any:
             'result': None
         }
         
-        # Execute the code in the isolated namespace
-        exec(code, {"__builtins__": __builtins__}, local_vars)
+        # Execute the (cached) compiled code in the isolated namespace
+        code_obj = _compile_user_code(code, node_id)
+        exec(code_obj, {"__builtins__": __builtins__}, local_vars)
         
         # Get the result from the namespace
         output_data = local_vars.get('result')
@@ -604,7 +1093,7 @@ def execute_code_node(node_data: Dict[str, Any], input_data: Any) -> Any:
             "status": "success",
             "output": output_data,
             "details": {
-                "code_executed": code[:100] + ('...' if len(code) > 100 else ''),
+                "code_executed": serialization.summarize(code),
                 "input_type": type(input_data).__name__,
                 "output_type": type(output_data).__name__
             }
@@ -614,16 +1103,395 @@ def execute_code_node(node_data: Dict[str, Any], input_data: Any) -> Any:
         logger.error(f"Code node execution error: {e}", exc_info=True)
         raise ValueError(f"Code execution failed: {str(e)}") 
 
+# Code nodes run user Python in-process. They run on their own threads, so a slow or CPU-heavy script
+# doesn't block the event loop (and with it every other run and SSE stream) or the default thread pool.
+CODE_NODE_THREADS = int(os.environ.get('CODE_NODE_THREADS', 4))
+_CODE_NODE_EXECUTOR: Optional[ThreadPoolExecutor] = None
+
+def _code_node_executor() -> ThreadPoolExecutor:
+    """Returns the code node thread pool, creating it on first use (and again after a shutdown)."""
+    global _CODE_NODE_EXECUTOR
+    if _CODE_NODE_EXECUTOR is None:
+        _CODE_NODE_EXECUTOR = ThreadPoolExecutor(max_workers=CODE_NODE_THREADS, thread_name_prefix="code-node")
+    return _CODE_NODE_EXECUTOR
+
+async def _run_code_node(node: Node, input_data: Any, workflow: Workflow, run_outputs: Dict[str, Any],
+                         render_cache: Optional[Dict[int, Any]] = None) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_code_node_executor(), execute_code_node, node.data, input_data, node.id)
+
+async def _run_api_consumer_node(node: Node, input_data: Any, workflow: Workflow, run_outputs: Dict[str, Any],
+                                 render_cache: Optional[Dict[int, Any]] = None) -> Any:
+    return await execute_api_consumer_node(node, input_data, run_outputs)
+
+async def _passthrough_node(node: Node, input_data: Any, workflow: Workflow, run_outputs: Dict[str, Any],
+                            render_cache: Optional[Dict[int, Any]] = None) -> Any:
+    return input_data
+
+# Node type -> handler used by execute_node. Handlers share the signature
+# (node, input_data, workflow, run_outputs, render_cache); wrappers adapt the executors that need less.
+_NODE_HANDLERS: Dict[str, Callable[..., Awaitable[Any]]] = {
+    'llm': execute_llm_node,
+    'code': _run_code_node,
+    'api_consumer': _run_api_consumer_node,
+    'model_config': _passthrough_node, # As this node is not executed, it should pass the input through
+}
+
+# Long-lived `python -c` program run in the executor (one per warm worker session). It reads requests
+#   b"<script bytes> <input bytes> <timeout seconds>\n" + script + input
+# from STDIN and answers each on STDOUT with
+#   b"<timed out 0/1> <exit code> <stdout bytes> <stderr bytes>\n" + stdout + stderr
+# Every script runs in a child forked from the already started interpreter, so there is no Python startup
+# or stdlib import cost per test, while each test still gets a fresh process: nothing leaks between tests
+# and a runaway script is simply killed. The script sees the input as sys.stdin and runs as __main__.
+_EXECUTOR_WORKER = r"""
+import importlib, io, json, os, select, signal, site, sys, time, traceback
+
+requests, responses = sys.stdin.buffer, sys.stdout.buffer
+user_site = site.getusersitepackages()
+
+def read_exact(size):
+    data = requests.read(size)
+    if len(data) != size:
+        raise EOFError('request cut short')
+    return data
+
+def run(script, payload, timeout):
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            os.close(out_r); os.close(err_r)
+            os.dup2(os.open(os.devnull, os.O_RDONLY), 0)
+            os.dup2(out_w, 1); os.dup2(err_w, 2)
+            sys.stdin = io.TextIOWrapper(io.BytesIO(payload), encoding='utf-8')
+            # Packages pip-installed after this worker started must still be importable
+            if os.path.isdir(user_site) and user_site not in sys.path:
+                site.addsitedir(user_site)
+            importlib.invalidate_caches()
+            exec(compile(script.decode('utf-8'), '<code_node>', 'exec'), {'__name__': '__main__', '__builtins__': __builtins__})
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            try:
+                sys.stdout.flush(); sys.stderr.flush()
+            finally:
+                os._exit(code)
+    os.close(out_w); os.close(err_w)
+    chunks = {out_r: [], err_r: []}
+    open_fds = [out_r, err_r]
+    deadline = time.monotonic() + timeout
+    timed_out = False
+    while open_fds:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            timed_out = True
+            os.kill(pid, signal.SIGKILL)
+            break
+        for fd in select.select(open_fds, [], [], remaining)[0]:
+            chunk = os.read(fd, 65536)
+            if chunk:
+                chunks[fd].append(chunk)
+            else:
+                open_fds.remove(fd)
+    os.close(out_r); os.close(err_r)
+    status = os.waitpid(pid, 0)[1]
+    returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    return timed_out, returncode, b''.join(chunks[out_r]), b''.join(chunks[err_r])
+
+while True:
+    header = requests.readline()
+    if not header:
+        break
+    script_size, input_size, timeout = header.split()
+    script, payload = read_exact(int(script_size)), read_exact(int(input_size))
+    timed_out, returncode, out, err = run(script, payload, float(timeout))
+    responses.write(b'%d %d %d %d\n' % (timed_out, returncode, len(out), len(err)) + out + err)
+    responses.flush()
+"""
+
+# The code wrapper writes its JSON result after this record separator, so output the user's code
+# prints to STDOUT can't be mistaken for the result
+_RESULT_SEPARATOR = b"\x1e"
+
+# Idle warm worker sessions (`docker exec -i` processes running _EXECUTOR_WORKER), reused by later tests.
+# Concurrent tests each get their own session; at most this many are kept open between tests.
+MAX_IDLE_EXECUTOR_WORKERS = int(os.environ.get('MAX_IDLE_EXECUTOR_WORKERS', 2))
+_IDLE_EXECUTOR_WORKERS: List[asyncio.subprocess.Process] = []
+# Extra seconds allowed on top of the worker-enforced timeout for docker and transfer overhead
+_EXECUTOR_WORKER_TIMEOUT_MARGIN = 10
+
+# Set once the executor container is known to be running
+_code_executor_ready = False
+# Full ID of the running executor container: `docker exec <id>` skips dockerd's name lookup.
+# Cleared (with _code_executor_ready) when the container turns out to be gone, so it is resolved again.
+_code_executor_id: Optional[str] = None
+
+def _code_executor_target() -> str:
+    """Container reference for docker exec: the cached ID when known, else the container name."""
+    return _code_executor_id or CODE_EXECUTOR_CONTAINER_NAME
+
+def _forget_code_executor() -> None:
+    """Drops the cached container state after the container went away (e.g. it was removed and recreated)."""
+    global _code_executor_ready, _code_executor_id
+    _code_executor_ready = False
+    _code_executor_id = None
+
+
+# Hashes of requirements already installed in the executor, least recently used first
+_INSTALLED_REQUIREMENTS: "OrderedDict[str, None]" = OrderedDict()
+_INSTALLED_REQUIREMENTS_MAX = 128
+_REQUIREMENTS_LOCKS: Dict[str, asyncio.Lock] = {}
+# Marker files (one per requirements hash) on the packages volume, written after a successful install
+_REQUIREMENTS_MARKER_DIR = f"{CODE_EXECUTOR_PACKAGES_DIR}/.installed"
+
+def ensure_code_executor_running() -> bool:
+    """
+    Make sure the long-running code executor container is up, starting or creating it if needed,
+    so code tests only pay for a `docker exec` instead of a container start.
+    Returns False if the container could not be started (e.g. Docker is unavailable).
+    """
+    global _code_executor_ready, _code_executor_id
+    try:
+        inspect_process = subprocess.run(
+            ["docker", "inspect", "-f", "{{.State.Running}} {{.Id}}", CODE_EXECUTOR_CONTAINER_NAME],
+            capture_output=True, text=True, timeout=10
+        )
+        running, _, container_id = inspect_process.stdout.strip().partition(" ")
+        if inspect_process.returncode == 0 and running == "true":
+            _code_executor_id = container_id or None
+            _code_executor_ready = True
+            return True
+
+        if inspect_process.returncode == 0:
+            # Container exists but is stopped
+            start_command = ["docker", "start", CODE_EXECUTOR_CONTAINER_NAME]
+        else:
+            start_command = [
+                "docker", "run", "-d",
+                "--name", CODE_EXECUTOR_CONTAINER_NAME,
+                "--restart=always",
+                f"--cpus={CODE_EXECUTOR_CPUS}",
+                f"--memory={CODE_EXECUTOR_MEMORY}",
+                f"--pids-limit={CODE_EXECUTOR_PIDS_LIMIT}",
+                # Node scripts are compiled in memory by the executor worker (_EXECUTOR_WORKER); imports don't write .pyc files either
+                "-e", "PYTHONDONTWRITEBYTECODE=1",
+                "-v", f"{CODE_EXECUTOR_PACKAGES_VOLUME}:{CODE_EXECUTOR_PACKAGES_DIR}",
+                CODE_EXECUTOR_IMAGE, "tail", "-f", "/dev/null"
+            ]
+        logger.info(f"Starting code executor container {CODE_EXECUTOR_CONTAINER_NAME}")
+        start_process = subprocess.run(start_command, capture_output=True, text=True, timeout=120)
+        if start_process.returncode != 0:
+            logger.warning(f"Could not start code executor container: {start_process.stderr.strip()}")
+            return False
+    except (FileNotFoundError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"Could not start code executor container: {e}")
+        return False
+
+    # `docker run -d` prints the new container's ID; a restarted container keeps the ID inspect reported
+    _code_executor_id = (start_process.stdout.strip() if start_command[1] == "run" else container_id) or None
+    _code_executor_ready = True
+    return True
+
+async def _run_docker_command(command: List[str], input_text: Union[str, bytes, None] = None,
+                              timeout: float = 60) -> subprocess.CompletedProcess:
+    """
+    Runs a docker CLI command without blocking the event loop and returns it like subprocess.run would.
+    `input_text` (str or already-encoded bytes) is written to STDIN. stdout and stderr are returned as raw
+    bytes; use _decode_output to turn (a prefix of) them into text for logs and error details.
+    The process is killed when it runs longer than `timeout` and subprocess.TimeoutExpired is raised.
+    """
+    if isinstance(input_text, str):
+        input_text = input_text.encode("utf-8")
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.PIPE if input_text is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(
+            process.communicate(input_text),
+            timeout=timeout
+        )
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise subprocess.TimeoutExpired(command[:4], timeout)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+def _decode_output(data: Union[bytes, memoryview], limit: Optional[int] = None) -> str:
+    """
+    Decodes process output for logs and error details, only the first `limit` bytes if given.
+    The prefix is decoded through a memoryview, so large output isn't copied just to be previewed.
+    """
+    if limit is not None and len(data) > limit:
+        return str(memoryview(data)[:limit], "utf-8", "replace") + "..."
+    return str(data, "utf-8", "replace")
+
+async def _install_requirements(requirements: str) -> Optional[Dict[str, Any]]:
+    """
+    pip-installs the requirements in the executor container unless the same requirements were installed before.
+    Installs are recorded in memory and as marker files on the packages volume, so a backend restart
+    doesn't reinstall either. Returns an error result dict if the installation failed, otherwise None.
+    """
+    requirements_hash = hashlib.blake2b(requirements.strip().encode("utf-8"), digest_size=16).hexdigest()
+    if requirements_hash in _INSTALLED_REQUIREMENTS:
+        _INSTALLED_REQUIREMENTS.move_to_end(requirements_hash)
+        logger.info(f"Requirements already installed in {CODE_EXECUTOR_CONTAINER_NAME}, skipping pip install")
+        return None
+
+    # Concurrent tests with the same requirements wait for one install instead of racing pip
+    try:
+        async with _REQUIREMENTS_LOCKS.setdefault(requirements_hash, asyncio.Lock()):
+            if requirements_hash in _INSTALLED_REQUIREMENTS:
+                return None
+
+            # One exec checks the marker and, only if it is missing, installs and writes it.
+            # Requirements are streamed over STDIN rather than copied into the container as a file.
+            marker = f"{_REQUIREMENTS_MARKER_DIR}/{requirements_hash}"
+            install_command = [
+                "docker", "exec", "-i", _code_executor_target(),
+                "sh", "-c",
+                # Install to user site-packages (a persistent volume); no pip cache to keep the volume small
+                f"test -f {marker} || "
+                f"(pip install --user --no-cache-dir -r /dev/stdin && mkdir -p {_REQUIREMENTS_MARKER_DIR} && touch {marker})"
+            ]
+            logger.info(f"Installing requirements in {CODE_EXECUTOR_CONTAINER_NAME}")
+            pip_process = await _run_docker_command(install_command, input_text=requirements, timeout=120) # Increased timeout for pip
+            if pip_process.returncode != 0:
+                if b"No such container" in pip_process.stderr:
+                    _forget_code_executor()
+                pip_stdout, pip_stderr = _decode_output(pip_process.stdout, 1000), _decode_output(pip_process.stderr)
+                logger.error("Pip install failed. STDOUT: %s STDERR: %s", pip_stdout, pip_stderr)
+                return {"status": "error", "error": "Failed to install requirements", "details": pip_stderr or pip_stdout}
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(f"Requirements ready. STDOUT: {_decode_output(pip_process.stdout, 1000)}")
+
+            _INSTALLED_REQUIREMENTS[requirements_hash] = None
+            if len(_INSTALLED_REQUIREMENTS) > _INSTALLED_REQUIREMENTS_MAX:
+                _INSTALLED_REQUIREMENTS.popitem(last=False)
+    finally:
+        # Also after a failed install, so each distinct requirements text doesn't leave a lock behind
+        _REQUIREMENTS_LOCKS.pop(requirements_hash, None)
+    return None
+
+async def _start_executor_worker() -> asyncio.subprocess.Process:
+    """Opens a new warm worker session in the executor container."""
+    return await asyncio.create_subprocess_exec(
+        "docker", "exec", "-i", # -i is crucial for passing STDIN
+        _code_executor_target(),
+        "python", "-u", "-c", _EXECUTOR_WORKER,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+
+def _stop_executor_worker(worker: asyncio.subprocess.Process) -> None:
+    """Ends a worker session; closing its STDIN makes the worker loop exit inside the container."""
+    if worker.returncode is None:
+        worker.stdin.close()
+        worker.kill()
+
+async def _run_in_executor_worker(script: str, input_json: bytes, timeout: float) -> subprocess.CompletedProcess:
+    """
+    Runs `script` with `input_json` as its STDIN in a warm executor worker and returns the result like
+    _run_docker_command does (raw stdout/stderr bytes). Raises subprocess.TimeoutExpired after `timeout` seconds.
+    """
+    script_bytes = script.encode("utf-8")
+    request = b"".join((b"%d %d %.3f\n" % (len(script_bytes), len(input_json), timeout), script_bytes, input_json))
+    while True:
+        reused = False
+        worker = None
+        while _IDLE_EXECUTOR_WORKERS and worker is None:
+            candidate = _IDLE_EXECUTOR_WORKERS.pop()
+            if candidate.returncode is None:
+                worker, reused = candidate, True
+        if worker is None:
+            worker = await _start_executor_worker()
+        try:
+            worker.stdin.write(request)
+            await worker.stdin.drain()
+            header = await asyncio.wait_for(worker.stdout.readline(), timeout + _EXECUTOR_WORKER_TIMEOUT_MARGIN)
+            if not header:
+                raise EOFError("worker session ended")
+            timed_out, returncode, stdout_size, stderr_size = (int(value) for value in header.split())
+            stdout = await worker.stdout.readexactly(stdout_size)
+            stderr = await worker.stdout.readexactly(stderr_size)
+        except (EOFError, ConnectionError, asyncio.IncompleteReadError) as e:
+            _stop_executor_worker(worker)
+            if reused:
+                # An idle session can go away with the container (e.g. a restart); retry on a fresh one
+                logger.info(f"Idle code executor worker was gone ({e}), starting a new one")
+                continue
+            # A fresh session failing usually means the container is gone; check it again on the next test
+            _forget_code_executor()
+            raise RuntimeError(f"Code executor worker failed: {e}") from e
+        except asyncio.TimeoutError:
+            _stop_executor_worker(worker)
+            raise subprocess.TimeoutExpired(["python"], timeout)
+        except BaseException:
+            # E.g. cancellation: the session may be mid-response, so it can't be reused
+            _stop_executor_worker(worker)
+            raise
+        break
+
+    if len(_IDLE_EXECUTOR_WORKERS) < MAX_IDLE_EXECUTOR_WORKERS:
+        _IDLE_EXECUTOR_WORKERS.append(worker)
+    else:
+        _stop_executor_worker(worker)
+    if timed_out:
+        raise subprocess.TimeoutExpired(["python"], timeout)
+    return subprocess.CompletedProcess(["python"], returncode, stdout, stderr)
+
+async def initialize() -> None:
+    """
+    One-time startup work, called from the app lifespan: (re)creates the shared HTTP clients and
+    makes sure the executor container is running, so the first workflow run or code test doesn't pay for it.
+    """
+    global _CLIENT
+    if _CLIENT.is_closed:
+        _CLIENT = _new_http_client()
+    if litellm.aclient_session is None or litellm.aclient_session.is_closed:
+        litellm.aclient_session = _new_llm_client()
+    await asyncio.to_thread(ensure_code_executor_running)
+
+async def shutdown() -> None:
+    """Closes pooled connections; called from the app lifespan on shutdown. The executor container keeps running."""
+    global _CODE_NODE_EXECUTOR
+    await _CLIENT.aclose()
+    if litellm.aclient_session is not None:
+        await litellm.aclient_session.aclose()
+    # Locks and semaphores are bound to the event loop that is going away
+    _TOKEN_LOCKS.clear()
+    _LLM_SEMAPHORES.clear()
+    _API_SEMAPHORES.clear()
+    _REQUIREMENTS_LOCKS.clear()
+    # Worker sessions are subprocesses of the event loop that is going away
+    while _IDLE_EXECUTOR_WORKERS:
+        worker = _IDLE_EXECUTOR_WORKERS.pop()
+        _stop_executor_worker(worker)
+        await worker.wait()
+    _CODE_GEN_LOCKS.clear()
+    # Scripts still running keep their thread; queued ones are dropped
+    if _CODE_NODE_EXECUTOR is not None:
+        _CODE_NODE_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+        _CODE_NODE_EXECUTOR = None
+
 async def test_code_node_in_docker(code: str, input_data: Dict[str, Any], requirements: Optional[str], timeout_seconds: int = 60) -> Dict[str, Any]:
     """
     Executes Python code in the dedicated code-executor container, passing input via STDIN.
     """
     logger.info(f"Attempting to test code in code-executor container via STDIN. Code snippet: {code[:100]}...")
     
-    tmp_dir = None # Keep tmp_dir for requirements.txt if needed
     try:
-        # Convert input_data to JSON string to be passed via STDIN
-        input_json_str = json.dumps(input_data)
+        # Serialize input_data straight to the JSON bytes passed via STDIN
+        input_json = serialization.dumps_bytes(input_data)
         
         # 1. Create main.py (user's code, wrapped to handle input/output from STDIN)
         main_py_content = f"""
@@ -661,7 +1529,7 @@ if __name__ == '__main__':
 
     if error_occurred:
         # Output error as JSON to STDOUT so it can be captured
-        print(json.dumps({{"status": "error", "error": error_details.get("error"), "details": error_details.get("details")}}))
+        print("\\x1e" + json.dumps({{"status": "error", "error": error_details.get("error"), "details": error_details.get("details")}}))
         sys.exit(0) # Exit cleanly for Docker, actual error is in JSON
 
     try:
@@ -669,10 +1537,10 @@ if __name__ == '__main__':
             raise NameError("Function 'execute(input_data)' is not defined in the provided code.")
 
         result = execute(input_payload) # Pass the loaded payload
-        print(json.dumps({{"status": "success", "result": result}}))
+        print("\\x1e" + json.dumps({{"status": "success", "result": result}}))
 
     except Exception as e:
-        print(json.dumps({{\
+        print("\\x1e" + json.dumps({{\
             "status": "error", 
             "error": f"Error during Python code execution: {{str(e)}}",
             "error_type": type(e).__name__,
@@ -681,122 +1549,83 @@ if __name__ == '__main__':
         # Ensure a clean exit for Docker; result/error is captured from STDOUT
         sys.exit(0)
 """
-        # Create a temporary directory if requirements are provided or for main.py
-        # This part can be simplified if requirements are also handled differently or not present.
-        # For now, we keep it for housing main.py and potentially requirements.txt.
-        tmp_dir = tempfile.mkdtemp()
-        logger.debug(f"Created temporary directory for code execution artifacts: {tmp_dir}")
-
-        main_py_path = os.path.join(tmp_dir, "main.py")
-        with open(main_py_path, "w") as f:
-            f.write(main_py_content)
-        logger.debug(f"Created main.py at {main_py_path}")
-
-        # 2. Create requirements.txt if provided
-        requirements_txt_path = None
-        if requirements:
-            requirements_txt_path = os.path.join(tmp_dir, "requirements.txt")
-            with open(requirements_txt_path, "w") as f:
-                f.write(requirements)
-            logger.debug(f"Created requirements.txt at {requirements_txt_path}")
-
-        # Define container paths
-        container_app_dir = "/app"
-        container_main_py = f"{container_app_dir}/main.py"
-        container_requirements_txt = f"{container_app_dir}/requirements.txt" if requirements else None
-
-        # 3. Copy files to the Docker container
-        # Copy main.py
-        # Ensure main.py is executable by the user inside the container if needed, though python execution doesn't require it.
-        cmd_cp_main = ["docker", "cp", main_py_path, f"{CODE_EXECUTOR_CONTAINER_NAME}:{container_main_py}"]
-        subprocess.run(cmd_cp_main, check=True, capture_output=True)
-        logger.debug(f"Copied main.py to {CODE_EXECUTOR_CONTAINER_NAME}:{container_main_py}")
-
-        if requirements_txt_path and container_requirements_txt:
-            cmd_cp_req = ["docker", "cp", requirements_txt_path, f"{CODE_EXECUTOR_CONTAINER_NAME}:{container_requirements_txt}"]
-            subprocess.run(cmd_cp_req, check=True, capture_output=True)
-            logger.debug(f"Copied requirements.txt to {CODE_EXECUTOR_CONTAINER_NAME}:{container_requirements_txt}")
-            
-            # Install requirements
-            # It's important that the user running this can write to the site-packages or a local venv
-            # For simplicity, assuming global install within the container as root or a user with write access.
-            # The Dockerfile for code-executor should set up a user/permissions appropriately if not root.
-            # We should also consider if requirements installation should happen every time or if it can be cached.
-            # For now, installing every time for simplicity.
-            install_command = [
-                "docker", "exec", CODE_EXECUTOR_CONTAINER_NAME,
-                "pip", "install", "-r", container_requirements_txt, "--user" # Install to user site-packages
-            ]
-            logger.info(f"Installing requirements from {container_requirements_txt} in {CODE_EXECUTOR_CONTAINER_NAME}")
-            pip_process = subprocess.run(install_command, capture_output=True, text=True, timeout=120) # Increased timeout for pip
-            if pip_process.returncode != 0:
-                logger.error(f"Pip install failed. STDOUT: {pip_process.stdout} STDERR: {pip_process.stderr}")
-                return {"status": "error", "error": "Failed to install requirements", "details": pip_process.stderr or pip_process.stdout}
-            logger.info(f"Pip install successful. STDOUT: {pip_process.stdout}")
+        # 2. Make sure the warm executor container is up and the requirements are installed.
+        # Code and input are both streamed to a warm worker, so nothing has to be copied into the container.
+        if not _code_executor_ready and not await asyncio.to_thread(ensure_code_executor_running):
+            return {
+                "status": "error",
+                "error": "Code executor container is not available",
+                "details": f"Could not start {CODE_EXECUTOR_CONTAINER_NAME}. Ensure Docker is installed and running."
+            }
 
+        if requirements and requirements.strip():
+            install_error = await _install_requirements(requirements)
+            if install_error:
+                return install_error
 
-        # 4. Execute the code in Docker, passing input_json_str via STDIN
-        exec_command = [
-            "docker", "exec", "-i", # -i is crucial for passing STDIN
-            CODE_EXECUTOR_CONTAINER_NAME,
-            "python", container_main_py 
-        ]
-        logger.info(f"Executing code in {CODE_EXECUTOR_CONTAINER_NAME} with STDIN. Command: {' '.join(exec_command)}")
+        # 3. Execute the code in a warm worker in the container, passing input_json as the script's STDIN
+        logger.info(f"Executing code in {CODE_EXECUTOR_CONTAINER_NAME} with STDIN.")
         
         try:
-            # Pass input_json_str to the process's STDIN
-            exec_process = subprocess.run(
-                exec_command,
-                input=input_json_str, # Pass the JSON string as input
-                capture_output=True,
-                text=True, # Decodes stdout/stderr as text
-                timeout=timeout_seconds,
-                check=False # We will check return code and parse output manually
-            )
+            # The worker runs the script with input_json as its STDIN; the event loop keeps serving other requests meanwhile
+            exec_process = await _run_in_executor_worker(main_py_content, input_json, timeout_seconds)
             
-            # Log stdout/stderr regardless of success for debugging
-            logger.debug(f"Code execution STDOUT: {exec_process.stdout}")
-            if exec_process.stderr:
-                logger.warning(f"Code execution STDERR: {exec_process.stderr}")
+            # Log stdout/stderr regardless of success for debugging.
+            # Output stays bytes: it is parsed as-is and only the parts that get logged are decoded.
+            # The STDOUT preview is decoded at most once and shared by the debug log and the error paths below.
+            stdout_preview = None
+            if logger.isEnabledFor(logging.DEBUG):
+                stdout_preview = _decode_output(exec_process.stdout, 1000)
+                logger.debug("Code execution STDOUT: %s", stdout_preview)
+            exec_stderr = _decode_output(exec_process.stderr)
+            if exec_stderr:
+                logger.warning("Code execution STDERR: %s", exec_stderr)
 
             # The Python script (main_py_content) is designed to always exit with 0
             # and print a JSON to STDOUT. So, we primarily parse STDOUT.
             # A non-zero exit from `docker exec` itself would indicate a deeper issue.
 
             if exec_process.returncode != 0:
-                # This might happen if `python main.py` itself crashes before our try/except in main.py
+                # This might happen if the script itself crashes before its own try/except
                 # or if `docker exec` command fails.
-                logger.error(f"Docker exec command returned non-zero exit code: {exec_process.returncode}. STDERR: {exec_process.stderr}")
+                logger.error("Docker exec command returned non-zero exit code: %s. STDERR: %s", exec_process.returncode, exec_stderr)
                 return {
                     "status": "error",
                     "error": "Docker execution command failed",
-                    "details": exec_process.stderr or f"Docker exec exited with {exec_process.returncode}"
+                    "details": exec_stderr or f"Docker exec exited with {exec_process.returncode}"
                 }
 
-            # Parse the output from the script's STDOUT
+            # Parse the result record the wrapper writes last to STDOUT, after anything the user's code printed
+            # Only the (small) record is copied out of STDOUT; user output is viewed in place.
+            separator_at = exec_process.stdout.rfind(_RESULT_SEPARATOR)
             try:
-                # Handle cases where stdout might be empty or not JSON
-                if not exec_process.stdout.strip():
-                    logger.error("Code execution produced no STDOUT. This is unexpected.")
+                if separator_at < 0:
+                    if stdout_preview is None:
+                        stdout_preview = _decode_output(exec_process.stdout, 1000)
+                    logger.error("Code execution produced no result record. Raw STDOUT: %s", stdout_preview)
                     return {
                         "status": "error",
-                        "error": "Execution produced no output",
-                        "details": exec_process.stderr or "The script's STDOUT was empty."
+                        "error": "Execution produced no result",
+                        "details": exec_stderr or f"The script exited before reporting a result. STDOUT: {stdout_preview}"
                     }
+                result_record = exec_process.stdout[separator_at + 1:]
+                if separator_at and logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Code printed to STDOUT: %s", _decode_output(memoryview(exec_process.stdout)[:separator_at], 1000))
                 
-                result_json = json.loads(exec_process.stdout)
+                result_json = serialization.loads(result_record)
                 # Log the actual result from the user's code perspective
                 if result_json.get("status") == "success":
-                    logger.info(f"Code execution successful via STDIN. Result preview: {str(result_json.get('result'))[:100]}...")
+                    logger.info(f"Code execution successful via STDIN. Result preview: {serialization.summarize(result_json.get('result'))}")
                 else:
                     logger.warning(f"Code execution reported failure via STDIN. Error: {result_json.get('error')}, Details: {result_json.get('details')}")
                 return result_json
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse JSON output from script: {e}. Raw STDOUT: {exec_process.stdout[:1000]}")
+            except ValueError as e: # Not JSON, or not even UTF-8 text
+                record_preview = _decode_output(result_record, 1000)
+                logger.error("Failed to parse JSON output from script: %s. Raw STDOUT: %s", e, record_preview)
                 return {
                     "status": "error",
                     "error": "Failed to parse execution result from script",
-                    "details": f"Output was not valid JSON. STDOUT: {exec_process.stdout[:1000]}. STDERR: {exec_process.stderr}"
+                    "details": f"Output was not valid JSON. STDOUT: {record_preview}. STDERR: {exec_stderr}"
                 }
 
         except subprocess.TimeoutExpired:
@@ -805,6 +1634,9 @@ if __name__ == '__main__':
                 "status": "error",
                 "error": f"Code execution timed out after {timeout_seconds} seconds"
             }
+        except FileNotFoundError as e: # e.g. if 'docker' command is not found
+            logger.error(f"Docker command not found: {e}. Ensure Docker CLI is installed and in PATH.", exc_info=True)
+            return {"status": "error", "error": "Docker command not found", "details": str(e)}
         except subprocess.CalledProcessError as e: # Should be caught by check=False and manual check now
             logger.error(f"Error during Docker command execution (CalledProcessError): {e}. Output: {e.output}, Stderr: {e.stderr}")
             return {
@@ -832,18 +1664,37 @@ if __name__ == '__main__':
             "error": "An unexpected error occurred during code test setup (STDIN method)",
             "details": str(e)
         }
-    finally:
-        if tmp_dir and os.path.exists(tmp_dir):
-            try:
-                shutil.rmtree(tmp_dir)
-                logger.debug(f"Removed temporary directory {tmp_dir}")
-            except Exception as e_clean:
-                logger.error(f"Failed to remove temporary directory {tmp_dir}: {e_clean}")
 
     # Fallback, should ideally be handled by one of the return paths above
     logger.error("Reached end of test_code_node_in_docker function unexpectedly (STDIN method).")
     return {"status": "error", "error": "Reached end of code execution function unexpectedly."}
 
+# Code in the LLM's answer is usually fenced as ```python (or a bare ```); compiled once instead of on every call
+_CODE_BLOCK_RE = re.compile(r"```(?:python)?\n(.*?)\n```", re.DOTALL)
+# Phrases suggesting conversational text around unfenced code; matched case-insensitively without lowercasing the answer
+_CONVERSATIONAL_RE = re.compile(r"here is the code|certainly,|sure,", re.IGNORECASE)
+
+# Lower temperature for more deterministic code
+_CODE_GEN_TEMPERATURE = 0.2
+# Successful code generation results by hash of (model, api base, temperature, prompt): {key: (stored_at, result)},
+# least recently used first. Entries expire after _CODE_GEN_CACHE_TTL seconds.
+_CODE_GEN_CACHE: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_CODE_GEN_CACHE_MAX = 256
+_CODE_GEN_CACHE_TTL = 3600
+_CODE_GEN_LOCKS: Dict[str, asyncio.Lock] = {}
+
+# Fixed opening and closing instructions of the code generation prompt, joined once at import
+_CODE_GEN_PROMPT_PREFIX = "\n".join((
+    "You are an expert Python coding assistant. Your task is to generate or update a Python script for a workflow automation node.",
+    "The script MUST define a single function with the exact signature: `def execute(input_data):`",
+    "This function will receive a dictionary `input_data` containing outputs from upstream nodes.",
+))
+_CODE_GEN_PROMPT_SUFFIX = "\n".join((
+    "\nPlease provide ONLY the complete Python code for the `execute` function and any necessary helper functions or imports within the script. Do not include any explanatory text before or after the code block.",
+    'The function must return a value (e.g., a dictionary, a string, a number). Example return: `{"summary": "summary_text", "data_processed": True}`',
+    "Ensure all necessary imports are included at the top of the script.",
+))
+
 async def generate_code_with_llm(
     available_inputs_schema: Dict[str, Any], 
     current_code: Optional[str], 
@@ -857,40 +1708,36 @@ async def generate_code_with_llm(
     """
     logger.info(f"Initiating AI code generation. Instruction: {user_instruction[:100]}...")
 
-    # Construct a detailed prompt for the LLM
-    prompt_parts = []
-    prompt_parts.append("You are an expert Python coding assistant. Your task is to generate or update a Python script for a workflow automation node.")
-    prompt_parts.append("The script MUST define a single function with the exact signature: `def execute(input_data):`")
-    prompt_parts.append("This function will receive a dictionary `input_data` containing outputs from upstream nodes.")
+    # Construct a detailed prompt for the LLM: static prefix/suffix plus the request-specific parts, joined once.
+    # Sample data is serialized compactly: the model reads it just as well without indentation, and it is cheaper
+    # to produce and shorter in tokens.
+    prompt_parts = [_CODE_GEN_PROMPT_PREFIX]
 
     if available_inputs_schema:
         prompt_parts.append("\nHere's a description of the `input_data` structure you can expect, keyed by upstream node ID:")
-        for node_id, schema_info in available_inputs_schema.items():
-            input_description = f"  - Node '{schema_info.get('node_name', node_id)}' (ID: {node_id}, Type: {schema_info.get('node_type', 'N/A')}):\n"
-            input_description += f"    Its output will be available as `input_data['{node_id}']`.\n"
-            input_description += f"    Sample data structure: {json.dumps(schema_info.get('data_structure_sample', {}), indent=2)}"
-            prompt_parts.append(input_description)
+        prompt_parts.extend(
+            f"  - Node '{schema_info.get('node_name', node_id)}' (ID: {node_id}, Type: {schema_info.get('node_type', 'N/A')}):\n"
+            f"    Its output will be available as `input_data['{node_id}']`.\n"
+            f"    Sample data structure: {serialization.dumps(schema_info.get('data_structure_sample', {}))}"
+            for node_id, schema_info in available_inputs_schema.items()
+        )
         prompt_parts.append("For example, to access data from a node named 'Webhook Data' with ID 'node_abc', you would use `input_data['node_abc']`.")
     else:
         prompt_parts.append("The `input_data` dictionary will likely be empty as no upstream inputs are connected or have sample data.")
 
-    prompt_parts.append("\nUser's instruction for the code to be generated/updated:")
-    prompt_parts.append(f"'''{user_instruction}'''")
+    prompt_parts.append(f"\nUser's instruction for the code to be generated/updated:\n'''{user_instruction}'''")
 
     if current_code and current_code.strip():
         prompt_parts.append("\nThis is the current code in the editor. Please try to modify or build upon it if relevant to the instruction. If the instruction is entirely new, you can replace it:")
-        prompt_parts.append("```python")
-        prompt_parts.append(current_code)
-        prompt_parts.append("```")
+        prompt_parts.extend(("```python", current_code, "```"))
     else:
         prompt_parts.append("\nThere is no existing code in the editor. Please generate the new code based on the instruction.")
     
-    prompt_parts.append("\nPlease provide ONLY the complete Python code for the `execute` function and any necessary helper functions or imports within the script. Do not include any explanatory text before or after the code block.")
-    prompt_parts.append('The function must return a value (e.g., a dictionary, a string, a number). Example return: `{"summary": "summary_text", "data_processed": True}`')
-    prompt_parts.append("Ensure all necessary imports are included at the top of the script.")
+    prompt_parts.append(_CODE_GEN_PROMPT_SUFFIX)
 
     final_prompt = "\n".join(prompt_parts)
-    logger.debug(f"Generated LLM Prompt:\n{final_prompt}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Generated LLM Prompt:\n{final_prompt}")
 
     # LLM Configuration (you might want to make this more configurable, e.g., from settings or model_config node)
     # For now, using a common default. Ensure OPENAI_API_KEY is set in your environment or handled by litellm.
@@ -900,11 +1747,7 @@ async def generate_code_with_llm(
     resolved_model_config_name = "environment default"
 
     if model_config_id and workflow_nodes:
-        found_config = None
-        for node_dict in workflow_nodes:
-            if node_dict.get('id') == model_config_id and node_dict.get('type') == 'model_config':
-                found_config = node_dict.get('data', {})
-                break
+        found_config = _find_model_config_in_node_dicts(workflow_nodes, model_config_id)
         
         if found_config:
             logger.info(f"Using model configuration '{found_config.get('config_name', model_config_id)}' for AI code generation.")
@@ -931,6 +1774,49 @@ async def generate_code_with_llm(
         {"role": "user", "content": final_prompt}
     ]
 
+    # Users iterating on a node re-send identical requests; answer those from the cache instead of the LLM.
+    # The key covers the credentials too (only as part of the digest), so a caller whose key is invalid or
+    # revoked never gets code generated with someone else's.
+    cache_key = hashlib.blake2b(
+        f"{llm_model}\0{custom_api_base}\0{api_key or ''}\0{_CODE_GEN_TEMPERATURE}\0{final_prompt}".encode("utf-8"),
+        digest_size=16
+    ).hexdigest()
+    cached = _cached_generated_code(cache_key)
+    if cached is not None:
+        logger.info(f"Returning cached generated code for model {llm_model}")
+        return cached
+
+    # Concurrent identical requests wait for one LLM call
+    try:
+        async with _CODE_GEN_LOCKS.setdefault(cache_key, asyncio.Lock()):
+            cached = _cached_generated_code(cache_key)
+            if cached is not None:
+                return cached
+            result = await _request_generated_code(messages, llm_model, api_key, custom_api_base)
+            if result["status"] == "success":
+                _CODE_GEN_CACHE[cache_key] = (time.monotonic(), result)
+                if len(_CODE_GEN_CACHE) > _CODE_GEN_CACHE_MAX:
+                    _CODE_GEN_CACHE.popitem(last=False)
+    finally:
+        # Also when the request is cancelled; waiters still holding the lock object are unaffected
+        _CODE_GEN_LOCKS.pop(cache_key, None)
+    return dict(result)
+
+def _cached_generated_code(cache_key: str) -> Optional[Dict[str, Any]]:
+    """Returns a copy of the cached code generation result for `cache_key`, unless it is missing or expired."""
+    entry = _CODE_GEN_CACHE.get(cache_key)
+    if entry is None:
+        return None
+    stored_at, result = entry
+    if time.monotonic() - stored_at > _CODE_GEN_CACHE_TTL:
+        del _CODE_GEN_CACHE[cache_key]
+        return None
+    _CODE_GEN_CACHE.move_to_end(cache_key)
+    return dict(result)
+
+async def _request_generated_code(messages: List[Dict[str, str]], llm_model: str, api_key: Optional[str],
+                                  custom_api_base: Optional[str]) -> Dict[str, Any]:
+    """Asks the LLM for the code and extracts/validates the `execute` function from its answer."""
     try:
         logger.info(f"Calling LLM ({llm_model}) for code generation...")
         response = await litellm_acompletion(
@@ -938,7 +1824,7 @@ async def generate_code_with_llm(
             messages=messages,
             api_key=api_key, # Pass explicitly if fetched
             api_base=custom_api_base, # Pass explicitly if fetched
-            temperature=0.2, # Lower temperature for more deterministic code
+            temperature=_CODE_GEN_TEMPERATURE,
             max_tokens=1500 # Adjust as needed
         )
         
@@ -946,12 +1832,12 @@ async def generate_code_with_llm(
         logger.debug(f"Raw LLM response: {generated_code_raw}")
 
         # Post-process the generated code: extract code from markdown triple backticks if present
-        match = re.search(r"```python\n(.*?)\n```", generated_code_raw, re.DOTALL)
+        match = _CODE_BLOCK_RE.search(generated_code_raw)
         if match:
             generated_code = match.group(1).strip()
         else:
             # If no markdown block, assume the whole response is code, but warn if it contains common conversational phrases
-            if any(phrase in generated_code_raw.lower() for phrase in ["here is the code", "certainly,", "sure,"]):
+            if _CONVERSATIONAL_RE.search(generated_code_raw):
                  logger.warning("LLM response might contain conversational text outside a markdown block. Attempting to use as is.")
             generated_code = generated_code_raw.strip()
 
@@ -1,13 +1,24 @@
 import logging
 import uuid
 import time
+from collections import deque
 from typing import Dict, Any, Optional
 
-from app.utils.persistence import webhook_payloads, webhook_mapping, save_webhooks_to_disk, save_webhook_payloads_to_disk
-from app.services.workflow_service import run_workflow
+from app.utils.persistence import webhook_payloads, webhook_mapping, save_webhooks_to_disk, append_webhook_payload
 
 logger = logging.getLogger(__name__)
 
+# Only the most recent payloads of each webhook are kept; the deque evicts the oldest on append
+MAX_STORED_PAYLOADS = 10
+
+def _payload_store(webhook_id: str) -> deque:
+    """Returns the bounded payload deque for a webhook, converting a list loaded from disk on first use."""
+    store = webhook_payloads.get(webhook_id)
+    if not isinstance(store, deque):
+        store = deque(store if isinstance(store, list) else (), maxlen=MAX_STORED_PAYLOADS)
+        webhook_payloads[webhook_id] = store
+    return store
+
 async def register_webhook(workflow_id: str, node_id: str) -> str:
     """Register a webhook for a workflow node"""
     webhook_id = str(uuid.uuid4())
@@ -16,52 +27,43 @@ async def register_webhook(workflow_id: str, node_id: str) -> str:
     webhook_mapping[webhook_id] = {
         "workflow_id": workflow_id,
         "node_id": node_id,
-        "created_at": time.time()
+        "created_at": time.time_ns() # Integer nanoseconds since the epoch, like the route-registered webhooks
     }
     
     # Initialize the payload store for this webhook ID
-    webhook_payloads[webhook_id] = []
+    webhook_payloads[webhook_id] = deque(maxlen=MAX_STORED_PAYLOADS)
     
     # Save to disk
     save_webhooks_to_disk()
     
-    logger.info(f"Registered webhook {webhook_id} for workflow {workflow_id}, node {node_id}")
+    logger.info("Registered webhook %s for workflow %s, node %s", webhook_id, workflow_id, node_id)
     return webhook_id
 
 async def handle_webhook(webhook_id: str, payload: Any) -> Dict[str, Any]:
     """Process incoming webhook data"""
-    if webhook_id not in webhook_mapping:
+    # Get the mapping information (a single lookup)
+    mapping = webhook_mapping.get(webhook_id)
+    if mapping is None:
         raise ValueError(f"Webhook ID {webhook_id} not found")
-    
-    # Get the mapping information
-    mapping = webhook_mapping[webhook_id]
     workflow_id = mapping["workflow_id"]
     node_id = mapping["node_id"]
     
-    # Store the payload
-    if webhook_id not in webhook_payloads:
-        webhook_payloads[webhook_id] = []
-    
     # Add metadata to payload
     payload_with_meta = {
         "received_at": time.time(),
         "payload": payload
     }
     
-    # Add to payloads (cap to the last 10 payloads)
-    max_stored_payloads = 10
-    if len(webhook_payloads[webhook_id]) >= max_stored_payloads:
-        webhook_payloads[webhook_id].pop(0)  # Remove the oldest
-    
-    webhook_payloads[webhook_id].append(payload_with_meta)
+    # Add to payloads (capped to the last MAX_STORED_PAYLOADS)
+    _payload_store(webhook_id).append(payload_with_meta)
     
-    # Save to disk
-    save_webhook_payloads_to_disk()
+    # Save to disk: one appended line instead of rewriting every stored payload
+    append_webhook_payload(webhook_id, payload_with_meta)
     
     # Optionally, trigger the workflow
     # This can be enhanced to check if the workflow should be triggered automatically
     # For now, we'll just store the payload
-    logger.info(f"Received webhook {webhook_id} for workflow {workflow_id}, node {node_id}")
+    logger.info("Received webhook %s for workflow %s, node %s", webhook_id, workflow_id, node_id)
     
     return {
         "webhook_id": webhook_id,
@@ -1,103 +1,460 @@
+import os
 import logging
 import asyncio
-import json
 import uuid
 import time
 import traceback
 from collections import deque
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, NamedTuple, Optional, Tuple
 from datetime import datetime
 
+try:
+    from asyncio import timeout as async_timeout # Python 3.11+
+except ImportError:
+    from async_timeout import timeout as async_timeout
+
 from app.models.workflow import Workflow, Node
 from app.services.node_execution import execute_node
-from app.utils.persistence import workflows_db, workflow_runs, save_workflows_to_disk, save_individual_run_log
+from app.utils.persistence import workflows_db, store_run, schedule_save, save_individual_run_log
+from app.utils import serialization
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-# Dictionary to hold asyncio Queues for active SSE streams, keyed by run_id
-# Caution: In-memory storage, will be lost on restart. 
-# Needs persistent queue (Redis Pub/Sub, etc.) for production.
-stream_queues: Dict[str, asyncio.Queue] = {}
+# Subscriber queues of active SSE streams, keyed by run_id. Each connected client has its own queue;
+# a run is registered (with no subscribers yet) when it starts and removed when it ends.
+# Caution: In-memory storage, will be lost on restart. Clients of runs started by another worker
+# are served through Redis Pub/Sub when STREAM_PUBSUB_TYPE=redis (see below).
+stream_queues: Dict[str, List[asyncio.Queue]] = {}
+# Latest SSE frames of each run (up to SSE_MAX_QUEUE_SIZE), replayed to clients that connect after the run started
+stream_history: Dict[str, deque] = {}
+# Set when a run's last client goes away, which aborts the run (only without the Redis relay, see _unsubscribe)
+stream_disconnected: Dict[str, asyncio.Event] = {}
+# Frames of each run waiting for the flush timer, and the pending timer
+_pending_frames: Dict[str, List[bytes]] = {}
+_flush_timers: Dict[str, asyncio.TimerHandle] = {}
+
+# Log events buffered per SSE client. A client whose queue is full has stopped reading and is dropped
+# instead of its events piling up in memory; the run is aborted once its last client is gone (see _unsubscribe).
+SSE_MAX_QUEUE_SIZE = int(os.environ.get('SSE_MAX_QUEUE_SIZE', 1000))
+# Frames already waiting in a client's queue are written together, up to this many queue entries per write
+SSE_MAX_BATCH_FRAMES = 32
+# Frames a run logs within this window are pushed to its clients as one chunk (0 pushes each frame right away).
+# The __END__ event is never held back.
+SSE_FLUSH_DELAY_SECONDS = float(os.environ.get('SSE_FLUSH_DELAY_SECONDS', '0.01'))
+
+# Log events are queued as serialized JSON bytes. The run's final __END__ event is queued as this
+# subclass, so the stream generator recognizes it by type instead of parsing every event.
+class _EndOfStream(bytes):
+    """Serialized __END__ event of a run (and its SSE frame)."""
+
+# Data in log events is already summarized; free-text fields (e.g. an error carrying a whole API response)
+# are cut to this many characters on the SSE stream. The stored run log keeps them in full.
+SSE_MAX_FIELD_CHARS = 4096
+
+def _stream_entry(log_entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the log entry as sent to SSE clients, with long string fields truncated (a copy only if needed)."""
+    long_fields = [key for key, value in log_entry.items() if isinstance(value, str) and len(value) > SSE_MAX_FIELD_CHARS]
+    if not long_fields:
+        return log_entry
+    entry = dict(log_entry)
+    for key in long_fields:
+        value = entry[key]
+        entry[key] = f"{value[:SSE_MAX_FIELD_CHARS]}...[+{len(value) - SSE_MAX_FIELD_CHARS} chars]"
+    return entry
+
+def _with_run_fields(event: bytes, run_fields: bytes) -> bytes:
+    """Appends pre-serialized fields (`"key":value,...`, without braces) to a serialized non-empty JSON object."""
+    return event[:-1] + b"," + run_fields + b"}"
+
+# Queued in place of the oldest event of a client that fell behind, so its stream ends after what it has
+_CLIENT_DROPPED = object()
+
+def _sse_frame(event: bytes) -> bytes:
+    """Wraps a serialized event in an SSE data frame; sse_starlette sends yielded bytes as they are."""
+    frame = b"data: " + event + b"\r\n\r\n"
+    return _EndOfStream(frame) if isinstance(event, _EndOfStream) else frame
+
+# Optional Redis Pub/Sub relay of log streams (STREAM_PUBSUB_TYPE=redis, with REDIS_HOST / REDIS_PORT / REDIS_PASSWORD),
+# so an SSE client can follow a run started by another worker. Frames go to channel run:<run_id>, and the key
+# stream:<run_id> marks the run as in progress. Clients on the run's own worker keep using the local queues.
+STREAM_PUBSUB_TYPE = os.environ.get('STREAM_PUBSUB_TYPE', '').strip().lower()
+STREAM_CHANNEL_PREFIX = "run:"
+STREAM_ACTIVE_KEY_PREFIX = "stream:"
+# Expiry of the in-progress marker, in case a worker dies before its run ends
+STREAM_ACTIVE_KEY_TTL_SECONDS = 86400
+# Frames waiting to be relayed; beyond this Redis can't keep up and frames are dropped from the relay
+STREAM_PUBSUB_MAX_PENDING = 10000
+# Published on a run's channel after its __END__ frame; not an SSE frame, so it can't be mistaken for one
+_RELAY_END_MARKER = b"__END__"
+_pubsub_redis = None
+# Redis commands in the order they must run, sent by a single forwarder task so a run's frames stay in order
+_pubsub_outbox: Optional[asyncio.Queue] = None
+_pubsub_forwarder: Optional[asyncio.Task] = None
+
+async def initialize() -> None:
+    """
+    Prepares the loaded workflows for running and connects the Redis Pub/Sub relay if one is configured;
+    called from the app lifespan on startup, after the workflows are loaded.
+    """
+    global _pubsub_redis, _pubsub_outbox, _pubsub_forwarder
+    for workflow in workflows_db.values():
+        prepare_workflow(workflow)
+    if STREAM_PUBSUB_TYPE != 'redis':
+        return
+    try:
+        import redis.asyncio as redis_asyncio
+        client = redis_asyncio.Redis(
+            host=os.environ.get('REDIS_HOST', 'localhost'),
+            port=int(os.environ.get('REDIS_PORT', '6379')),
+            password=os.environ.get('REDIS_PASSWORD')
+        )
+        await client.ping()
+    except Exception as e:
+        logger.warning(f"Could not enable Redis log stream relay, streaming from this worker only: {e}")
+        return
+    _pubsub_redis = client
+    _pubsub_outbox = asyncio.Queue(maxsize=STREAM_PUBSUB_MAX_PENDING)
+    _pubsub_forwarder = asyncio.create_task(_forward_to_redis(), name="stream-pubsub-forwarder")
+    logger.info("Redis log stream relay enabled.")
+
+def _relay(command: str, *args, **kwargs) -> None:
+    """Queues a Redis command for the forwarder, if the relay is enabled."""
+    if _pubsub_outbox is None:
+        return
+    try:
+        _pubsub_outbox.put_nowait((command, args, kwargs))
+    except asyncio.QueueFull:
+        logger.warning(f"Redis log stream relay is {STREAM_PUBSUB_MAX_PENDING} commands behind; dropping {command}.")
+
+async def _forward_to_redis() -> None:
+    """Sends queued commands to Redis in order, pipelining whatever has queued up; a None entry stops it."""
+    stopping = False
+    while not stopping:
+        commands = [await _pubsub_outbox.get()]
+        while not _pubsub_outbox.empty():
+            commands.append(_pubsub_outbox.get_nowait())
+        if commands[-1] is None:
+            commands.pop()
+            stopping = True
+        if not commands:
+            continue
+        try:
+            async with _pubsub_redis.pipeline(transaction=False) as pipe:
+                for command, args, kwargs in commands:
+                    getattr(pipe, command)(*args, **kwargs)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Error relaying {len(commands)} log stream command(s) to Redis: {e}")
+
+def _register_stream(run_id: str) -> List[asyncio.Queue]:
+    """Registers a run's log stream; SSE clients subscribe to the returned list once they connect."""
+    stream_disconnected[run_id] = asyncio.Event()
+    _relay("set", f"{STREAM_ACTIVE_KEY_PREFIX}{run_id}", b"1", ex=STREAM_ACTIVE_KEY_TTL_SECONDS)
+    return stream_queues.setdefault(run_id, [])
+
+def _unsubscribe(run_id: str, queue: asyncio.Queue) -> None:
+    """
+    Removes a client's queue from a run; a run left without clients is unregistered and aborted. With the
+    Redis relay, clients on other workers may still be following the run, so it keeps running (and relaying).
+    """
+    subscribers = stream_queues.get(run_id)
+    if subscribers is None or queue not in subscribers:
+        return
+    subscribers.remove(queue)
+    if not subscribers and _pubsub_outbox is None:
+        del stream_queues[run_id]
+        stream_history.pop(run_id, None)
+        _drop_pending_frames(run_id)
+        disconnected = stream_disconnected.pop(run_id, None)
+        if disconnected is not None:
+            disconnected.set()
+
+def _publish(run_id: str, event: bytes) -> None:
+    """
+    Sends one serialized event to every client of the run: the event is serialized and framed once however
+    many clients there are, and queues hold SSE frames ready to write. Frames logged in a burst are pushed
+    together after SSE_FLUSH_DELAY_SECONDS (see _flush_frames).
+    """
+    if run_id not in stream_queues:
+        return
+    frame = _sse_frame(event)
+    _relay("publish", f"{STREAM_CHANNEL_PREFIX}{run_id}", frame)
+    pending = _pending_frames.setdefault(run_id, [])
+    pending.append(frame)
+    if isinstance(frame, _EndOfStream):
+        _flush_frames(run_id)
+    elif SSE_FLUSH_DELAY_SECONDS <= 0:
+        _flush_frames(run_id)
+    elif len(pending) == 1:
+        _flush_timers[run_id] = asyncio.get_running_loop().call_later(SSE_FLUSH_DELAY_SECONDS, _flush_frames, run_id)
+
+def _flush_frames(run_id: str) -> None:
+    """
+    Pushes the run's pending frames to every client as one chunk and adds them to the replay history.
+    Clients that fell SSE_MAX_QUEUE_SIZE chunks behind are dropped.
+    """
+    frames = _drop_pending_frames(run_id)
+    subscribers = stream_queues.get(run_id)
+    if not frames or subscribers is None:
+        return
+    history = stream_history.get(run_id)
+    if history is None:
+        history = stream_history[run_id] = deque(maxlen=SSE_MAX_QUEUE_SIZE)
+    history.extend(frames)
+    chunk = frames[0] if len(frames) == 1 else b"".join(frames)
+    if isinstance(frames[-1], _EndOfStream):
+        chunk = _EndOfStream(chunk)
+    for queue in list(subscribers):
+        try:
+            queue.put_nowait(chunk)
+        except asyncio.QueueFull:
+            logger.warning(f"[Run {run_id}]: SSE client is not reading logs ({SSE_MAX_QUEUE_SIZE} queued). Dropping it.")
+            _unsubscribe(run_id, queue)
+            queue.get_nowait()
+            queue.put_nowait(_CLIENT_DROPPED)
+
+def _drop_pending_frames(run_id: str) -> List[bytes]:
+    """Takes the run's frames waiting for the flush timer, cancelling the timer."""
+    timer = _flush_timers.pop(run_id, None)
+    if timer is not None:
+        timer.cancel()
+    return _pending_frames.pop(run_id, [])
+
+# Background tasks of the runs in progress, keyed by run_id
+_active_runs: Dict[str, asyncio.Task] = {}
+
+async def shutdown() -> None:
+    """Cancels the runs still in progress and waits for them to stop; called from the app lifespan on shutdown."""
+    tasks = list(_active_runs.values())
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        logger.info(f"Cancelling {len(tasks)} workflow run(s) still in progress")
+        await asyncio.gather(*tasks, return_exceptions=True)
+    await _close_relay()
+
+async def _close_relay() -> None:
+    """Sends the commands still queued for the Redis relay (e.g. the END of cancelled runs) and disconnects."""
+    global _pubsub_redis, _pubsub_outbox, _pubsub_forwarder
+    if _pubsub_forwarder is None:
+        return
+    outbox, forwarder, client = _pubsub_outbox, _pubsub_forwarder, _pubsub_redis
+    _pubsub_redis, _pubsub_outbox, _pubsub_forwarder = None, None, None
+    while outbox.full():
+        outbox.get_nowait() # Make room for the stop marker
+    outbox.put_nowait(None)
+    await forwarder
+    await client.aclose()
 
 # Helper function to ensure consistent webhook path formatting
 def format_webhook_path(workflow_id: str, node_id: str) -> str:
     """Create a consistent webhook path format used by both registering and receiving webhooks."""
     return f"/api/webhooks/wh_{workflow_id}_{node_id}"
 
+# Node types that can start a run even when other nodes point at them
+START_NODE_TYPES = frozenset({'input', 'webhook_trigger', 'trigger'})
+
+# Upper bound on how many independent nodes of one run may execute at the same time.
+# Can be overridden per workflow via `metadata["max_parallel_nodes"]`.
+DEFAULT_MAX_PARALLEL_NODES = 4
+
+def get_max_parallel_nodes(workflow: Workflow) -> int:
+    """Read the per-run node concurrency limit from the workflow metadata, falling back to the default."""
+    try:
+        max_parallel = int((workflow.metadata or {}).get('max_parallel_nodes', DEFAULT_MAX_PARALLEL_NODES))
+    except (TypeError, ValueError):
+        logger.warning(f"Invalid max_parallel_nodes for workflow {workflow.id}; using {DEFAULT_MAX_PARALLEL_NODES}.")
+        max_parallel = DEFAULT_MAX_PARALLEL_NODES
+    return max(1, max_parallel)
+
+class NodeAdmission:
+    """
+    Caps how many nodes of a run execute at the same time. Unlike asyncio.Semaphore the limit can be
+    changed while nodes run: raising it admits waiting nodes right away, lowering it lets running nodes
+    finish and admits new ones once the count is below the new limit.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._condition = asyncio.Condition()
+
+    async def resize(self, limit: int) -> None:
+        async with self._condition:
+            grew = limit > self.limit
+            self.limit = limit
+            if grew:
+                self._condition.notify_all()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        async with self._condition:
+            self.active -= 1
+            self._condition.notify(1)
+
+class WorkflowGraph(NamedTuple):
+    """Run-invariant analysis of a workflow's operational graph; model_config nodes only provide settings and are left out."""
+    adjacency: Dict[str, Tuple[str, ...]]
+    # Nodes without incoming edges, and trigger types (which can be start nodes even if targeted by other triggers)
+    start_node_ids: Tuple[str, ...]
+    # How many parents each node reachable from the first start node waits on; copy it per run
+    parent_counts: Dict[str, int]
+
+def compile_graph(workflow: Workflow) -> WorkflowGraph:
+    """
+    Analyzes the workflow graph once and memoizes it on the workflow, so runs of an unchanged workflow
+    (e.g. one triggered by every webhook call) skip the work. Replacing the node or edge list, or adding
+    or removing entries, invalidates it.
+    """
+    key = (id(workflow.nodes), id(workflow.edges), len(workflow.nodes), len(workflow.edges))
+    if workflow._graph is not None and workflow._graph[0] == key:
+        return workflow._graph[1]
+
+    # One pass over the nodes and one over the edges build the adjacency and in-degrees
+    adj: Dict[str, List[str]] = {}
+    in_degree: Dict[str, int] = {}
+    start_types: Dict[str, bool] = {}
+    for node in workflow.nodes:
+        if node.type != 'model_config':
+            adj[node.id] = []
+            in_degree[node.id] = 0
+            start_types[node.id] = node.type in START_NODE_TYPES
+    for edge in workflow.edges:
+        if edge.source in adj and edge.target in adj:
+            adj[edge.source].append(edge.target)
+            in_degree[edge.target] += 1
+    start_node_ids = tuple([node_id for node_id, degree in in_degree.items() if degree == 0 or start_types[node_id]])
+
+    # Only edges reachable from the start node count, so parents in branches that never run don't block.
+    # Edges back into the start node are ignored; nodes on other cycles never become ready.
+    parent_counts: Dict[str, int] = {}
+    if start_node_ids:
+        start_node_id = start_node_ids[0]
+        parent_counts[start_node_id] = 0
+        reachable_stack = [start_node_id]
+        while reachable_stack:
+            for target_id in adj[reachable_stack.pop()]:
+                if target_id == start_node_id:
+                    continue
+                if target_id not in parent_counts:
+                    parent_counts[target_id] = 0
+                    reachable_stack.append(target_id)
+                parent_counts[target_id] += 1
+
+    graph = WorkflowGraph({node_id: tuple(targets) for node_id, targets in adj.items()}, start_node_ids, parent_counts)
+    workflow._graph = (key, graph)
+    return graph
+
+def prepare_workflow(workflow: Workflow) -> None:
+    """Builds a workflow's node lookup and graph analysis ahead of its first run; call when it is saved or loaded."""
+    workflow.build_index()
+    compile_graph(workflow)
+
 # Structures for handling webhook data during tests
 # webhook_test_events: {run_id: {node_id: asyncio.Event}}
 webhook_test_events: Dict[str, Dict[str, asyncio.Event]] = {}
 # webhook_test_data: {run_id: {node_id: received_data}}
 webhook_test_data: Dict[str, Dict[str, Any]] = {}
+# webhook_test_aliases: {run_id: {alias: node_id}}, other spellings of the waiting node ids (see _webhook_node_aliases)
+webhook_test_aliases: Dict[str, Dict[str, str]] = {}
 # active_webhooks_expecting_test_data: {unique_webhook_path_or_identifier: run_id}
 # This helps the generic webhook callback identify which test run to signal.
 # The key could be f"/api/webhooks/wh_{workflow_id}_{node_id}" (the actual path)
 active_webhooks_expecting_test_data: Dict[str, str] = {}
 
+def _stream_unavailable_frame(run_id: str) -> bytes:
+    return _sse_frame(serialization.dumps_bytes({
+        "step": "Error", 
+        "run_id": run_id, 
+        "status": "Failed", 
+        "error": "Log stream unavailable or run already completed.", 
+        "timestamp": time.time(),
+        "is_test_log": True # Assume it could be a test if queue is missing early
+    }))
+
+async def _relayed_log_stream(run_id: str, client_ip: str):
+    """
+    Streams a run of another worker from its Redis channel. Only events published after the client
+    subscribed are received, and the client going away does not abort the run.
+    """
+    pubsub = _pubsub_redis.pubsub()
+    try:
+        await pubsub.subscribe(f"{STREAM_CHANNEL_PREFIX}{run_id}")
+        # Checked after subscribing: if the run is in progress now, its END can't be missed
+        if not await _pubsub_redis.exists(f"{STREAM_ACTIVE_KEY_PREFIX}{run_id}"):
+            logger.warning(f"[SSE Connect {run_id}]: Run not found on any worker. Maybe run finished or never started?")
+            yield _stream_unavailable_frame(run_id)
+            return
+        logger.info(f"[SSE Connect {run_id}]: Client {client_ip} connected through the Redis relay.")
+        async for message in pubsub.listen():
+            if message["type"] != "message":
+                continue
+            frame = message["data"]
+            if frame == _RELAY_END_MARKER:
+                logger.info(f"[SSE Generator End {run_id}]: END event received, closing relayed stream.")
+                break
+            yield frame # Already an SSE frame
+    except asyncio.CancelledError:
+        logger.info(f"[SSE Disconnect {run_id}]: Client {client_ip} disconnected, relayed stream cancelled.")
+    finally:
+        await pubsub.aclose()
+
 async def log_stream_generator(run_id: str, request):
-    """Async generator for streaming log events from an existing queue."""
+    """Async generator for streaming the log events of a run to one client, through its own queue."""
     logger.info(f"[SSE Connect {run_id}]: Attempting to connect stream.")
     client_ip = request.client.host if request.client else "Unknown"
-    queue = stream_queues.get(run_id)
-
-    if not queue:
+    subscribers = stream_queues.get(run_id)
+
+    if subscribers is None:
+        if _pubsub_redis is not None:
+            # The run may be in progress on another worker
+            async for frame in _relayed_log_stream(run_id, client_ip):
+                yield frame
+            return
         logger.warning(f"[SSE Connect {run_id}]: Queue not found for run_id. Maybe run finished or never started?")
-        yield json.dumps({
-            "step": "Error", 
-            "run_id": run_id, 
-            "status": "Failed", 
-            "error": "Log stream unavailable or run already completed.", 
-            "timestamp": time.time(),
-            "is_test_log": True # Assume it could be a test if queue is missing early
-        })
+        yield _stream_unavailable_frame(run_id)
         return
 
-    logger.info(f"[SSE Connect {run_id}]: Client {client_ip} connected, using existing queue.")
+    # Start with what the run logged before this client connected
+    queue = asyncio.Queue(maxsize=SSE_MAX_QUEUE_SIZE)
+    for event in stream_history.get(run_id, ()):
+        queue.put_nowait(event)
+    subscribers.append(queue)
+    logger.info(f"[SSE Connect {run_id}]: Client {client_ip} connected ({len(subscribers)} subscribed).")
     
-    queue_removed_flag = False
+    # No polling: EventSourceResponse watches for the client disconnecting and cancels this generator
     try:
-        while True:
-            if await request.is_disconnected():
-                logger.warning(f"[SSE Disconnect {run_id}]: Client {client_ip} disconnected.")
-                break
-            
-            try:
-                log_event_json = await asyncio.wait_for(queue.get(), timeout=1.0)
-                logger.debug(f"[SSE Generator Yield {run_id}]: Yielding: {log_event_json[:150]}...")
-                yield log_event_json
-                queue.task_done()
-                try:
-                    log_event = json.loads(log_event_json)
-                    if log_event.get("step") == "__END__":
-                        logger.info(f"[SSE Generator End {run_id}]: END event received, closing stream.")
-                        if run_id in stream_queues:
-                            # Don't delete queue immediately, let it drain any final messages
-                            # The execute_workflow_logic's finally block will handle actual queue cleanup if necessary
-                            # but it's usually the generator's responsibility when __END__ is received.
-                            # For safety, let's ensure it's removed if the task is done with it.
-                            # await queue.join() # Ensure all items are processed, might be too blocking
-                            del stream_queues[run_id]
-                            queue_removed_flag = True
-                            logger.info(f"[SSE Cleanup {run_id}]: Removed queue after END event.")
-                        break
-                except json.JSONDecodeError:
-                     logger.error(f"[SSE Generator Error {run_id}]: Internal error decoding JSON from queue: {log_event_json}")
-
-            except asyncio.TimeoutError:
-                # This is normal, just means no new logs for 1s, continue to check disconnect or get next item
-                continue
+        ended = False
+        while not ended:
+            # Take the next frame, plus whatever else is already queued (a backed-up client gets them in one write)
+            frames = [await queue.get()]
+            while len(frames) < SSE_MAX_BATCH_FRAMES and not queue.empty():
+                frames.append(queue.get_nowait())
+            if frames[-1] is _CLIENT_DROPPED:
+                frames.pop()
+                ended = True
+                logger.warning(f"[SSE Generator End {run_id}]: Client {client_ip} fell behind and was dropped, closing stream.")
+            elif isinstance(frames[-1], _EndOfStream):
+                ended = True
+                logger.info(f"[SSE Generator End {run_id}]: END event received, closing stream.")
+            if frames:
+                # Lazy %-formatting: nothing is sliced or formatted unless DEBUG is on
+                logger.debug("[SSE Generator Yield %s]: Yielding %d frame(s): %.150s...", run_id, len(frames), frames[0])
+                # Already SSE frames; consecutive frames are separate events to the client
+                yield frames[0] if len(frames) == 1 else b"".join(frames)
             
     except asyncio.CancelledError:
-         logger.info(f"[SSE Cancelled {run_id}]: Stream cancelled for client {client_ip}.")
+         logger.info(f"[SSE Disconnect {run_id}]: Client {client_ip} disconnected, stream cancelled.")
     finally:
-        if not queue_removed_flag and run_id in stream_queues:
-            logger.warning(f"[SSE Cleanup {run_id}]: Generator for {client_ip} exited (e.g. disconnect/error). Removing its queue reference.")
-            del stream_queues[run_id]
-        elif queue_removed_flag:
-             logger.info(f"[SSE Cleanup {run_id}]: Queue was confirmed removed by END event handler.")
-        else:
-             logger.info(f"[SSE Cleanup {run_id}]: Generator exited, queue for {run_id} was not found or already removed.")
+        # The run is aborted if this was its last client and the run hasn't ended yet
+        _unsubscribe(run_id, queue)
+        logger.info(f"[SSE Cleanup {run_id}]: Generator for {client_ip} exited, queue unsubscribed.")
 
 async def run_workflow(workflow_id: str, input_data: Optional[Dict[str, Any]] = None, is_test_run: bool = False):
     """Start a workflow run (normal or test) and return the run_id"""
@@ -107,17 +464,19 @@ async def run_workflow(workflow_id: str, input_data: Optional[Dict[str, Any]] =
             raise ValueError(f"Workflow {workflow_id} not found")
 
         run_id = str(uuid.uuid4())
-        log_queue = asyncio.Queue()
-        stream_queues[run_id] = log_queue
+        _register_stream(run_id)
         
         log_type = "test" if is_test_run else "normal"
-        logger.info(f"Generated {log_type} run_id: {run_id}, created log queue for workflow: {workflow_id}")
+        logger.info(f"Generated {log_type} run_id: {run_id}, registered log stream for workflow: {workflow_id}")
 
         # Create the background task to execute the workflow
         try:
-            task = asyncio.create_task(execute_workflow_logic(workflow, run_id, log_queue, input_data, is_test_run))
+            task = asyncio.create_task(execute_workflow_logic(workflow, run_id, input_data, is_test_run), name=f"run:{run_id}")
+            # Keep a reference so the task isn't garbage collected mid-run, and so shutdown can cancel it
+            _active_runs[run_id] = task
             # Add callback to handle any exceptions
             def handle_task_exception(task):
+                _active_runs.pop(run_id, None)
                 try:
                     exc = task.exception()
                     if exc:
@@ -137,8 +496,8 @@ async def run_workflow(workflow_id: str, input_data: Optional[Dict[str, Any]] =
         except Exception as e:
             logger.error(f"Failed to create background task for {log_type} run {run_id}: {e}")
             logger.error(traceback.format_exc())
-            if run_id in stream_queues:
-                del stream_queues[run_id]
+            stream_queues.pop(run_id, None)
+            stream_disconnected.pop(run_id, None)
             raise
     except Exception as e:
         logger.error(f"Error in run_workflow (is_test_run={is_test_run}): {e}")
@@ -170,13 +529,43 @@ async def set_workflow_tested_status(workflow_id: str, success: bool):
         workflow.is_active = False # Ensure workflow is not active if test fails
         
     workflows_db[workflow_id] = workflow
-    save_workflows_to_disk()
+    schedule_save() # Written by a worker thread, coalesced with the end-of-run save
     logger.info(f"Workflow {workflow_id} test status updated: {'Success' if success else 'Failed'}. Tested: {workflow.tested}, Last Tested: {workflow.last_tested.isoformat() if workflow.last_tested else 'N/A'}")
 
+def _webhook_node_aliases(node_id: str) -> List[str]:
+    """
+    Spellings of a node id that a test webhook may arrive with: without underscores (e.g. dndnode4 for
+    dndnode_4), and for a numeric suffix the suffix alone, keyed as '_4' (stripped aliases have no '_').
+    """
+    aliases = [node_id.replace("_", "")]
+    _, separator, suffix = node_id.rpartition("_")
+    if separator and suffix.isdigit():
+        aliases.append(f"_{suffix}")
+    return aliases
+
+def _expect_webhook_data(run_id: str, node_id: str) -> asyncio.Event:
+    """Registers a test run's node as waiting for webhook data; the returned event is set when it arrives."""
+    webhook_event = asyncio.Event()
+    webhook_test_events.setdefault(run_id, {})[node_id] = webhook_event
+    aliases = webhook_test_aliases.setdefault(run_id, {})
+    for alias in _webhook_node_aliases(node_id):
+        aliases.setdefault(alias, node_id) # The node waiting first keeps a shared alias, like a scan would
+    return webhook_event
+
+def _stop_expecting_webhook_data(run_id: str, node_id: str) -> None:
+    """Unregisters a node from waiting for webhook data, along with its aliases and any data received."""
+    webhook_test_events.get(run_id, {}).pop(node_id, None)
+    webhook_test_data.get(run_id, {}).pop(node_id, None)
+    aliases = webhook_test_aliases.get(run_id, {})
+    for alias in _webhook_node_aliases(node_id):
+        if aliases.get(alias) == node_id:
+            del aliases[alias]
+
 async def signal_webhook_data_for_test(webhook_path: str, node_id: str, data: Any):
     """Signal that a webhook (identified by its unique path) has received data during a test run."""
-    logger.info(f"[TestSignal] Attempting to signal for webhook_path={webhook_path}, node_id={node_id}")
-    logger.info(f"[TestSignal] Active webhooks expecting data: {list(active_webhooks_expecting_test_data.keys())}")
+    logger.info("[TestSignal] Attempting to signal for webhook_path=%s, node_id=%s", webhook_path, node_id)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f"[TestSignal] Active webhooks expecting data: {list(active_webhooks_expecting_test_data.keys())}")
     
     run_id = active_webhooks_expecting_test_data.get(webhook_path)
     if not run_id:
@@ -185,28 +574,26 @@ async def signal_webhook_data_for_test(webhook_path: str, node_id: str, data: An
 
     # Try to handle parsing mismatches by attempting multiple node ID formats
     found_node_id = None
-    if run_id in webhook_test_events:
-        # First try the exact node_id provided
-        if node_id in webhook_test_events[run_id]:
-            found_node_id = node_id
-        else:
-            # Try to match ignoring underscores
-            node_id_without_underscores = node_id.replace("_", "")
-            for test_node_id in webhook_test_events[run_id].keys():
-                test_node_id_without_underscores = test_node_id.replace("_", "")
-                if node_id_without_underscores == test_node_id_without_underscores:
-                    found_node_id = test_node_id
-                    logger.info(f"[TestSignal] Found matching node_id={test_node_id} for provided={node_id}")
-                    break
-                # Handle cases where digits are at the end (e.g., dndnode_4 vs 4)
-                elif node_id.isdigit() and test_node_id.endswith(f"_{node_id}"):
-                    found_node_id = test_node_id
-                    logger.info(f"[TestSignal] Found node_id={test_node_id} matching digit-only suffix={node_id}")
-                    break
+    waiting_node_ids = webhook_test_events.get(run_id, {})
+    # First try the exact node_id provided
+    if node_id in waiting_node_ids:
+        found_node_id = node_id
+    else:
+        aliases = webhook_test_aliases.get(run_id, {})
+        # Try to match ignoring underscores
+        found_node_id = aliases.get(node_id.replace("_", ""))
+        if found_node_id:
+            logger.info(f"[TestSignal] Found matching node_id={found_node_id} for provided={node_id}")
+        # Handle cases where digits are at the end (e.g., dndnode_4 vs 4)
+        elif node_id.isdigit():
+            found_node_id = aliases.get(f"_{node_id}")
+            if found_node_id:
+                logger.info(f"[TestSignal] Found node_id={found_node_id} matching digit-only suffix={node_id}")
                     
     if not found_node_id:
         logger.warning(f"[TestSignal {run_id}-{node_id}]: No waiting test event found for this node_id in this run.")
-        logger.info(f"[TestSignal] Available node_ids for run {run_id}: {list(webhook_test_events.get(run_id, {}).keys())}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"[TestSignal] Available node_ids for run {run_id}: {list(webhook_test_events.get(run_id, {}).keys())}")
         return False
     
     webhook_test_data.setdefault(run_id, {})[found_node_id] = data
@@ -220,9 +607,48 @@ async def signal_webhook_data_for_test(webhook_path: str, node_id: str, data: An
         logger.info(f"[TestSignal {run_id}-{found_node_id}]: Removed {webhook_path} from active test waiters.")
     return True
 
-async def execute_workflow_logic(workflow: Workflow, run_id: str, log_queue: asyncio.Queue, 
+def _clone_nodes_for_test(nodes: List[Node], run_id: str) -> List[Node]:
+    """Copies nodes so a test run can modify their data (e.g. clear last_payload) without touching the workflow."""
+    copied_nodes = []
+    for node_def in nodes:
+        # Node data is JSON (it is saved as such); orjson round-trips it faster than deepcopy walks it
+        copied_node_data = serialization.loads(serialization.dumps_bytes(node_def.data))
+        if node_def.type == 'webhook_trigger' and 'last_payload' in copied_node_data:
+            logger.info(f"[TestRun {run_id}]: Clearing last_payload for webhook node {node_def.id}")
+            copied_node_data['last_payload'] = None # Or an empty dict {}
+        # The fields come from a validated node, so skip validating them again
+        copied_nodes.append(Node.model_construct(
+            id=node_def.id,
+            type=node_def.type,
+            position=node_def.position,
+            data=copied_node_data
+        ))
+    return copied_nodes
+
+async def execute_workflow_logic(workflow: Workflow, run_id: str,
+                                input_data: Optional[Dict[str, Any]], is_test: bool):
+    """
+    Runs a workflow as a background task. However the run stops (completed, failed, or cancelled on
+    shutdown), its clients get the __END__ event and the run's log stream is unregistered.
+    """
+    try:
+        await _execute_workflow_run(workflow, run_id, input_data, is_test)
+    finally:
+        logger.info(f"[Run {run_id} Finally]: Sending __END__ event to SSE clients.")
+        _publish(run_id, _EndOfStream(serialization.dumps_bytes({"step": "__END__", "run_id": run_id, "is_test_log": is_test, "timestamp": time.time()})))
+        # Sent even when no client is left on this worker: clients following the run through Redis stop here
+        _relay("publish", f"{STREAM_CHANNEL_PREFIX}{run_id}", _RELAY_END_MARKER)
+        _relay("delete", f"{STREAM_ACTIVE_KEY_PREFIX}{run_id}")
+        # Unregister the run: connected clients still drain their queues up to __END__, later ones get an error
+        stream_queues.pop(run_id, None)
+        stream_history.pop(run_id, None)
+        stream_disconnected.pop(run_id, None)
+        _drop_pending_frames(run_id)
+        logger.info(f"[Run {run_id} {'[TEST]' if is_test else ''}]: Background task finished.")
+
+async def _execute_workflow_run(workflow: Workflow, run_id: str,
                                 input_data: Optional[Dict[str, Any]], is_test: bool):
-    """The actual workflow execution logic, run as a background task."""
+    """The actual workflow execution logic, up to storing the run log."""
     workflow_id = workflow.id
     final_run_log = [] 
     overall_success = True # Assume success until a failure occurs
@@ -230,27 +656,18 @@ async def execute_workflow_logic(workflow: Workflow, run_id: str, log_queue: asy
 
     # --- Context for the current run --- 
     node_outputs_for_current_run: Dict[str, Any] = {}
+    # Set once the run's last SSE client is gone; a run without a registered stream counts as disconnected
+    client_disconnected = stream_disconnected.get(run_id)
+    if client_disconnected is None:
+        client_disconnected = asyncio.Event()
+        client_disconnected.set()
 
     # --- Make a copy of nodes if it's a test run to avoid modifying the original --- 
     # This also allows for test-specific modifications, like clearing last_payload
     current_workflow_nodes = workflow.nodes
     if is_test:
         # Deep copy nodes for modification during test run
-        copied_nodes = []
-        for node_def in workflow.nodes:
-            copied_node_data = json.loads(json.dumps(node_def.data)) # Simple deepish copy for dict data
-            if node_def.type == 'webhook_trigger' and 'last_payload' in copied_node_data:
-                logger.info(f"[TestRun {run_id}]: Clearing last_payload for webhook node {node_def.id}")
-                copied_node_data['last_payload'] = None # Or an empty dict {}
-            
-            copied_node = Node(
-                id=node_def.id,
-                type=node_def.type,
-                position=node_def.position,
-                data=copied_node_data
-            )
-            copied_nodes.append(copied_node)
-        current_workflow_nodes = copied_nodes
+        current_workflow_nodes = _clone_nodes_for_test(workflow.nodes, run_id)
         # Update workflow object for this run to use the copied nodes
         # This is a bit hacky; ideally, the workflow object passed around would be a run-specific instance
         # For now, we modify it in-place for the scope of this run, assuming it's not persisted back directly.
@@ -262,113 +679,129 @@ async def execute_workflow_logic(workflow: Workflow, run_id: str, log_queue: asy
     if is_test:
         webhook_test_events[run_id] = {}
         webhook_test_data[run_id] = {}
+        webhook_test_aliases[run_id] = {}
 
-    async def log_and_store(log_entry_data: Dict):
-        """Helper to store log locally, add test flag, and push JSON to the queue."""
-        # Ensure all log entries from this function know if they are part of a test
-        log_entry_data['is_test_log'] = is_test 
-        log_entry_data['timestamp'] = time.time() # Ensure consistent timestamping
-        log_entry_data['run_id'] = run_id # Ensure run_id is always present
+    # Fields every event of this run carries, serialized once for the whole run
+    run_fields = serialization.dumps_bytes({"is_test_log": is_test, "run_id": run_id})[1:-1]
 
-        final_run_log.append(log_entry_data)
+    now = time.time
+
+    def log_and_store(log_entry_data: Dict, timestamp: Optional[float] = None):
+        """
+        Helper to store log locally, add test flag, and push JSON to the run's SSE clients.
+        Events logged back to back may share one `timestamp` instead of reading the clock for each.
+        Pushing never waits (clients that fell behind are dropped), so this is a plain function: logging
+        an event costs no coroutine and no trip through the event loop.
+        """
+        log_entry_data['timestamp'] = timestamp if timestamp is not None else now() # Ensure consistent timestamping
         try:
-            log_json = json.dumps(log_entry_data)
-            logger.debug(f"[Run {run_id} Log Push {'[TEST]' if is_test else ''}]: Pushing: {log_json[:150]}...")
-            await log_queue.put(log_json)
+            # The run-wide fields are appended to the serialized event as pre-serialized bytes
+            log_json = _with_run_fields(serialization.dumps_bytes(_stream_entry(log_entry_data)), run_fields)
         except Exception as e:
-             logger.error(f"[Run {run_id} Log Push Error]: Failed to push log to queue: {e}", exc_info=True)
+            log_json = None
+            logger.error(f"[Run {run_id} Log Push Error]: Failed to serialize log entry: {e}", exc_info=True)
+        # Ensure all stored log entries know if they are part of a test, and always carry run_id
+        log_entry_data['is_test_log'] = is_test 
+        log_entry_data['run_id'] = run_id
+
+        final_run_log.append(log_entry_data)
+        if log_json is not None:
+            logger.debug("[Run %s Log Push %s]: Pushing: %.150s...", run_id, '[TEST]' if is_test else '', log_json)
+            _publish(run_id, log_json)
 
     start_log_message = "Starting Test Workflow Execution" if is_test else "Starting Workflow Execution"
-    await log_and_store({"step": start_log_message, "status": "Pending", "data_summary": str(input_data)[:100]})
+    log_and_store({"step": start_log_message, "status": "Pending", "data_summary": serialization.summarize(input_data)})
     logger.info(f"[Run {run_id} {'[TEST]' if is_test else ''}]: {start_log_message}")
 
-    nodes_dict = {node.id: node for node in current_workflow_nodes} # Use current_workflow_nodes
-    adj: Dict[str, List[str]] = {node.id: [] for node in current_workflow_nodes if node.type != 'model_config'}
-    
-    # Build adjacency list, excluding edges from/to model_config for main flow
-    for edge in workflow.edges:
-        source_node = nodes_dict.get(edge.source) # Use nodes_dict which is from current_workflow_nodes
-        target_node = nodes_dict.get(edge.target)
-        
-        # Regular operational edge
-        if source_node and target_node and source_node.type != 'model_config' and target_node.type != 'model_config':
-            if edge.source in adj: adj[edge.source].append(edge.target)
-            # else: logger.warning(f"[Run {run_id}]: Source node {edge.source} not in adj list (might be model_config or error)")
-        # elif source_node and source_node.type == 'model_config':
-            # logger.debug(f"[Run {run_id}]: Skipping edge from model_config {edge.source} for main flow graph.")
-        # elif target_node and target_node.type == 'model_config':
-            # logger.debug(f"[Run {run_id}]: Skipping edge to model_config {edge.target} for main flow graph.")
-
-    # Identify start nodes (not model_config, and either no incoming edges or specific trigger types)
-    all_target_ids_in_operational_graph = set()
-    for source_id in adj: 
-        for target_id in adj[source_id]:
-            all_target_ids_in_operational_graph.add(target_id)
-
-    start_node_candidates = [
-        node.id for node in current_workflow_nodes 
-        if node.type != 'model_config' and 
-           (node.id not in all_target_ids_in_operational_graph or 
-            node.type in ['input', 'webhook_trigger', 'trigger']) # Ensure trigger types can be start nodes even if targeted by other triggers (less common)
-    ]
+    graph = compile_graph(workflow)
+    # Test runs work on copies of the nodes; their data is what the scheduled nodes must use
+    get_run_node = {node.id: node for node in current_workflow_nodes}.get if is_test else workflow.get_node
+    start_node_candidates = graph.start_node_ids
+    adj = graph.adjacency
 
     if not start_node_candidates:
         err_msg = "Workflow has no clear starting node (excluding Model Configuration nodes)."
-        await log_and_store({"step": "Initialization Error", "status": "Failed", "error": err_msg})
+        log_and_store({"step": "Initialization Error", "status": "Failed", "error": err_msg})
         overall_success = False
     else:
         start_node_id = start_node_candidates[0] # Taking the first candidate for now
         logger.info(f"[Run {run_id} {'[TEST]' if is_test else ''}]: Identified start node: {start_node_id}")
         
+        # Kahn-style scheduling: a node becomes ready once every parent that can run in this run has finished
+        waiting_on = dict(graph.parent_counts)
+        # A join node gets the output of the first parent that finished as its input; every parent's
+        # output is available to its templates.
+        join_inputs: Dict[str, Any] = {}
+
         exec_queue = deque([(start_node_id, input_data)])
-        processed_nodes = set() # For cycle detection in main flow
         max_steps = 100 # Safety break
         steps = 0
         aborted_by_client = False
+        node_admission = NodeAdmission(get_max_parallel_nodes(workflow))
+
+        async def run_one(node_definition: Node, node_label: str, node_input: Any):
+            """
+            Runs a single node while holding a slot of the per-run concurrency limit and reports it as soon as
+            it finishes, not when the whole frontier has. Returns the node's result, or the exception it raised.
+            """
+            try:
+                async with node_admission:
+                    result = await execute_node(node_definition, node_input, workflow, node_outputs_for_current_run)
+            except Exception as e:
+                logger.error(f"[Run {run_id}]: Error executing node {node_definition.id}: {e}", exc_info=e)
+                node_status, node_output, node_error_detail = "Failed", None, str(e)
+                result = e
+            else:
+                node_status, node_output, node_error_detail = "Success", result.output, None
+            log_and_store({
+                "step": f"Finished Node: {node_label} ({node_definition.type})",
+                "node_id": node_definition.id, "node_type": node_definition.type, "status": node_status, 
+                "output_data_summary": serialization.summarize(node_output),
+                "error": node_error_detail
+            })
+            return result
 
         try:
             while exec_queue and steps < max_steps and not execution_error_occurred:
-                if run_id not in stream_queues:
-                    logger.warning(f"[Run {run_id}]: SSE queue disappeared. Aborting execution.")
+                if client_disconnected.is_set():
+                    logger.warning(f"[Run {run_id}]: SSE clients disconnected. Aborting execution.")
                     aborted_by_client = True; overall_success = False; break
 
-                current_node_id, current_data = exec_queue.popleft()
-
-                if current_node_id in processed_nodes and current_node_id != start_node_id:
-                    logger.warning(f"[Run {run_id}]: Node {current_node_id} (operational) already processed. Cycle detected or duplicate path. Skipping.")
-                    continue
-                
-                node = nodes_dict.get(current_node_id)
-                if not node or node.type == 'model_config': # Should not happen if graph building is correct
-                    logger.error(f"[Run {run_id}]: Invalid node {current_node_id} in execution queue or is model_config.")
-                    await log_and_store({"step": f"Execution Error", "node_id": current_node_id, "status": "Failed", "error": "Invalid node in queue"})
-                    overall_success = False; execution_error_occurred = True; break
-
-                node_label = node.data.get('webhook_name', node.data.get('node_name', node.data.get('label', node.id)))
-                # Ensure we are using the potentially modified node from current_workflow_nodes for its data
-                current_node_definition = nodes_dict[current_node_id]
-
-                await log_and_store({
-                    "step": f"Executing Node: {node_label} ({current_node_definition.type})",
-                    "node_id": current_node_definition.id, "node_type": current_node_definition.type, "status": "Pending", 
-                    "input_data_summary": str(current_data)[:100] + ('...' if len(str(current_data)) > 100 else '')
-                })
-                logger.info(f"[Run {run_id} {'[TEST]' if is_test else ''}]: Executing node: {current_node_definition.id} ({node_label} - {current_node_definition.type})")
-
-                node_status = "Pending"
-                node_output = None
-                node_error_detail = None
+                # Pick up a max_parallel_nodes change saved while the run is in progress
+                await node_admission.resize(get_max_parallel_nodes(workflows_db.get(workflow_id, workflow)))
+
+                # Drain everything currently queued into this tick's ready set. Nodes queued together
+                # only depend on nodes that already finished, so they can be executed concurrently.
+                ready_nodes = [] # (node_definition, node_label, node_input)
+                tick_time = now() # Shared by the Pending events of this tick, logged back to back
+                while exec_queue and steps + len(ready_nodes) < max_steps and not execution_error_occurred:
+                    current_node_id, current_data = exec_queue.popleft()
+
+                    node = get_run_node(current_node_id)
+                    if not node or node.type == 'model_config': # Should not happen if graph building is correct
+                        logger.error(f"[Run {run_id}]: Invalid node {current_node_id} in execution queue or is model_config.")
+                        log_and_store({"step": f"Execution Error", "node_id": current_node_id, "status": "Failed", "error": "Invalid node in queue"})
+                        overall_success = False; execution_error_occurred = True; break
+
+                    node_label = node.data.get('webhook_name', node.data.get('node_name', node.data.get('label', node.id)))
+                    # For test runs this is the copied node from current_workflow_nodes, with its modified data
+                    current_node_definition = node
+
+                    log_and_store({
+                        "step": f"Executing Node: {node_label} ({current_node_definition.type})",
+                        "node_id": current_node_definition.id, "node_type": current_node_definition.type, "status": "Pending", 
+                        "input_data_summary": serialization.summarize(current_data)
+                    }, timestamp=tick_time)
+                    logger.info(f"[Run {run_id} {'[TEST]' if is_test else ''}]: Executing node: {current_node_definition.id} ({node_label} - {current_node_definition.type})")
 
-                try:
                     if is_test and current_node_definition.type in ['webhook_trigger', 'webhook']:
                         # Use helper to ensure consistent path format
                         webhook_node_path_key = format_webhook_path(workflow_id, current_node_definition.id)
                         logger.info(f"[TestRun {run_id}] Registering webhook wait path: {webhook_node_path_key}")
-                        webhook_event = asyncio.Event()
-                        webhook_test_events.setdefault(run_id, {})[current_node_definition.id] = webhook_event
+                        webhook_event = _expect_webhook_data(run_id, current_node_definition.id)
                         active_webhooks_expecting_test_data[webhook_node_path_key] = run_id
                         
-                        await log_and_store({
+                        log_and_store({
                             "step": f"Test: Waiting for Webhook: {node_label} ({current_node_definition.type})",
                             "node_id": current_node_definition.id, "status": "Waiting",
                             "message": f"Send data to webhook path {webhook_node_path_key} for node {current_node_definition.id} to continue."
@@ -377,11 +810,13 @@ async def execute_workflow_logic(workflow: Workflow, run_id: str, log_queue: asy
                         
                         webhook_timeout = 300 # 5 minutes for manual testing
                         try:
-                            await asyncio.wait_for(webhook_event.wait(), timeout=webhook_timeout)
+                            # A deadline on the current task; unlike wait_for, no extra task wraps the wait
+                            async with async_timeout(webhook_timeout):
+                                await webhook_event.wait()
+                            tick_time = now() # The wait may have taken minutes
                             current_data = webhook_test_data.get(run_id, {}).get(current_node_definition.id, current_data) # Use received data
-                            await log_and_store({"step": f"Test: Webhook Triggered: {node_label}", "node_id": current_node_definition.id, "status": "Triggered"})
+                            log_and_store({"step": f"Test: Webhook Triggered: {node_label}", "node_id": current_node_definition.id, "status": "Triggered"})
                             logger.info(f"[TestRun {run_id}]: Webhook {current_node_definition.id} ({node_label}) received data.")
-                            node_status = "Success" # Mark webhook trigger as successful for this step in test
                             
                             # Update the node's data with the test payload to reflect successful test
                             current_node_definition.data['last_payload'] = current_data
@@ -389,51 +824,57 @@ async def execute_workflow_logic(workflow: Workflow, run_id: str, log_queue: asy
                             logger.info(f"[TestRun {run_id}]: Updated webhook node {current_node_definition.id} with test data and set dataLoaded flag")
                         except asyncio.TimeoutError:
                             logger.warning(f"[TestRun {run_id}]: Timeout waiting for webhook {current_node_definition.id}")
-                            node_status = "Failed"; node_error_detail = f"Test timed out after {webhook_timeout}s waiting for webhook data."
+                            node_error_detail = f"Test timed out after {webhook_timeout}s waiting for webhook data."
                             overall_success = False; execution_error_occurred = True # This is a test failure
                             # No more processing for this node if webhook times out in test
-                            await log_and_store({"step": f"Test: Webhook Timeout for {node_label}", "node_id": current_node_definition.id, "status": "Failed", "error": node_error_detail})
+                            log_and_store({"step": f"Test: Webhook Timeout for {node_label}", "node_id": current_node_definition.id, "status": "Failed", "error": node_error_detail})
                             break # Stop the entire workflow test on webhook timeout
                         finally:
-                            if webhook_node_path_key in active_webhooks_expecting_test_data: del active_webhooks_expecting_test_data[webhook_node_path_key]
-                            if run_id in webhook_test_events and current_node_definition.id in webhook_test_events[run_id]: del webhook_test_events[run_id][current_node_definition.id]
-                            if run_id in webhook_test_data and current_node_definition.id in webhook_test_data[run_id]: del webhook_test_data[run_id][current_node_definition.id]
-                    
-                    # If not a webhook timeout in test, proceed to execute
-                    if not execution_error_occurred:
-                        # Pass the full workflow object, as execute_node might need to access model_config nodes
-                        # And pass the accumulated run_outputs for templating context
-                        result = execute_node(current_node_definition, current_data, workflow, node_outputs_for_current_run) 
+                            active_webhooks_expecting_test_data.pop(webhook_node_path_key, None)
+                            _stop_expecting_webhook_data(run_id, current_node_definition.id)
+
+                    ready_nodes.append((current_node_definition, node_label, current_data))
+
+                if execution_error_occurred or not ready_nodes:
+                    continue
+
+                # Submit every ready node first and collect afterwards, so independent LLM/API calls overlap
+                # instead of paying their latencies one after another.
+                results = await asyncio.gather(
+                    *(run_one(node_definition, node_label, node_input) for node_definition, node_label, node_input in ready_nodes),
+                    return_exceptions=True
+                )
+
+                # Successors are only queued once the whole frontier finished, so a failure stops the run before them
+                for (current_node_definition, _, _), result in zip(ready_nodes, results):
+                    if isinstance(result, BaseException) and not isinstance(result, Exception):
+                        raise result # Cancellation and interpreter exits are not node failures
+                    if isinstance(result, Exception):
+                        overall_success = False; execution_error_occurred = True
+                    else:
                         node_output = result.output
-                        node_outputs_for_current_run[current_node_definition.id] = node_output # Store output for templating
-                        node_status = "Success"
-                        processed_nodes.add(current_node_id)
+                        # Store output for templating (possibly slimmed by the node, see truncate_full_response)
+                        node_outputs_for_current_run[current_node_definition.id] = result.context_output if result.context_output is not None else node_output
                         steps += 1
 
-                        next_operational_nodes = adj.get(current_node_id, [])
+                        next_operational_nodes = adj.get(current_node_definition.id, ())
                         if not next_operational_nodes:
-                            logger.info(f"[Run {run_id}]: Node {current_node_id} is a terminal operational node.")
-                        else:
-                            for next_node_id_in_flow in next_operational_nodes:
-                                if nodes_dict[next_node_id_in_flow].type != 'model_config': # Should be guaranteed by adj list build
-                                    exec_queue.append((next_node_id_in_flow, node_output))
-                
-                except Exception as node_exc:
-                    logger.error(f"[Run {run_id}]: Error executing node {current_node_definition.id}: {node_exc}", exc_info=True)
-                    node_status = "Failed"; node_error_detail = str(node_exc)
-                    overall_success = False; execution_error_occurred = True
-                
-                await log_and_store({
-                    "step": f"Finished Node: {node_label} ({current_node_definition.type})",
-                    "node_id": current_node_definition.id, "node_type": current_node_definition.type, "status": node_status, 
-                    "output_data_summary": str(node_output)[:100] + ('...' if len(str(node_output)) > 100 else ''),
-                    "error": node_error_detail
-                })
+                            logger.info(f"[Run {run_id}]: Node {current_node_definition.id} is a terminal operational node.")
+                        for next_node_id_in_flow in next_operational_nodes:
+                            if next_node_id_in_flow == start_node_id:
+                                continue
+                            join_inputs.setdefault(next_node_id_in_flow, node_output)
+                            waiting_on[next_node_id_in_flow] -= 1
+                            if waiting_on[next_node_id_in_flow] == 0:
+                                exec_queue.append((next_node_id_in_flow, join_inputs.pop(next_node_id_in_flow)))
 
         except Exception as e_outer:
             logger.error(f"[Run {run_id}]: Unexpected error during main workflow execution loop: {e_outer}", exc_info=True)
-            await log_and_store({"step": "Critical Execution Error", "status": "Failed", "error": str(e_outer)})
+            log_and_store({"step": "Critical Execution Error", "status": "Failed", "error": str(e_outer)})
             overall_success = False; execution_error_occurred = True
+
+        if join_inputs and not execution_error_occurred and not aborted_by_client:
+            logger.warning(f"[Run {run_id}]: Nodes {sorted(join_inputs)} never got all their inputs (cycle in the workflow graph). Skipped.")
         
         # --- End of loop --- 
         final_status_message = "Workflow Execution Ended"
@@ -453,7 +894,7 @@ async def execute_workflow_logic(workflow: Workflow, run_id: str, log_queue: asy
             final_status_message = "Workflow Execution Successful" if not is_test else "Workflow Test Successful"
         
         logger.info(f"[Run {run_id} {'[TEST]' if is_test else ''}]: {final_status_message}. Overall Success: {overall_success}, Status: {final_log_status}")
-        await log_and_store({"step": final_status_message, "status": final_log_status, "error": final_error_detail})
+        log_and_store({"step": final_status_message, "status": final_log_status, "error": final_error_detail})
 
     # If this was a test run, update the workflow's tested status based on overall_success
     if is_test:
@@ -468,49 +909,35 @@ async def execute_workflow_logic(workflow: Workflow, run_id: str, log_queue: asy
                 for node in current_workflow_nodes:
                     if node.type == 'webhook_trigger' and node.data.get('dataLoaded') and node.data.get('last_payload'):
                         # Find corresponding node in original workflow
-                        for orig_node in original_workflow.nodes:
-                            if orig_node.id == node.id:
-                                logger.info(f"[TestRun {run_id}]: Persisting webhook data from test to original workflow for node {node.id}")
-                                orig_node.data['last_payload'] = node.data['last_payload']
-                                orig_node.data['dataLoaded'] = True
-                                break
+                        orig_node = original_workflow.get_node(node.id)
+                        if orig_node:
+                            logger.info(f"[TestRun {run_id}]: Persisting webhook data from test to original workflow for node {node.id}")
+                            orig_node.data['last_payload'] = node.data['last_payload']
+                            orig_node.data['dataLoaded'] = True
                 # Save the updated workflow
                 workflows_db[workflow_id] = original_workflow
-                save_workflows_to_disk()
+                schedule_save()
                 logger.info(f"[TestRun {run_id}]: Updated original workflow with test webhook data")
         
         # Clean up test-specific dictionaries for this run_id
-        if run_id in webhook_test_events: del webhook_test_events[run_id]
-        if run_id in webhook_test_data: del webhook_test_data[run_id]
+        webhook_test_events.pop(run_id, None)
+        webhook_test_data.pop(run_id, None)
+        webhook_test_aliases.pop(run_id, None)
         # Clear any remaining paths for this run_id from active_webhooks_expecting_test_data
         paths_to_clear = [path for path, r_id in active_webhooks_expecting_test_data.items() if r_id == run_id]
         for path in paths_to_clear: del active_webhooks_expecting_test_data[path]
 
-    # Store the full run log and signal end of stream
+    # Store the full run log; execute_workflow_logic then signals the end of the stream
     try:
-        if workflow_id not in workflow_runs: workflow_runs[workflow_id] = []
-        workflow_runs[workflow_id].insert(0, final_run_log)
-        max_runs_to_keep = 20  # Increased from 10 to 20 for in-memory storage
-        if len(workflow_runs[workflow_id]) > max_runs_to_keep: workflow_runs[workflow_id] = workflow_runs[workflow_id][:max_runs_to_keep]
-        
-        # Save to disk in two ways: main runs file and individual archive file
-        save_workflows_to_disk() # Save main runs file
+        # Save in two ways: the run history (Redis run store, or else the main runs file) and the individual archive file.
+        # Neither blocks the event loop; main-file saves from bursts of runs are coalesced.
+        if not await store_run(workflow_id, final_run_log):
+            schedule_save() # Save main runs file
         
         # Also save individual run log with metadata for better archiving
-        save_individual_run_log(workflow_id, run_id, final_run_log)
-        
-        logger.info(f"[Run {run_id} Finally]: Sending __END__ event to SSE queue.")
-        await log_queue.put(json.dumps({"step": "__END__", "run_id": run_id, "is_test_log": is_test, "timestamp": time.time()}))
+        await asyncio.to_thread(save_individual_run_log, workflow_id, run_id, final_run_log)
     except Exception as e_final:
          logger.error(f"[Run {run_id} Finally Error]: {e_final}", exc_info=True)
-    finally:
-        # Final check to ensure queue is removed if generator didn't catch __END__ (e.g., if queue was never consumed)
-        if run_id in stream_queues:
-            logger.warning(f"[Run {run_id} Final Cleanup]: Stream queue still exists. Removing it now.")
-            # await stream_queues[run_id].join() # Attempt to let logs drain
-            del stream_queues[run_id]
-            
-        logger.info(f"[Run {run_id} {'[TEST]' if is_test else ''}]: Background task finished.") 
 
 # --- Helper: Send Webhook Data to a Specific Node ---
 # This is a simplified implementation to bridge webhook callbacks to workflows.
@@ -532,7 +959,7 @@ async def send_webhook_data_to_node(workflow_id: str, node_id: str, payload: Any
         # First: attempt to signal an active *test* workflow, if any.
         # Use helper to ensure consistent path format
         webhook_path_key = format_webhook_path(workflow_id, node_id)
-        logger.info(f"[WebhookBridge] Checking for test run with path: {webhook_path_key}")
+        logger.info("[WebhookBridge] Checking for test run with path: %s", webhook_path_key)
         signalled = await signal_webhook_data_for_test(webhook_path_key, node_id, payload)
         if signalled:
             logger.info(f"[WebhookBridge] Signalled waiting test run for {workflow_id}:{node_id}.")
@@ -1,28 +1,119 @@
 import os
 import json
+import asyncio
 import logging
+from collections import deque
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 
 from app.models.workflow import Workflow
+from app.utils import serialization
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-# Custom JSON encoder to handle datetime objects
+# Custom JSON encoder to handle datetime objects (and bounded payload deques, saved as lists)
 class DateTimeEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, datetime):
             return obj.isoformat()
+        if isinstance(obj, deque):
+            return list(obj)
         return super().default(obj)
 
 # In-memory databases
 workflows_db: Dict[str, Workflow] = {}  # Workflow ID -> Workflow
-workflow_runs: Dict[str, List[List[Dict[str, Any]]]] = {}  # Workflow ID -> List of runs (each run is a list of log entries)
+workflow_runs: Dict[str, deque] = {}  # Workflow ID -> Bounded deque of runs, newest first (each run is a list of log entries)
+
+# Runs kept in memory per workflow; older runs are still available from the individual run archive
+MAX_RUNS_PER_WORKFLOW = 20
+
+def run_history(workflow_id: str) -> deque:
+    """Returns a workflow's in-memory run history; appendleft a run and the oldest one beyond the cap is evicted."""
+    runs = workflow_runs.get(workflow_id)
+    if not isinstance(runs, deque):
+        runs = deque(runs or (), maxlen=MAX_RUNS_PER_WORKFLOW)
+        workflow_runs[workflow_id] = runs
+    return runs
+
+# Optional Redis copy of the run history (RUNS_STORE_TYPE=redis, with REDIS_HOST / REDIS_PORT / REDIS_PASSWORD),
+# so recent runs survive restarts and are shared between workers (reads go through refresh_run_history).
+# Each workflow's list is capped like the in-memory one and expires RUNS_TTL_SECONDS after the workflow's last run.
+RUNS_STORE_TYPE = os.environ.get("RUNS_STORE_TYPE", "").strip().lower()
+RUNS_TTL_SECONDS = int(os.environ.get("RUNS_TTL_SECONDS", "86400"))
+RUNS_REDIS_KEY_PREFIX = "runs:"
+_runs_redis = None
+
+async def initialize_run_store():
+    """Connects to the Redis run store if one is configured and loads the run histories kept there."""
+    global _runs_redis
+    if RUNS_STORE_TYPE != 'redis':
+        return
+    try:
+        import redis.asyncio as redis_asyncio
+        client = redis_asyncio.Redis(
+            host=os.environ.get('REDIS_HOST', 'localhost'),
+            port=int(os.environ.get('REDIS_PORT', '6379')),
+            password=os.environ.get('REDIS_PASSWORD')
+        )
+        loaded = 0
+        async for key in client.scan_iter(match=f"{RUNS_REDIS_KEY_PREFIX}*"):
+            key = key.decode() if isinstance(key, bytes) else key
+            runs = await client.lrange(key, 0, MAX_RUNS_PER_WORKFLOW - 1)
+            # Redis has the runs of every worker, newest first like the in-memory history
+            workflow_runs[key[len(RUNS_REDIS_KEY_PREFIX):]] = deque(
+                (serialization.loads(run) for run in runs), maxlen=MAX_RUNS_PER_WORKFLOW)
+            loaded += 1
+        _runs_redis = client
+        logger.info(f"Redis run store enabled; loaded run history of {loaded} workflows")
+    except Exception as e:
+        logger.warning(f"Could not enable Redis run store, keeping run history in memory only: {e}")
+
+async def refresh_run_history(workflow_id: str) -> None:
+    """
+    With the Redis run store, reloads a workflow's in-memory run history from Redis, so runs finished on
+    other workers are included. Without it (or if Redis can't be read) the in-memory history is kept as is.
+    """
+    if _runs_redis is None:
+        return
+    try:
+        runs = await _runs_redis.lrange(f"{RUNS_REDIS_KEY_PREFIX}{workflow_id}", 0, MAX_RUNS_PER_WORKFLOW - 1)
+    except Exception as e:
+        logger.error(f"Error reading run history of workflow {workflow_id} from Redis: {e}")
+        return
+    workflow_runs[workflow_id] = deque((serialization.loads(run) for run in runs), maxlen=MAX_RUNS_PER_WORKFLOW)
+
+async def close_run_store():
+    """Closes the Redis run store connection, if any; called from the app lifespan on shutdown."""
+    global _runs_redis
+    if _runs_redis is not None:
+        client, _runs_redis = _runs_redis, None
+        await client.aclose()
+
+async def store_run(workflow_id: str, run_log: List[Dict[str, Any]]) -> bool:
+    """
+    Adds a finished run to the front of the workflow's run history. Returns True if the run was persisted
+    to the Redis run store; otherwise it is only saved with the runs file (see schedule_save).
+    """
+    run_history(workflow_id).appendleft(run_log) # Bounded: the oldest run beyond the cap is dropped
+    if _runs_redis is None:
+        return False
+    key = f"{RUNS_REDIS_KEY_PREFIX}{workflow_id}"
+    try:
+        async with _runs_redis.pipeline(transaction=False) as pipe:
+            pipe.lpush(key, serialization.dumps_bytes(run_log))
+            pipe.ltrim(key, 0, MAX_RUNS_PER_WORKFLOW - 1)
+            pipe.expire(key, RUNS_TTL_SECONDS)
+            await pipe.execute()
+        return True
+    except Exception as e:
+        # The run is still in memory and in the individual run archive
+        logger.error(f"Error storing run of workflow {workflow_id} in Redis: {e}")
+        return False
 
 # For webhooks
 webhook_registry: Dict[str, Dict[str, str]] = {}  # Path -> {workflow_id, node_id}
-webhook_payloads: Dict[str, List[Dict[str, Any]]] = {}  # Path -> List of payloads
+webhook_payloads: Dict[str, List[Dict[str, Any]]] = {}  # Path -> List (or bounded deque) of payloads
 
 # For backwards compatibility with older code
 webhook_mapping: Dict[str, Dict[str, str]] = {}  # Legacy webhook mapping
@@ -33,10 +124,21 @@ workflows_file = os.path.join(data_dir, "workflows.json")
 runs_file = os.path.join(data_dir, "runs.json")
 webhook_registry_file = os.path.join(data_dir, "webhook_registry.json")
 webhook_payloads_file = os.path.join(data_dir, "webhook_payloads.json")
+# Append-only log of payloads received since webhook_payloads_file was last written in full
+webhook_payloads_log_file = os.path.join(data_dir, "webhook_payloads.jsonl")
 
 # Create runs directory for individual run logs
 runs_dir = os.path.join(data_dir, "runs")
 
+# Saves requested through schedule_save within this window are coalesced into one write
+SAVE_DEBOUNCE_SECONDS = float(os.environ.get("SAVE_DEBOUNCE_SECONDS", "0.1"))
+_save_pending = False
+_save_task: Optional[asyncio.Task] = None
+
+# After this many appends to the payload log, the payload store is rewritten in full and the log truncated
+WEBHOOK_PAYLOAD_COMPACT_EVERY = int(os.environ.get("WEBHOOK_PAYLOAD_COMPACT_EVERY", "1000"))
+_payload_log_appends = 0
+
 # Ensure directories exist
 os.makedirs(data_dir, exist_ok=True)
 os.makedirs(runs_dir, exist_ok=True)
@@ -58,7 +160,7 @@ def load_workflows_from_disk():
         # Load runs data
         if os.path.exists(runs_file):
             with open(runs_file, 'r') as f:
-                workflow_runs = json.load(f)
+                workflow_runs = {k: deque(v, maxlen=MAX_RUNS_PER_WORKFLOW) for k, v in json.load(f).items()}
             logger.info(f"Loaded run logs from {runs_file}")
             
             # Also load any archived individual run logs
@@ -83,18 +185,31 @@ def load_workflows_from_disk():
                 webhook_payloads = json.load(f)
             logger.info(f"Loaded webhook payloads from {webhook_payloads_file}")
         
+        # Replay payloads appended since the last full save
+        if os.path.exists(webhook_payloads_log_file):
+            replayed = _replay_webhook_payload_log()
+            logger.info(f"Replayed {replayed} webhook payloads from {webhook_payloads_log_file}")
+        
     except Exception as e:
         logger.error(f"Error loading data from disk: {e}", exc_info=True)
 
-def save_workflows_to_disk():
-    """Save all workflows to disk using a safer temp file approach"""
-    files_to_save = [
+def _snapshot_files() -> List[tuple]:
+    """Copies the in-memory stores into (file path, data) pairs that can be written while the stores keep changing."""
+    files = [
         (workflows_file, {k: v.dict() for k, v in workflows_db.items()}),
-        (runs_file, workflow_runs),
-        (webhook_registry_file, webhook_registry),
-        (webhook_payloads_file, webhook_payloads)
+        (webhook_registry_file, dict(webhook_registry)),
+        (webhook_payloads_file, dict(webhook_payloads))
     ]
+    # With the Redis run store, runs are persisted one at a time as they finish, not by rewriting the runs file
+    if _runs_redis is None:
+        files.insert(1, (runs_file, {k: list(v) for k, v in workflow_runs.items()}))
+    return files
+
+def save_workflows_to_disk():
+    """Save all workflows to disk using a safer temp file approach"""
+    _write_files(_snapshot_files())
 
+def _write_files(files_to_save: List[tuple]):
     for file_path, data_content in files_to_save:
         temp_file_path = file_path + ".tmp"
         try:
@@ -125,6 +240,36 @@ def save_workflows_to_disk():
             # Decide if you want to re-raise or just log the error for this specific file
             # For now, it logs and continues to try saving other files.
 
+def schedule_save():
+    """
+    Requests a save_workflows_to_disk without blocking the caller.
+    Requests made while a save is pending are coalesced, so a burst of runs costs one write; the files
+    are written in a worker thread. Outside a running event loop the save happens immediately.
+    """
+    global _save_pending, _save_task
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        save_workflows_to_disk()
+        return
+    _save_pending = True
+    if _save_task is None or _save_task.done():
+        _save_task = loop.create_task(_flush_pending_saves())
+
+async def _flush_pending_saves():
+    global _save_pending
+    # A request arriving during a write sets the flag again and gets its own (coalesced) write
+    while _save_pending:
+        await asyncio.sleep(SAVE_DEBOUNCE_SECONDS)
+        _save_pending = False
+        # Snapshot on the event loop so the thread never iterates a dict that is being modified
+        await asyncio.to_thread(_write_files, _snapshot_files())
+
+async def flush_saves():
+    """Waits for a scheduled save to be written; called from the app lifespan on shutdown."""
+    if _save_task is not None and not _save_task.done():
+        await _save_task
+
 def save_webhooks_to_disk():
     """Save webhook registry to disk using a safer temp file approach."""
     # This is a subset of what save_workflows_to_disk now handles,
@@ -145,11 +290,15 @@ def save_webhooks_to_disk():
 
 def save_webhook_payloads_to_disk():
     """Save webhook payloads to disk using a safer temp file approach"""
+    global _payload_log_appends
     temp_file_path = webhook_payloads_file + ".tmp"
     try:
         with open(temp_file_path, 'w') as f:
             json.dump(webhook_payloads, f, indent=2, cls=DateTimeEncoder)
         os.replace(temp_file_path, webhook_payloads_file)
+        # Everything in the payload log is now part of the full file
+        open(webhook_payloads_log_file, 'wb').close()
+        _payload_log_appends = 0
         logger.info(f"Saved {len(webhook_payloads)} webhook payloads to disk")
     except Exception as e:
         logger.error(f"Error saving webhook payloads to disk: {e}")
@@ -159,6 +308,41 @@ def save_webhook_payloads_to_disk():
             except Exception as e_remove:
                 logger.error(f"Error removing temporary webhook payloads file {temp_file_path}: {e_remove}")
 
+def append_webhook_payload(webhook_id: str, entry: Dict[str, Any]):
+    """
+    Persists one received webhook payload by appending a line to the payload log, so the cost of a webhook
+    doesn't grow with everything stored before it. Every WEBHOOK_PAYLOAD_COMPACT_EVERY appends the log
+    is folded into webhook_payloads_file.
+    """
+    global _payload_log_appends
+    try:
+        with open(webhook_payloads_log_file, 'ab') as f:
+            f.write(serialization.dumps_bytes({"id": webhook_id, "payload": entry}) + b"\n")
+    except Exception as e:
+        logger.error(f"Error appending webhook payload to {webhook_payloads_log_file}: {e}")
+        return
+    _payload_log_appends += 1
+    if _payload_log_appends >= WEBHOOK_PAYLOAD_COMPACT_EVERY:
+        save_webhook_payloads_to_disk()
+
+def _replay_webhook_payload_log() -> int:
+    """Adds the payloads in the payload log to webhook_payloads; returns how many were added."""
+    replayed = 0
+    with open(webhook_payloads_log_file, 'rb') as f:
+        for line in f:
+            try:
+                record = serialization.loads(line)
+            except ValueError:
+                # A line cut short by a crash mid-append; everything before it is intact
+                logger.warning(f"Skipping unreadable line in {webhook_payloads_log_file}")
+                continue
+            store = webhook_payloads.setdefault(record["id"], [])
+            # A full save may have happened after the append without truncating the log
+            if isinstance(store, (list, deque)) and record["payload"] not in store:
+                store.append(record["payload"])
+                replayed += 1
+    return replayed
+
 def save_individual_run_log(workflow_id: str, run_id: str, run_log: List[Dict[str, Any]]):
     """Save an individual run log to its own file for better archiving"""
     if not run_log:
@@ -228,7 +412,7 @@ def get_run_logs(workflow_id: str, limit: int = 50, include_archived: bool = Tru
         List of run logs with metadata
     """
     # Get in-memory logs
-    active_logs = workflow_runs.get(workflow_id, [])
+    active_logs = list(workflow_runs.get(workflow_id, ()))
     
     if not include_archived:
         return active_logs[:limit]
@@ -0,0 +1,102 @@
+import json
+import logging
+import math
+import re
+import reprlib
+from typing import Any, Union
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# orjson is a much faster C implementation of JSON encoding/decoding.
+# It is optional: without it we fall back to the standard library json module.
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+    logger.info("orjson not installed; using the standard json module for serialization.")
+
+# orjson reads integers outside the 64-bit range as floats; documents with a run of 19+ digits
+# (somewhere, even inside a string) are parsed by the json module, which keeps them exact.
+_LONG_DIGITS = re.compile(r'\d{19}')
+_LONG_DIGITS_BYTES = re.compile(rb'\d{19}')
+
+def _has_non_finite_float(value: Any) -> bool:
+    """True if `value` contains NaN or +/-Infinity, which orjson writes as null and json keeps."""
+    if isinstance(value, float):
+        return not math.isfinite(value)
+    if isinstance(value, dict):
+        return any(_has_non_finite_float(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_has_non_finite_float(item) for item in value)
+    return False
+
+def dumps(value: Any, indent: bool = False) -> str:
+    """
+    Serialize a value to a JSON string, using orjson when available.
+    With `indent=True` the output uses 2-space indentation like json.dumps(value, indent=2).
+    Values orjson cannot handle (integers above 64 bits) or would change (NaN and Infinity, which it
+    writes as null) are serialized by the json module instead.
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            encoded = orjson.dumps(value, option=option)
+        except TypeError:
+            pass
+        else:
+            if b'null' not in encoded or not _has_non_finite_float(value):
+                return encoded.decode('utf-8')
+    return json.dumps(value, indent=2 if indent else None)
+
+def dumps_bytes(value: Any) -> bytes:
+    """
+    Serialize a value to compact UTF-8 JSON bytes, ready to be sent as a request body.
+    orjson produces bytes directly, so no intermediate str is created. Falls back to json like dumps().
+    """
+    if orjson is not None:
+        try:
+            encoded = orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+        else:
+            if b'null' not in encoded or not _has_non_finite_float(value):
+                return encoded
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    """
+    Parse a JSON document, using orjson when available.
+    Input orjson rejects but json accepts (NaN, Infinity) or would read differently (integers above
+    64 bits) is parsed by the json module; invalid input raises json.JSONDecodeError either way.
+    """
+    if orjson is not None:
+        long_digits = _LONG_DIGITS if isinstance(data, str) else _LONG_DIGITS_BYTES
+        if long_digits.search(data) is None:
+            try:
+                return orjson.loads(data)
+            except orjson.JSONDecodeError:
+                pass
+    try:
+        return json.loads(data)
+    except UnicodeDecodeError as e:
+        # json.loads decodes bytes before parsing; report bytes that aren't text like any other invalid input
+        raise json.JSONDecodeError(f"Invalid {e.encoding} data: {e.reason}", data.decode('utf-8', 'replace'), e.start) from e
+
+# Bounded repr for previews: only the first few items of large (nested) containers are rendered
+_previewer = reprlib.Repr()
+_previewer.maxstring = 100
+_previewer.maxother = 100
+_previewer.maxdict = 10
+_previewer.maxlist = 10
+_previewer.maxlevel = 3
+
+def summarize(value: Any, limit: int = 100) -> str:
+    """
+    Short preview of a value for logs and output summaries.
+    Unlike str(value)[:limit], a multi-MB payload is not stringified in full just to keep its first characters.
+    """
+    text = value if isinstance(value, str) else _previewer.repr(value)
+    return text[:limit] + ('...' if len(text) > limit else '')
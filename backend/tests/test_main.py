@@ -1,5 +1,5 @@
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock # Added MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock # Added MagicMock
 from app.main import app # Corrected import path
 from app.models.workflow import Workflow, Node, Edge # Added workflow models
 from app.utils.persistence import workflows_db, webhook_registry, webhook_payloads, webhook_mapping # Corrected imports here
@@ -399,6 +399,8 @@ def test_register_webhook_and_list_registry(mock_uuid, mock_save_disk):
     assert webhook_registry[expected_internal_path]["workflow_id"] == sample_workflow_id
     assert webhook_registry[expected_internal_path]["node_id"] == node_id
     assert webhook_registry[expected_internal_path]["webhook_id"] == mock_generated_uuid
+    assert isinstance(webhook_registry[expected_internal_path]["created_at"], int)
+    assert webhook_mapping[mock_generated_uuid]["created_at"] == webhook_registry[expected_internal_path]["created_at"]
     assert mock_generated_uuid in webhook_mapping
     assert webhook_mapping[mock_generated_uuid]["internal_path"] == expected_internal_path
     assert expected_internal_path in webhook_payloads # Should be initialized
@@ -551,6 +553,11 @@ def test_handle_internal_webhook_callback(mock_uuid, mock_signal_test, mock_run_
     stored_payload = webhook_payloads[internal_path_segment_a]
     assert stored_payload["payload"] == query_params_payload_a
 
+    # A3: Non-JSON bodies still fall back to form data after the raw body has been read
+    response_post_form_a = client.post(full_internal_path_a, data={"event": "form_A"})
+    assert response_post_form_a.status_code == 200
+    assert webhook_payloads[internal_path_segment_a]["payload"] == {"event": "form_A"}
+
     # --- Test Scenario B: Webhook Auto-registration ---
     auto_reg_wf_id = sample_workflow_id
     auto_reg_node_id = "node-auto-reg-b"
@@ -596,4 +603,89 @@ def test_handle_internal_webhook_callback(mock_uuid, mock_signal_test, mock_run_
     workflows_db.clear()
     webhook_registry.clear()
     webhook_mapping.clear()
-    webhook_payloads.clear()
\ No newline at end of file
+    webhook_payloads.clear()
+
+
+@patch('app.services.model_config_service.litellm_completion')
+def test_model_config_test_endpoint(mock_completion):
+    mock_response = MagicMock()
+    mock_response.choices[0].message.content = "Hi!"
+    mock_response.usage.dict.return_value = {"total_tokens": 2}
+    mock_completion.return_value = mock_response
+
+    response = client.post("/api/model_config/test", json={"config_name": "Default", "model": "gpt-test", "api_key": "sk-test"})
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "success"
+    assert response.json()["response"] == "Hi!"
+    assert mock_completion.call_args.kwargs["model"] == "gpt-test"
+
+
+def test_api_consumer_test_endpoint():
+    import httpx
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.headers["Authorization"].startswith("Basic ")
+        return httpx.Response(200, json={"pong": True})
+
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch('app.services.api_consumer_service._CLIENT', mock_client):
+        response = client.post("/api/api_consumer/test", json={
+            "url": "https://api.example.com/ping", "method": "GET", "query_params": '{"q": "1"}',
+            "auth_type": "basic", "basic_username": "user", "basic_password": "pass"
+        })
+
+    assert response.status_code == 200
+    assert response.json()["response"] == {"pong": True}
+    assert response.json()["url"] == "https://api.example.com/ping?q=1"
+
+
+def test_api_consumer_test_endpoint_returns_non_json_body_as_text():
+    import httpx
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content="<html>café</html>".encode("latin-1"), headers={"Content-Type": "text/html; charset=iso-8859-1"})
+
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch('app.services.api_consumer_service._CLIENT', mock_client):
+        response = client.post("/api/api_consumer/test", json={
+            "url": "https://www.example.com/", "method": "GET", "response_handling": "json"
+        })
+
+    assert response.status_code == 200
+    assert response.json()["response"] == "<html>café</html>"
+
+
+def test_api_consumer_test_endpoint_previews_binary_response():
+    import base64
+    import httpx
+
+    payload = bytes(range(256)) * 100  # 25600 bytes
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=payload, headers={"Content-Type": "application/octet-stream"})
+
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch('app.services.api_consumer_service._CLIENT', mock_client):
+        response = client.post("/api/api_consumer/test", json={
+            "url": "https://files.example.com/blob", "method": "GET", "response_handling": "binary"
+        })
+
+    assert response.status_code == 200
+    preview = response.json()["response"]
+    assert preview["content_length"] == len(payload)
+    assert preview["preview_size"] == 10000
+    assert base64.b64decode(preview["data_preview"]) == payload[:10000]
+
+
+def test_lifespan_initializes_and_shuts_down_services():
+    with patch('app.main.node_execution.initialize', new_callable=AsyncMock) as mock_init, \
+         patch('app.main.node_execution.shutdown', new_callable=AsyncMock) as mock_shutdown, \
+         patch('app.main.api_consumer_service.initialize', new_callable=AsyncMock), \
+         patch('app.main.api_consumer_service.shutdown', new_callable=AsyncMock), \
+         patch('app.main.load_workflows_from_disk'):
+        with TestClient(app) as lifespan_client:
+            assert lifespan_client.get("/").status_code == 200
+            mock_init.assert_awaited_once()
+            mock_shutdown.assert_not_awaited()
+        mock_shutdown.assert_awaited_once()
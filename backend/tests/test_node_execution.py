@@ -0,0 +1,737 @@
+import asyncio
+import base64
+import json
+import httpx
+import litellm
+import pytest
+import subprocess
+import sys
+from unittest.mock import patch, AsyncMock, MagicMock
+
+from app.models.workflow import Workflow, Node
+from app.utils import serialization
+from app.services import node_execution
+from app.services.node_execution import (
+    execute_node, execute_webhook_action_node, test_llm_node as run_llm_node_test, _render_prompt_template,
+    _compile_template, _compile_format_template, test_code_node_in_docker as run_code_node_test, _run_docker_command,
+    _TOKEN_CACHE, execute_code_node, _compile_user_code, ensure_code_executor_running, generate_code_with_llm
+)
+
+def _llm_response(content: str):
+    response = MagicMock()
+    response.choices[0].message.content = content
+    response.usage.dict.return_value = {"total_tokens": 3}
+    return response
+
+def _workflow_with(*nodes: Node) -> Workflow:
+    return Workflow(id="wf-node-exec", name="Node Execution", nodes=list(nodes), edges=[])
+
+@patch('app.services.node_execution.litellm_acompletion', new_callable=AsyncMock)
+def test_execute_llm_node_awaits_acompletion(mock_acompletion):
+    mock_acompletion.return_value = _llm_response("Hello there")
+    llm_node = Node(id="llm-1", type="llm", position={"x": 0, "y": 0},
+                    data={"model": "gpt-test", "api_key": "sk-test", "prompt": "Say hi to {{current_input}}"})
+
+    result = asyncio.run(execute_node(llm_node, "Bob", _workflow_with(llm_node), {}))
+
+    assert result.output["status"] == "success"
+    assert result.output["full_response"] == "Hello there"
+    mock_acompletion.assert_awaited_once()
+    assert mock_acompletion.call_args.kwargs["messages"][0]["content"] == "Say hi to Bob"
+
+def test_render_prompt_template_serializes_shared_values_once():
+    payload = {"user": "Bob", "tags": ["a", "b"]}
+    cache = {}
+
+    with patch('app.utils.serialization.dumps', wraps=serialization.dumps) as mock_dumps:
+        rendered = _render_prompt_template("{{first}} / {{second}} / {{first}}", {"first": payload, "second": payload}, cache)
+
+    expected = json.dumps(payload, indent=2)
+    assert rendered == f"{expected} / {expected} / {expected}"
+    assert mock_dumps.call_count == 1
+    assert len(cache) == 1
+
+@patch('app.services.node_execution.litellm_acompletion', new_callable=AsyncMock)
+def test_llm_node_test_substitutes_template_variables_in_one_pass(mock_acompletion):
+    mock_acompletion.return_value = _llm_response("ok")
+    workflow_nodes = [{"id": "hook", "type": "webhook_trigger", "data": {"last_payload": {"msg": "{{missing}}"}}}]
+    node_data = {"model": "gpt-test", "api_key": "sk-test", "prompt": "A={{hook}} B={{missing}} C={{hook}}"}
+
+    result = asyncio.run(run_llm_node_test(node_data, workflow_nodes))
+
+    assert result["status"] == "success"
+    hook_json = json.dumps({"msg": "{{missing}}"}, indent=2)
+    system_prompt = mock_acompletion.call_args.kwargs["messages"][0]["content"]
+    assert system_prompt.startswith(f"A={hook_json} B=")
+    assert system_prompt.endswith(f" C={hook_json}")
+    assert '"node_id": "missing"' in system_prompt
+
+def test_execute_api_consumer_node_uses_async_client():
+    seen_requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen_requests.append(request)
+        return httpx.Response(200, json={"ok": True})
+
+    api_node = Node(id="api-1", type="api_consumer", position={"x": 0, "y": 0},
+                    data={"url": "https://api.example.com/items", "method": "POST",
+                          "headers": '{"X-Trace": "abc"}', "query_params": '{"page": "2"}',
+                          "body": '{"name": "widget"}', "auth_type": "basic",
+                          "basic_username": "user", "basic_password": "pass"})
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as mock_client:
+            with patch('app.services.node_execution._CLIENT', mock_client):
+                return await execute_node(api_node, {}, _workflow_with(api_node), {})
+
+    result = asyncio.run(scenario())
+
+    assert result.output["status_code"] == 200
+    assert result.output["full_response"] == {"ok": True}
+    assert result.output["details"]["url_called"] == "https://api.example.com/items?page=2"
+    request = seen_requests[0]
+    assert request.headers["X-Trace"] == "abc"
+    assert request.headers["Authorization"] == "Basic dXNlcjpwYXNz"
+    assert json.loads(request.content) == {"name": "widget"}
+    assert request.headers["Content-Type"] == "application/json"
+
+def test_api_consumer_oauth2_token_is_cached_between_calls():
+    token_calls = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal token_calls
+        if request.url.path == "/token":
+            token_calls += 1
+            return httpx.Response(200, json={"access_token": "tok-1", "expires_in": 600})
+        assert request.headers["Authorization"] == "Bearer tok-1"
+        return httpx.Response(200, json={"ok": True})
+
+    api_node = Node(id="api-oauth", type="api_consumer", position={"x": 0, "y": 0},
+                    data={"url": "https://api.example.com/data", "method": "GET", "auth_type": "oauth2",
+                          "oauth_token_url": "https://auth.example.com/token", "oauth_client_id": "client",
+                          "oauth_client_secret": "secret", "oauth_scope": "read"})
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as mock_client:
+            with patch('app.services.node_execution._CLIENT', mock_client), \
+                 patch.dict('app.services.node_execution._TOKEN_CACHE', clear=True), \
+                 patch.dict('app.services.node_execution._TOKEN_LOCKS', clear=True):
+                workflow = _workflow_with(api_node)
+                return await asyncio.gather(*(execute_node(api_node, {}, workflow, {}) for _ in range(3)))
+
+    results = asyncio.run(scenario())
+
+    assert [r.output["status_code"] for r in results] == [200, 200, 200]
+    assert token_calls == 1
+
+def test_api_consumer_refreshes_rejected_oauth2_token():
+    issued_tokens = iter(["tok-revoked", "tok-fresh"])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/token":
+            return httpx.Response(200, json={"access_token": next(issued_tokens), "expires_in": 600})
+        if request.headers["Authorization"] == "Bearer tok-revoked":
+            return httpx.Response(401)
+        return httpx.Response(200, json={"ok": True})
+
+    api_node = Node(id="api-oauth-401", type="api_consumer", position={"x": 0, "y": 0},
+                    data={"url": "https://api.example.com/data", "method": "GET", "auth_type": "oauth2",
+                          "oauth_token_url": "https://auth.example.com/token", "oauth_client_id": "client",
+                          "oauth_client_secret": "secret", "oauth_scope": "read"})
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as mock_client:
+            with patch('app.services.node_execution._CLIENT', mock_client), \
+                 patch.dict('app.services.node_execution._TOKEN_CACHE', clear=True), \
+                 patch.dict('app.services.node_execution._TOKEN_LOCKS', clear=True):
+                result = await execute_node(api_node, {}, _workflow_with(api_node), {})
+                return result, dict(_TOKEN_CACHE)
+
+    result, token_cache = asyncio.run(scenario())
+
+    assert result.output["status_code"] == 200
+    assert [token for token, _ in token_cache.values()] == ["tok-fresh"]
+
+def test_token_locks_are_dropped_with_their_tokens():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(400, json={"error": "invalid_client"})
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as mock_client:
+            with patch('app.services.node_execution._CLIENT', mock_client), \
+                 patch.dict('app.services.node_execution._TOKEN_CACHE', clear=True), \
+                 patch.dict('app.services.node_execution._TOKEN_LOCKS', clear=True):
+                token = await node_execution._get_oauth2_token("https://auth.example.com/token", "client", "secret", "read", 5)
+                locks_after_failure = dict(node_execution._TOKEN_LOCKS)
+                key = ("https://auth.example.com/token", "client", "read")
+                _TOKEN_CACHE[key] = ("tok-revoked", 0)
+                node_execution._TOKEN_LOCKS[key] = asyncio.Lock()
+                node_execution._invalidate_oauth2_token(*key, "tok-revoked")
+                return token, locks_after_failure, dict(node_execution._TOKEN_LOCKS)
+
+    token, locks_after_failure, locks_after_invalidation = asyncio.run(scenario())
+
+    assert token is None
+    assert locks_after_failure == {} and locks_after_invalidation == {}
+
+def test_semaphore_pools_are_bounded_and_keep_busy_pools():
+    async def scenario():
+        busy = node_execution._api_semaphore("https://busy.example.com/")
+        await busy.acquire()
+        for i in range(node_execution._MAX_SEMAPHORE_POOLS + 10):
+            node_execution._api_semaphore(f"https://host-{i}.example.com/")
+        return busy, dict(node_execution._API_SEMAPHORES)
+
+    with patch.dict('app.services.node_execution._API_SEMAPHORES', clear=True):
+        busy, pools = asyncio.run(scenario())
+
+    assert len(pools) == node_execution._MAX_SEMAPHORE_POOLS
+    assert pools["busy.example.com"] is busy
+    assert "host-0.example.com" not in pools
+
+def test_api_consumer_caps_streamed_response_body():
+    payload = bytes(range(256)) * 1000  # 256000 bytes
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=payload)
+
+    api_node = Node(id="api-binary", type="api_consumer", position={"x": 0, "y": 0},
+                    data={"url": "https://files.example.com/blob", "method": "GET",
+                          "response_handling": "binary", "max_response_bytes": 100001})
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as mock_client:
+            with patch('app.services.node_execution._CLIENT', mock_client), \
+                 patch('app.services.node_execution._RESPONSE_CHUNK_SIZE', 4096):
+                return await execute_node(api_node, {}, _workflow_with(api_node), {})
+
+    result = asyncio.run(scenario())
+
+    assert result.output["details"]["response_truncated"] is True
+    assert result.output["full_response"]["data"] == base64.b64encode(payload[:100001]).decode("ascii")
+
+def test_api_consumer_retries_only_retryable_statuses():
+    attempts = {"/flaky": 0, "/missing": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        attempts[request.url.path] += 1
+        if request.url.path == "/missing":
+            return httpx.Response(404, json={"error": "not found"})
+        if attempts["/flaky"] < 3:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"ok": True})
+
+    def api_node(path: str) -> Node:
+        return Node(id=f"api{path.replace('/', '-')}", type="api_consumer", position={"x": 0, "y": 0},
+                    data={"url": f"https://api.example.com{path}", "method": "GET", "retry_policy": "simple"})
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as mock_client:
+            with patch('app.services.node_execution._CLIENT', mock_client), \
+                 patch('app.services.node_execution.asyncio.sleep', new_callable=AsyncMock):
+                flaky, missing = api_node("/flaky"), api_node("/missing")
+                return (await execute_node(flaky, {}, _workflow_with(flaky), {}),
+                        await execute_node(missing, {}, _workflow_with(missing), {}))
+
+    flaky_result, missing_result = asyncio.run(scenario())
+
+    assert flaky_result.output["status_code"] == 200
+    assert flaky_result.output["details"]["attempts_made"] == 3
+    assert missing_result.output["status_code"] == 404
+    assert attempts["/missing"] == 1
+
+@patch('app.services.node_execution.litellm_acompletion', new_callable=AsyncMock)
+def test_execute_llm_node_uses_referenced_model_config(mock_acompletion):
+    mock_acompletion.return_value = _llm_response("configured")
+    config_node = Node(id="cfg-1", type="model_config", position={"x": 0, "y": 0},
+                       data={"config_name": "Shared", "model": "gpt-config", "api_key": "sk-config"})
+    llm_node = Node(id="llm-2", type="llm", position={"x": 0, "y": 0},
+                    data={"model_config_id": "cfg-1", "prompt": "Hello"})
+
+    result = asyncio.run(execute_node(llm_node, "input", _workflow_with(llm_node, config_node), {}))
+
+    assert result.output["details"]["model_used"] == "gpt-config"
+    assert mock_acompletion.call_args.kwargs["api_key"] == "sk-config"
+
+def test_webhook_action_body_template_substitutes_input_data_as_json():
+    seen_bodies = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen_bodies.append(json.loads(request.content))
+        return httpx.Response(200, json={"received": True})
+
+    action_node = Node(id="hook-out", type="webhook_action", position={"x": 0, "y": 0},
+                       data={"url": "https://hooks.example.com/in", "method": "POST",
+                             "body": '{"message": {{input_data}}, "source": "{{label}}"}'})
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as mock_client:
+            with patch('app.services.node_execution._CLIENT', mock_client):
+                return await execute_webhook_action_node(action_node, "hi there", {"label": "upstream", "input_data": "shadowed"})
+
+    result = asyncio.run(scenario())
+
+    assert result["status"] == "success"
+    assert seen_bodies == [{"message": "hi there", "source": "upstream"}]
+
+def test_webhook_action_static_body_is_parsed_once():
+    seen_bodies = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen_bodies.append(json.loads(request.content))
+        return httpx.Response(200, json={"received": True})
+
+    action_node = Node(id="hook-static", type="webhook_action", position={"x": 0, "y": 0},
+                       data={"url": "https://hooks.example.com/in", "method": "POST", "body": '{"ping": 1}'})
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as mock_client:
+            with patch('app.services.node_execution._CLIENT', mock_client), \
+                 patch('app.services.node_execution._render_prompt_template') as mock_render:
+                for _ in range(2):
+                    await execute_webhook_action_node(action_node, "ignored", {})
+                return mock_render
+
+    mock_render = asyncio.run(scenario())
+
+    assert seen_bodies == [{"ping": 1}, {"ping": 1}]
+    mock_render.assert_not_called()
+
+def test_webhook_action_caps_streamed_response_body():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, text="a" * 50_000)
+
+    action_node = Node(id="hook-big", type="webhook_action", position={"x": 0, "y": 0},
+                       data={"url": "https://hooks.example.com/in", "method": "POST", "max_response_bytes": 1000})
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as mock_client:
+            with patch('app.services.node_execution._CLIENT', mock_client):
+                return await execute_webhook_action_node(action_node, {"x": 1}, {})
+
+    result = asyncio.run(scenario())
+
+    assert result["full_response_body"] == "a" * 1000
+    assert result["request_details"]["response_truncated"] is True
+
+def test_compiled_template_renders_literals_and_missing_variables():
+    template = "Hi {{name}}, {{missing}}done {{count}}"
+
+    assert _compile_template(template) == (("Hi ", "name"), (", ", "missing"), ("done ", "count"), ("", None))
+    assert _render_prompt_template(template, {"name": "Ada", "count": 3}) == "Hi Ada, done 3"
+
+def test_format_template_escapes_braces_and_handles_any_variable_name():
+    template = 'Return {"id": {{1}}, "again": {{1}}, "from": "{{node-2}}"} }}'
+    assert _compile_format_template(template) == ('Return {{"id": {0}, "again": {0}, "from": "{1}"}} }}}}', ("1", "node-2"))
+    assert _render_prompt_template(template, {"1": 7, "node-2": "x"}) == 'Return {"id": 7, "again": 7, "from": "x"} }}'
+
+@patch('app.services.node_execution.litellm_acompletion', new_callable=AsyncMock)
+def test_execute_llm_node_marks_cacheable_prefix_for_anthropic(mock_acompletion):
+    mock_acompletion.return_value = _llm_response("cached")
+    cached_node = Node(id="llm-3", type="llm", position={"x": 0, "y": 0},
+                       data={"model": "anthropic/claude-test", "api_key": "sk-test", "prompt": "Summarize"})
+    uncached_node = Node(id="llm-4", type="llm", position={"x": 0, "y": 0},
+                         data={"model": "anthropic/claude-test", "api_key": "sk-test", "prompt": "Summarize", "caching": False})
+
+    asyncio.run(execute_node(cached_node, "text", _workflow_with(cached_node), {}))
+    cached_kwargs = mock_acompletion.call_args.kwargs
+    asyncio.run(execute_node(uncached_node, "text", _workflow_with(uncached_node), {}))
+    uncached_kwargs = mock_acompletion.call_args.kwargs
+
+    assert cached_kwargs["caching"] is True
+    assert cached_kwargs["messages"][0]["content"] == [{"type": "text", "text": "Summarize", "cache_control": {"type": "ephemeral"}}]
+    assert uncached_kwargs["caching"] is False
+    assert uncached_kwargs["messages"][0]["content"] == "Summarize"
+
+def test_truncate_full_response_only_for_unreferenced_nodes():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"rows": list(range(50))})
+
+    def api_node(node_id):
+        return Node(id=node_id, type="api_consumer", position={"x": 0, "y": 0},
+                    data={"url": "https://api.example.com/rows", "method": "GET", "truncate_full_response": True})
+
+    unreferenced, referenced = api_node("api-a"), api_node("api-b")
+    llm_node = Node(id="llm-5", type="llm", position={"x": 0, "y": 0}, data={"prompt": "Rows: {{api-b}}"})
+    workflow = _workflow_with(unreferenced, referenced, llm_node)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as mock_client:
+            with patch('app.services.node_execution._CLIENT', mock_client):
+                return (await execute_node(unreferenced, {}, workflow, {}),
+                        await execute_node(referenced, {}, workflow, {}))
+
+    unreferenced_result, referenced_result = asyncio.run(scenario())
+
+    assert unreferenced_result.output["full_response"] == {"rows": list(range(50))}
+    assert "full_response" not in unreferenced_result.context_output
+    assert "full_response" not in unreferenced.data["output"]
+    assert unreferenced.data["output"]["response_summary"] == unreferenced_result.output["response_summary"]
+    assert referenced_result.context_output["full_response"] == {"rows": list(range(50))}
+
+@patch('app.services.node_execution.litellm_acompletion', new_callable=AsyncMock)
+def test_execute_llm_node_batch_mode_reports_items_individually(mock_acompletion):
+    async def fake_completion(messages, **kwargs):
+        if "boom" in messages[0]["content"]:
+            raise RuntimeError("rate limited")
+        return _llm_response(messages[0]["content"].upper())
+
+    mock_acompletion.side_effect = fake_completion
+    llm_node = Node(id="llm-batch", type="llm", position={"x": 0, "y": 0},
+                    data={"model": "gpt-test", "api_key": "sk-test", "prompt": "echo {{current_input}}", "batch": True})
+
+    result = asyncio.run(execute_node(llm_node, ["a", "boom", "c"], _workflow_with(llm_node), {}))
+
+    assert mock_acompletion.await_count == 3
+    assert result.output["status"] == "partial"
+    assert [item["status"] for item in result.output["responses"]] == ["success", "error", "success"]
+    assert result.output["responses"][0]["full_response"] == "ECHO A"
+    assert result.output["responses"][1]["error"] == "rate limited"
+    assert result.output["details"]["failed_items"] == 1
+
+@patch('app.services.node_execution.litellm_acompletion', new_callable=AsyncMock)
+def test_llm_batch_calls_are_bounded_per_provider(mock_acompletion):
+    in_flight = 0
+    peak_in_flight = 0
+
+    async def fake_completion(messages, **kwargs):
+        nonlocal in_flight, peak_in_flight
+        in_flight += 1
+        peak_in_flight = max(peak_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return _llm_response("ok")
+
+    mock_acompletion.side_effect = fake_completion
+    llm_node = Node(id="llm-bounded", type="llm", position={"x": 0, "y": 0},
+                    data={"model": "openai/gpt-test", "api_key": "sk-test", "prompt": "{{current_input}}", "batch": True})
+
+    with patch('app.services.node_execution.MAX_LLM_CONCURRENCY', 2), \
+         patch.dict('app.services.node_execution._LLM_SEMAPHORES', clear=True):
+        result = asyncio.run(execute_node(llm_node, list(range(6)), _workflow_with(llm_node), {}))
+
+    assert result.output["status"] == "success"
+    assert mock_acompletion.await_count == 6
+    assert peak_in_flight == 2
+
+def test_code_node_test_reuses_warm_executor_and_installed_requirements():
+    commands = []
+    worker_requests = []
+
+    async def fake_run(command, input_text=None, timeout=60):
+        commands.append(command)
+        await asyncio.sleep(0.01)
+        return subprocess.CompletedProcess(command, 0, stdout=b"", stderr=b"")
+
+    async def fake_worker(script, input_json, timeout):
+        worker_requests.append((script, input_json))
+        stdout = b"\x1e" + json.dumps({"status": "success", "result": {"sum": 3}}).encode()
+        return subprocess.CompletedProcess(["python"], 0, stdout=stdout, stderr=b"")
+
+    code = "def execute(input_data):\n    return {'sum': input_data['a'] + input_data['b']}"
+    with patch('app.services.node_execution._run_docker_command', side_effect=fake_run), \
+         patch('app.services.node_execution._run_in_executor_worker', side_effect=fake_worker), \
+         patch('app.services.node_execution._code_executor_ready', True), \
+         patch.dict('app.services.node_execution._INSTALLED_REQUIREMENTS', clear=True), \
+         patch.dict('app.services.node_execution._REQUIREMENTS_LOCKS', clear=True):
+        async def scenario():
+            # Two concurrent tests with the same requirements share one install
+            return await asyncio.gather(
+                *(run_code_node_test(code, {"a": 1, "b": 2}, "requests==2.31.0") for _ in range(2))
+            )
+        first, second = asyncio.run(scenario())
+
+    assert first == second == {"status": "success", "result": {"sum": 3}}
+    install_commands = [command for command in commands if "pip install" in command[-1]]
+    assert len(install_commands) == 1
+    assert "--no-cache-dir" in install_commands[0][-1]
+    assert not any(command[:2] == ["docker", "cp"] for command in commands)
+    # Both runs went to warm workers, with the code and input streamed rather than copied in
+    assert len(worker_requests) == 2
+    script, input_json = worker_requests[0]
+    assert code in script
+    assert json.loads(input_json) == {"a": 1, "b": 2}
+
+def test_failed_requirements_install_does_not_leave_its_lock_behind():
+    async def failing_pip(command, input_text=None, timeout=60):
+        return subprocess.CompletedProcess(command, 1, stdout=b"", stderr=b"No matching distribution")
+
+    with patch('app.services.node_execution._run_docker_command', side_effect=failing_pip), \
+         patch('app.services.node_execution._code_executor_ready', True), \
+         patch.dict('app.services.node_execution._INSTALLED_REQUIREMENTS', clear=True), \
+         patch.dict('app.services.node_execution._REQUIREMENTS_LOCKS', clear=True):
+        result = asyncio.run(run_code_node_test("def execute(input_data):\n    return 1", {}, "no-such-package==0"))
+        locks_left = dict(node_execution._REQUIREMENTS_LOCKS)
+
+    assert result["error"] == "Failed to install requirements"
+    assert locks_left == {}
+
+def test_executor_worker_runs_scripts_in_forked_children():
+    async def start_local_worker():
+        # The worker program is plain Python; run it here instead of inside the container
+        return await asyncio.create_subprocess_exec(
+            sys.executable, "-u", "-c", node_execution._EXECUTOR_WORKER,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+
+    async def scenario():
+        run = node_execution._run_in_executor_worker
+        first = await run("import sys, os; print(sys.stdin.read()); print(os.getpid())", b'{"a": 1}', 5)
+        worker = node_execution._IDLE_EXECUTOR_WORKERS[-1]
+        failed = await run("import sys; print('oops', file=sys.stderr); sys.exit(3)", b"", 5)
+        try:
+            await run("import time; time.sleep(5)", b"", 0.2)
+            timed_out = False
+        except subprocess.TimeoutExpired:
+            timed_out = True
+        after_timeout = await run("import os; print(os.getpid())", b"", 5)
+        reused = node_execution._IDLE_EXECUTOR_WORKERS[-1] is worker
+        await node_execution.shutdown()
+        return first, failed, timed_out, after_timeout, reused
+
+    with patch('app.services.node_execution._start_executor_worker', side_effect=start_local_worker), \
+         patch.object(node_execution, '_IDLE_EXECUTOR_WORKERS', []):
+        first, failed, timed_out, after_timeout, reused = asyncio.run(scenario())
+
+    echoed_input, child_pid = first.stdout.decode().splitlines()
+    assert first.returncode == 0 and echoed_input == '{"a": 1}'
+    assert (failed.returncode, failed.stdout, failed.stderr.strip()) == (3, b"", b"oops")
+    assert timed_out
+    # Every script runs in a fresh child of the same warm worker
+    assert after_timeout.returncode == 0 and after_timeout.stdout.strip() != child_pid.encode()
+    assert reused
+
+def test_code_node_test_reports_only_a_prefix_of_invalid_output():
+    async def fake_worker(script, input_json, timeout):
+        return subprocess.CompletedProcess(["python"], 0, stdout=b"not json " * 10000, stderr=b"")
+
+    with patch('app.services.node_execution._run_in_executor_worker', side_effect=fake_worker), \
+         patch('app.services.node_execution._code_executor_ready', True):
+        result = asyncio.run(run_code_node_test("def execute(input_data):\n    return {}", {}, ""))
+
+    assert result["status"] == "error"
+    assert result["error"] == "Execution produced no result"
+    assert len(result["details"]) < 1100
+
+def test_code_node_test_ignores_output_printed_by_user_code():
+    async def fake_worker(script, input_json, timeout):
+        stdout = b'debug: {"not": "the result"}\n\x1e{"status": "success", "result": 2}\n'
+        return subprocess.CompletedProcess(["python"], 0, stdout=stdout, stderr=b"")
+
+    with patch('app.services.node_execution._run_in_executor_worker', side_effect=fake_worker), \
+         patch('app.services.node_execution._code_executor_ready', True):
+        result = asyncio.run(run_code_node_test("def execute(input_data):\n    return 2", {}, ""))
+
+    assert result == {"status": "success", "result": 2}
+
+def test_code_node_test_reports_a_result_record_that_is_not_text_as_unparsable():
+    async def fake_worker(script, input_json, timeout):
+        return subprocess.CompletedProcess(["python"], 0, stdout=b'\x1e{"status": "\xe9"}\n', stderr=b"")
+
+    with patch('app.services.node_execution._run_in_executor_worker', side_effect=fake_worker), \
+         patch('app.services.node_execution._code_executor_ready', True):
+        result = asyncio.run(run_code_node_test("def execute(input_data):\n    return {}", {}, ""))
+
+    assert result["status"] == "error"
+    assert result["error"] == "Failed to parse execution result from script"
+
+def test_code_node_test_reports_an_unavailable_executor():
+    async def missing_docker(script, input_json, timeout):
+        raise FileNotFoundError("docker")
+
+    with patch('app.services.node_execution.ensure_code_executor_running', return_value=False), \
+         patch('app.services.node_execution._code_executor_ready', False):
+        unavailable = asyncio.run(run_code_node_test("def execute(input_data):\n    return 1", {}, ""))
+    with patch('app.services.node_execution._run_in_executor_worker', side_effect=missing_docker), \
+         patch('app.services.node_execution._code_executor_ready', True):
+        no_docker_cli = asyncio.run(run_code_node_test("def execute(input_data):\n    return 1", {}, ""))
+
+    assert unavailable["status"] == "error"
+    assert unavailable["error"] == "Code executor container is not available"
+    assert no_docker_cli["error"] == "Docker command not found"
+
+def test_run_docker_command_does_not_block_and_enforces_timeout():
+    async def scenario():
+        echoed = await _run_docker_command([sys.executable, "-c", "import sys; print(sys.stdin.read())"], input_text="hi")
+        try:
+            await _run_docker_command([sys.executable, "-c", "import time; time.sleep(5)"], timeout=0.2)
+        except subprocess.TimeoutExpired:
+            return echoed, True
+        return echoed, False
+
+    echoed, timed_out = asyncio.run(scenario())
+    assert echoed.returncode == 0 and echoed.stdout.strip() == b"hi"
+    assert timed_out
+
+def test_code_node_compiles_source_once():
+    node_data = {"code": "result = {'doubled': input_data['n'] * 2}"}
+    _compile_user_code.cache_clear()
+
+    first = execute_code_node(node_data, {"n": 2}, node_id="code-1")
+    second = execute_code_node(node_data, {"n": 5}, node_id="code-1")
+
+    assert first["output"] == {"doubled": 4}
+    assert second["output"] == {"doubled": 10}
+    cache_info = _compile_user_code.cache_info()
+    assert (cache_info.misses, cache_info.hits) == (1, 1)
+
+def test_code_node_runs_off_the_event_loop_thread():
+    node = Node(id="code-1", type="code", position={"x": 0, "y": 0},
+                data={"code": "import threading\nresult = threading.current_thread().name"})
+
+    result = asyncio.run(execute_node(node, {}, _workflow_with(node), {}))
+
+    assert result.output["output"].startswith("code-node")
+
+def test_executor_container_is_created_with_resource_limits():
+    commands = []
+
+    def fake_run(command, **kwargs):
+        commands.append(command)
+        missing = command[:2] == ["docker", "inspect"]
+        return subprocess.CompletedProcess(command, 1 if missing else 0, stdout="", stderr="")
+
+    with patch('app.services.node_execution.subprocess.run', side_effect=fake_run), \
+         patch('app.services.node_execution._code_executor_ready', False):
+        assert ensure_code_executor_running() is True
+
+    run_command = commands[-1]
+    assert run_command[:3] == ["docker", "run", "-d"]
+    assert {"--cpus=1", "--memory=512m", "--pids-limit=64", "PYTHONDONTWRITEBYTECODE=1"} <= set(run_command)
+
+def test_executor_container_id_is_cached_for_docker_exec():
+    def fake_run(command, **kwargs):
+        return subprocess.CompletedProcess(command, 0, stdout="true 3f2a9c\n", stderr="")
+
+    with patch('app.services.node_execution.subprocess.run', side_effect=fake_run), \
+         patch('app.services.node_execution._code_executor_ready', False), \
+         patch('app.services.node_execution._code_executor_id', None):
+        assert ensure_code_executor_running() is True
+        assert node_execution._code_executor_target() == "3f2a9c"
+
+        node_execution._forget_code_executor()
+        assert node_execution._code_executor_ready is False
+        assert node_execution._code_executor_target() == node_execution.CODE_EXECUTOR_CONTAINER_NAME
+
+def test_summarize_previews_large_payloads_without_rendering_them_fully():
+    class Unrenderable:
+        def __repr__(self):
+            raise AssertionError("only the first items should be rendered")
+
+    payload = {"items": list(range(100_000)) + [Unrenderable()]}
+
+    summary = serialization.summarize(payload)
+
+    assert summary.startswith("{'items': [0, 1, 2")
+    assert len(summary) <= 103
+    assert serialization.summarize("x" * 150) == "x" * 100 + "..."
+
+def test_serialization_round_trips_what_the_json_module_does():
+    big = 2 ** 70
+    document = {"id": big, "below": -2 ** 63 - 1, "ratio": float("nan"), "limit": float("inf"), "none": None}
+
+    for encoded in (serialization.dumps(document), serialization.dumps_bytes(document)):
+        text = encoded.decode() if isinstance(encoded, bytes) else encoded
+        assert str(big) in text and "NaN" in text and "Infinity" in text
+        decoded = serialization.loads(encoded)
+        assert decoded["id"] == big and isinstance(decoded["id"], int)
+        assert decoded["below"] == -2 ** 63 - 1
+        assert decoded["ratio"] != decoded["ratio"] and decoded["limit"] == float("inf")
+        assert decoded["none"] is None
+
+    assert serialization.loads('{"x": NaN, "y": -Infinity}')["y"] == float("-inf")
+    assert serialization.dumps({"ok": None, "n": 1.5}) == '{"ok":null,"n":1.5}'
+
+def test_serialization_loads_rejects_bytes_that_are_not_text_as_invalid_json():
+    with pytest.raises(json.JSONDecodeError):
+        serialization.loads(b'<html>\xe9</html>')
+
+@patch('app.services.node_execution.litellm_acompletion', new_callable=AsyncMock)
+def test_generate_code_extracts_fenced_code(mock_acompletion):
+    code = "def execute(input_data):\n    return {'ok': True}"
+    mock_acompletion.return_value = _llm_response(f"Sure, here you go:\n```\n{code}\n```\nEnjoy!")
+
+    with patch.dict('app.services.node_execution._CODE_GEN_CACHE', clear=True):
+        result = asyncio.run(generate_code_with_llm({}, None, "Return ok"))
+
+    assert result == {"status": "success", "generated_code": code}
+
+@patch('app.services.node_execution.litellm_acompletion', new_callable=AsyncMock)
+def test_generate_code_caches_identical_requests(mock_acompletion):
+    mock_acompletion.return_value = _llm_response("```python\ndef execute(input_data):\n    return 1\n```")
+
+    async def scenario():
+        first, second = await asyncio.gather(*(generate_code_with_llm({}, None, "Return 1") for _ in range(2)))
+        third = await generate_code_with_llm({}, None, "Return 1")
+        other = await generate_code_with_llm({}, None, "Return 2")
+        return first, second, third, other
+
+    with patch.dict('app.services.node_execution._CODE_GEN_CACHE', clear=True), \
+         patch.dict('app.services.node_execution._CODE_GEN_LOCKS', clear=True):
+        first, second, third, other = asyncio.run(scenario())
+
+    assert first == second == third == other
+    first["generated_code"] = "mutated"
+    assert third["generated_code"] != "mutated"
+    assert mock_acompletion.await_count == 2
+
+@patch('app.services.node_execution.litellm_acompletion', new_callable=AsyncMock)
+def test_generate_code_cache_is_not_shared_between_api_keys(mock_acompletion):
+    mock_acompletion.return_value = _llm_response("```python\ndef execute(input_data):\n    return 1\n```")
+
+    async def scenario():
+        for api_key in ("sk-first", "sk-second", "sk-first"):
+            with patch.dict('os.environ', {"OPENAI_API_KEY": api_key}):
+                await generate_code_with_llm({}, None, "Return 1")
+
+    with patch.dict('app.services.node_execution._CODE_GEN_CACHE', clear=True), \
+         patch.dict('app.services.node_execution._CODE_GEN_LOCKS', clear=True):
+        asyncio.run(scenario())
+
+    assert [call.kwargs["api_key"] for call in mock_acompletion.await_args_list] == ["sk-first", "sk-second"]
+
+@patch('app.services.node_execution.litellm_acompletion', new_callable=AsyncMock)
+def test_cancelled_code_generation_does_not_leave_its_lock_behind(mock_acompletion):
+    async def slow_completion(**kwargs):
+        await asyncio.sleep(10)
+    mock_acompletion.side_effect = slow_completion
+
+    async def scenario():
+        request = asyncio.create_task(generate_code_with_llm({}, None, "Return 1"))
+        await asyncio.sleep(0.01)
+        request.cancel()
+        await asyncio.gather(request, return_exceptions=True)
+        return dict(node_execution._CODE_GEN_LOCKS)
+
+    with patch.dict('os.environ', {"OPENAI_API_KEY": "sk-test"}), \
+         patch.dict('app.services.node_execution._CODE_GEN_CACHE', clear=True), \
+         patch.dict('app.services.node_execution._CODE_GEN_LOCKS', clear=True):
+        locks_left = asyncio.run(scenario())
+
+    assert mock_acompletion.await_count == 1
+    assert locks_left == {}
+
+def test_llm_client_session_is_closed_on_shutdown_and_recreated_on_startup():
+    async def scenario():
+        await node_execution.shutdown()
+        closed_session = litellm.aclient_session
+        with patch('app.services.node_execution.ensure_code_executor_running', return_value=True):
+            await node_execution.initialize()
+        return closed_session, litellm.aclient_session
+
+    closed_session, session = asyncio.run(scenario())
+
+    assert closed_session.is_closed
+    assert isinstance(session, httpx.AsyncClient) and not session.is_closed
+
+@patch('app.services.node_execution.litellm_acompletion', new_callable=AsyncMock)
+def test_generate_code_prompt_describes_inputs_with_compact_samples(mock_acompletion):
+    mock_acompletion.return_value = _llm_response("def execute(input_data):\n    return 1")
+    schema = {"hook": {"node_name": "Hook", "node_type": "webhook_trigger", "data_structure_sample": {"user": {"id": 1}}}}
+
+    with patch.dict('app.services.node_execution._CODE_GEN_CACHE', clear=True):
+        asyncio.run(generate_code_with_llm(schema, None, "Return the user id"))
+
+    prompt = mock_acompletion.call_args.kwargs["messages"][1]["content"]
+    assert "Node 'Hook' (ID: hook, Type: webhook_trigger)" in prompt
+    assert f"Sample data structure: {serialization.dumps({'user': {'id': 1}})}" in prompt
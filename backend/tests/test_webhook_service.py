@@ -0,0 +1,52 @@
+import asyncio
+import json
+from collections import deque
+from unittest.mock import patch
+
+from app.services import webhook_service
+from app.utils import persistence
+from app.utils.persistence import DateTimeEncoder, webhook_mapping, webhook_payloads
+
+@patch('app.services.webhook_service.append_webhook_payload')
+@patch('app.services.webhook_service.save_webhooks_to_disk')
+def test_handle_webhook_keeps_only_the_latest_payloads(mock_save_webhooks, mock_append_payload):
+    async def scenario():
+        webhook_id = await webhook_service.register_webhook("wf-1", "node-1")
+        for i in range(webhook_service.MAX_STORED_PAYLOADS + 5):
+            await webhook_service.handle_webhook(webhook_id, {"n": i})
+        return webhook_id
+
+    with patch.dict(webhook_mapping, clear=True), patch.dict(webhook_payloads, clear=True):
+        webhook_id = asyncio.run(scenario())
+        stored = webhook_payloads[webhook_id]
+        saved = json.loads(json.dumps(webhook_payloads, cls=DateTimeEncoder))
+
+    assert mock_append_payload.call_count == webhook_service.MAX_STORED_PAYLOADS + 5
+    assert isinstance(stored, deque)
+    assert [entry["payload"]["n"] for entry in stored] == list(range(5, 15))
+    assert [entry["payload"]["n"] for entry in saved[webhook_id]] == list(range(5, 15))
+
+def test_payload_log_is_appended_replayed_and_compacted(tmp_path):
+    with patch.object(persistence, 'webhook_payloads_file', str(tmp_path / "webhook_payloads.json")), \
+         patch.object(persistence, 'webhook_payloads_log_file', str(tmp_path / "webhook_payloads.jsonl")), \
+         patch.object(persistence, 'WEBHOOK_PAYLOAD_COMPACT_EVERY', 3), \
+         patch.object(persistence, '_payload_log_appends', 0), \
+         patch.dict(webhook_payloads, clear=True):
+        for i in range(4):
+            entry = {"received_at": float(i), "payload": {"n": i}}
+            webhook_payloads.setdefault("hook", []).append(entry)
+            persistence.append_webhook_payload("hook", entry)
+
+        # The third append compacted the first three into the full file; only the fourth is left in the log
+        with open(persistence.webhook_payloads_file) as f:
+            assert [e["payload"]["n"] for e in json.load(f)["hook"]] == [0, 1, 2]
+        with open(persistence.webhook_payloads_log_file, 'rb') as f:
+            assert len(f.readlines()) == 1
+
+        # Simulate a restart: full file plus log replay restores every payload exactly once
+        with open(persistence.webhook_payloads_file) as f:
+            webhook_payloads.clear()
+            webhook_payloads.update(json.load(f))
+        persistence.append_webhook_payload("hook", {"received_at": 2.0, "payload": {"n": 2}})  # already in the file
+        assert persistence._replay_webhook_payload_log() == 1
+        assert [e["payload"]["n"] for e in webhook_payloads["hook"]] == [0, 1, 2, 3]
@@ -0,0 +1,592 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+from app.models.workflow import Workflow, Node, Edge, NodeExecutionResult
+from app.services import workflow_service
+from app.services.workflow_service import execute_workflow_logic
+from app.utils import persistence
+
+def _fan_out_workflow(metadata=None) -> Workflow:
+    return Workflow(
+        id="wf-fan-out",
+        name="Fan Out",
+        nodes=[
+            Node(id="start", type="input", position={"x": 0, "y": 0}, data={"label": "Start"}),
+            Node(id="llm-a", type="llm", position={"x": 200, "y": -100}, data={"label": "A"}),
+            Node(id="llm-b", type="llm", position={"x": 200, "y": 100}, data={"label": "B"}),
+        ],
+        edges=[
+            Edge(id="e-a", source="start", target="llm-a"),
+            Edge(id="e-b", source="start", target="llm-b"),
+        ],
+        metadata=metadata,
+    )
+
+def _run(workflow: Workflow, fake_execute_node):
+    """Runs the workflow to completion and returns the decoded log entries pushed to the stream."""
+    async def scenario():
+        run_id = "run-fan-out"
+        queue = asyncio.Queue()
+        workflow_service._register_stream(run_id).append(queue)
+        await execute_workflow_logic(workflow, run_id, {"value": 1}, is_test=False)
+        logs = []
+        while not queue.empty():
+            # Frames logged in a burst are queued as one chunk
+            for frame in queue.get_nowait().split(b"\r\n\r\n")[:-1]:
+                logs.append(json.loads(frame[len(b"data: "):]))
+        return logs
+
+    with patch('app.services.workflow_service.execute_node', side_effect=fake_execute_node), \
+         patch('app.services.workflow_service.schedule_save'), \
+         patch('app.services.workflow_service.save_individual_run_log'):
+        return asyncio.run(scenario())
+
+def test_independent_nodes_execute_concurrently():
+    in_flight = 0
+    peak_in_flight = 0
+
+    async def fake_execute_node(node, input_data, workflow, run_outputs, render_cache=None):
+        nonlocal in_flight, peak_in_flight
+        in_flight += 1
+        peak_in_flight = max(peak_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return NodeExecutionResult(output={"from": node.id})
+
+    logs = _run(_fan_out_workflow(), fake_execute_node)
+
+    assert peak_in_flight == 2
+    finished = {log["node_id"]: log["status"] for log in logs if log["step"].startswith("Finished Node")}
+    assert finished == {"start": "Success", "llm-a": "Success", "llm-b": "Success"}
+    assert logs[-2]["status"] == "Success"
+
+def test_parallel_nodes_respect_max_parallel_and_report_failures():
+    in_flight = 0
+    peak_in_flight = 0
+
+    async def fake_execute_node(node, input_data, workflow, run_outputs, render_cache=None):
+        nonlocal in_flight, peak_in_flight
+        in_flight += 1
+        peak_in_flight = max(peak_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        if node.id == "llm-b":
+            raise ValueError("model unavailable")
+        return NodeExecutionResult(output={"from": node.id})
+
+    logs = _run(_fan_out_workflow(metadata={"max_parallel_nodes": 1}), fake_execute_node)
+
+    assert peak_in_flight == 1
+    finished = {log["node_id"]: log for log in logs if log["step"].startswith("Finished Node")}
+    assert finished["llm-a"]["status"] == "Success"
+    assert finished["llm-b"]["status"] == "Failed"
+    assert finished["llm-b"]["error"] == "model unavailable"
+    assert logs[-2]["status"] == "Finished with Errors"
+
+def test_nodes_of_a_run_do_not_share_a_render_cache():
+    caches = []
+
+    async def fake_execute_node(node, input_data, workflow, run_outputs, render_cache=None):
+        caches.append(render_cache)
+        return NodeExecutionResult(output={"from": node.id})
+
+    _run(_fan_out_workflow(), fake_execute_node)
+
+    # Outputs may be mutated later in the run, so each execution serializes them afresh
+    assert caches == [None, None, None]
+
+def test_scheduled_saves_are_coalesced_and_written_off_loop():
+    writes = []
+
+    def fake_write_files(files):
+        writes.append([path for path, _ in files])
+
+    async def scenario():
+        for _ in range(5):
+            persistence.schedule_save()
+        await persistence.flush_saves()
+
+    with patch('app.utils.persistence._write_files', side_effect=fake_write_files), \
+         patch('app.utils.persistence.SAVE_DEBOUNCE_SECONDS', 0.01):
+        asyncio.run(scenario())
+
+    assert writes == [[persistence.workflows_file, persistence.runs_file,
+                       persistence.webhook_registry_file, persistence.webhook_payloads_file]]
+
+def test_run_aborts_when_sse_client_stops_reading():
+    executed = []
+
+    async def fake_execute_node(node, input_data, workflow, run_outputs, render_cache=None):
+        executed.append(node.id)
+        return NodeExecutionResult(output={"from": node.id})
+
+    async def scenario():
+        run_id = "run-slow-client"
+        queue = asyncio.Queue(maxsize=1) # Nobody reads: the start log fills it
+        workflow_service._register_stream(run_id).append(queue)
+        await execute_workflow_logic(_fan_out_workflow(), run_id, {"value": 1}, is_test=False)
+        return run_id
+
+    # Every frame is pushed on its own, so the queue fills on the second one
+    with patch.object(workflow_service, "SSE_FLUSH_DELAY_SECONDS", 0), \
+         patch('app.services.workflow_service.execute_node', side_effect=fake_execute_node), \
+         patch('app.services.workflow_service.schedule_save'), \
+         patch('app.services.workflow_service.save_individual_run_log'):
+        run_id = asyncio.run(scenario())
+
+    assert executed == ["start"] # The tick in flight finishes; its successors never run
+    assert run_id not in workflow_service.stream_queues
+    run_log = persistence.workflow_runs["wf-fan-out"][0]
+    assert run_log[-1]["status"] == "Aborted (Client Disconnected)"
+
+def test_log_stream_fans_out_sse_frames_and_ends_on_end_event():
+    class FakeRequest:
+        client = None
+
+    async def scenario():
+        run_id = "run-stream"
+        workflow_service._register_stream(run_id)
+
+        async def read_stream():
+            return [frame async for frame in workflow_service.log_stream_generator(run_id, FakeRequest())]
+
+        # Two clients of the same run, the second connecting after the run started
+        run_task = asyncio.create_task(execute_workflow_logic(_fan_out_workflow(), run_id, {"value": 1}, is_test=False))
+        first_client = asyncio.create_task(read_stream())
+        await asyncio.sleep(0)
+        second_client = asyncio.create_task(read_stream())
+        await run_task
+        return await first_client, await second_client, run_id
+
+    async def fake_execute_node(node, input_data, workflow, run_outputs, render_cache=None):
+        return NodeExecutionResult(output={"from": node.id})
+
+    with patch('app.services.workflow_service.execute_node', side_effect=fake_execute_node), \
+         patch('app.services.workflow_service.schedule_save'), \
+         patch('app.services.workflow_service.save_individual_run_log'):
+        frames, second_client_frames, run_id = asyncio.run(scenario())
+
+    # Frames already queued are written together, so compare the streams rather than the writes
+    stream = b"".join(frames)
+    assert b"".join(second_client_frames) == stream
+    assert stream.startswith(b"data: ") and stream.endswith(b"\r\n\r\n")
+    events = [json.loads(frame[len(b"data: "):]) for frame in stream.split(b"\r\n\r\n")[:-1]]
+    # The late client got the events logged before it connected in one write
+    assert len(second_client_frames) < len(events)
+    assert events[-1]["step"] == "__END__"
+    assert run_id not in workflow_service.stream_queues
+
+def test_frames_of_a_burst_are_pushed_as_one_chunk_and_end_is_not_held_back():
+    async def scenario():
+        queue = asyncio.Queue()
+        workflow_service._register_stream("run-burst").append(queue)
+        for i in range(3):
+            workflow_service._publish("run-burst", json.dumps({"i": i}).encode())
+        assert queue.empty()
+        await asyncio.sleep(workflow_service.SSE_FLUSH_DELAY_SECONDS * 3)
+        burst = queue.get_nowait()
+        workflow_service._publish("run-burst", json.dumps({"i": 3}).encode())
+        workflow_service._publish("run-burst", workflow_service._EndOfStream(b'{"step":"__END__"}'))
+        end = queue.get_nowait()
+        assert queue.empty()
+        return burst, end
+
+    try:
+        burst, end = asyncio.run(scenario())
+    finally:
+        workflow_service.stream_queues.pop("run-burst", None)
+        workflow_service.stream_history.pop("run-burst", None)
+        workflow_service.stream_disconnected.pop("run-burst", None)
+
+    assert burst == b"".join(b'data: {"i": %d}\r\n\r\n' % i for i in range(3))
+    assert isinstance(end, workflow_service._EndOfStream)
+    assert end == b'data: {"i": 3}\r\n\r\ndata: {"step":"__END__"}\r\n\r\n'
+
+def test_replay_history_keeps_only_the_latest_frames():
+    async def scenario():
+        workflow_service._register_stream("run-history").append(asyncio.Queue())
+        for i in range(5):
+            workflow_service._publish("run-history", json.dumps({"i": i}).encode())
+        workflow_service._flush_frames("run-history")
+        return list(workflow_service.stream_history.pop("run-history"))
+
+    with patch.object(workflow_service, "SSE_MAX_QUEUE_SIZE", 3):
+        history = asyncio.run(scenario())
+    workflow_service.stream_queues.pop("run-history", None)
+    workflow_service.stream_disconnected.pop("run-history", None)
+
+    assert [json.loads(frame[len(b"data: "):])["i"] for frame in history] == [2, 3, 4]
+
+def test_redis_relay_marks_the_run_and_publishes_its_frames_in_order():
+    outbox = asyncio.Queue()
+
+    async def fake_execute_node(node, input_data, workflow, run_outputs, render_cache=None):
+        return NodeExecutionResult(output={"from": node.id})
+
+    with patch.object(workflow_service, "_pubsub_outbox", outbox):
+        logs = _run(_fan_out_workflow(), fake_execute_node)
+
+    commands = [outbox.get_nowait() for _ in range(outbox.qsize())]
+    assert commands[0] == ("set", ("stream:run-fan-out", b"1"), {"ex": workflow_service.STREAM_ACTIVE_KEY_TTL_SECONDS})
+    assert commands[-1] == ("delete", ("stream:run-fan-out",), {})
+    published = [args[1] for command, args, _ in commands if command == "publish"]
+    assert all(args[0] == "run:run-fan-out" for command, args, _ in commands if command == "publish")
+    assert published[-1] == workflow_service._RELAY_END_MARKER
+    assert [json.loads(frame[len(b"data: "):]) for frame in published[:-1]] == logs
+
+def test_stream_of_a_run_on_another_worker_is_read_from_redis():
+    frames = [b'data: {"step":"Starting Workflow Execution"}\r\n\r\n', b'data: {"step":"__END__","run_id":"run-remote"}\r\n\r\n']
+
+    channels = []
+
+    class FakePubSub:
+        closed = False
+        async def subscribe(self, channel):
+            channels.append(channel)
+        async def listen(self):
+            yield {"type": "subscribe", "data": 1}
+            for frame in frames:
+                yield {"type": "message", "data": frame}
+            yield {"type": "message", "data": workflow_service._RELAY_END_MARKER}
+            raise AssertionError("the stream should end at the end marker")
+        async def aclose(self):
+            FakePubSub.closed = True
+
+    class FakeRedis:
+        def pubsub(self):
+            return FakePubSub()
+        async def exists(self, key):
+            return key == "stream:run-remote"
+
+    class FakeRequest:
+        client = None
+
+    async def read_stream(run_id):
+        return [frame async for frame in workflow_service.log_stream_generator(run_id, FakeRequest())]
+
+    with patch.object(workflow_service, "_pubsub_redis", FakeRedis()):
+        assert asyncio.run(read_stream("run-remote")) == frames
+        unknown = asyncio.run(read_stream("run-unknown"))
+
+    assert channels == ["run:run-remote", "run:run-unknown"]
+    assert FakePubSub.closed
+    assert json.loads(unknown[0][len(b"data: "):])["step"] == "Error"
+
+def test_test_webhook_signals_match_node_id_spellings():
+    path = "/api/webhooks/wh_wf_dndnode_4"
+
+    async def scenario(provided_node_id):
+        event = workflow_service._expect_webhook_data("run-signal", "dndnode_4")
+        workflow_service.active_webhooks_expecting_test_data[path] = "run-signal"
+        try:
+            signaled = await workflow_service.signal_webhook_data_for_test(path, provided_node_id, {"n": 1})
+            received = workflow_service.webhook_test_data.get("run-signal", {}).get("dndnode_4")
+            return signaled, event.is_set(), received
+        finally:
+            workflow_service.active_webhooks_expecting_test_data.pop(path, None)
+            workflow_service._stop_expecting_webhook_data("run-signal", "dndnode_4")
+
+    for provided_node_id in ("dndnode_4", "dndnode4", "4"):
+        assert asyncio.run(scenario(provided_node_id)) == (True, True, {"n": 1})
+    assert asyncio.run(scenario("5")) == (False, False, None)
+    assert workflow_service.webhook_test_aliases["run-signal"] == {}
+    workflow_service.webhook_test_aliases.pop("run-signal")
+    workflow_service.webhook_test_events.pop("run-signal")
+    workflow_service.webhook_test_data.pop("run-signal", None)
+
+def test_join_node_runs_once_after_all_parents():
+    workflow = _fan_out_workflow()
+    workflow.nodes.append(Node(id="join", type="llm", position={"x": 400, "y": 0}, data={"label": "Join"}))
+    workflow.edges += [Edge(id="e-a-join", source="llm-a", target="join"), Edge(id="e-b-join", source="llm-b", target="join")]
+    executed = []
+
+    async def fake_execute_node(node, input_data, workflow, run_outputs, render_cache=None):
+        if node.id == "join":
+            assert {"llm-a", "llm-b"} <= set(run_outputs)
+        executed.append(node.id)
+        if node.id == "llm-a":
+            await asyncio.sleep(0.01) # The other parent finishes first
+        return NodeExecutionResult(output={"from": node.id})
+
+    logs = _run(workflow, fake_execute_node)
+
+    assert executed.count("join") == 1
+    assert executed[-1] == "join"
+    assert logs[-2]["status"] == "Success"
+
+def test_finished_nodes_are_reported_before_the_rest_of_their_frontier():
+    async def fake_execute_node(node, input_data, workflow, run_outputs, render_cache=None):
+        if node.id == "llm-a":
+            await asyncio.sleep(0.02)
+        return NodeExecutionResult(output={"from": node.id})
+
+    logs = _run(_fan_out_workflow(), fake_execute_node)
+
+    finished_order = [log["node_id"] for log in logs if log["step"].startswith("Finished Node")]
+    assert finished_order == ["start", "llm-b", "llm-a"]
+
+def test_node_admission_admits_waiters_when_resized():
+    async def scenario():
+        admission = workflow_service.NodeAdmission(1)
+        entered = []
+
+        async def node(name):
+            async with admission:
+                entered.append(name)
+                await asyncio.sleep(0.05)
+
+        tasks = [asyncio.create_task(node(name)) for name in ("a", "b", "c")]
+        await asyncio.sleep(0.01)
+        assert entered == ["a"]
+        await admission.resize(3)
+        await asyncio.sleep(0.01)
+        assert entered == ["a", "b", "c"] # Admitted before "a" finished
+        await asyncio.gather(*tasks)
+        return admission.active
+
+    assert asyncio.run(scenario()) == 0
+
+def test_run_aborts_when_its_only_sse_client_disconnects():
+    class FakeRequest:
+        client = None
+
+    async def fake_execute_node(node, input_data, workflow, run_outputs, render_cache=None):
+        await asyncio.sleep(0.02)
+        return NodeExecutionResult(output={"from": node.id})
+
+    async def scenario():
+        run_id = "run-disconnect"
+        workflow_service._register_stream(run_id)
+        stream = workflow_service.log_stream_generator(run_id, FakeRequest())
+        client = asyncio.create_task(stream.__anext__())
+        run_task = asyncio.create_task(execute_workflow_logic(_fan_out_workflow(), run_id, {"value": 1}, is_test=False))
+        await client # The client got the first event, then goes away
+        await stream.aclose()
+        await run_task
+        return run_id
+
+    with patch('app.services.workflow_service.execute_node', side_effect=fake_execute_node), \
+         patch('app.services.workflow_service.schedule_save'), \
+         patch('app.services.workflow_service.save_individual_run_log'):
+        run_id = asyncio.run(scenario())
+
+    assert run_id not in workflow_service.stream_disconnected
+    run_log = persistence.workflow_runs["wf-fan-out"][0]
+    assert run_log[-1]["status"] == "Aborted (Client Disconnected)"
+    assert not any(log.get("node_id") == "llm-a" for log in run_log)
+
+def test_with_redis_relay_run_outlives_its_local_client_and_ends_relayed_stream():
+    class FakeRequest:
+        client = None
+
+    async def fake_execute_node(node, input_data, workflow, run_outputs, render_cache=None):
+        await asyncio.sleep(0.02)
+        return NodeExecutionResult(output={"from": node.id})
+
+    async def scenario():
+        run_id = "run-relayed"
+        workflow_service._register_stream(run_id)
+        stream = workflow_service.log_stream_generator(run_id, FakeRequest())
+        client = asyncio.create_task(stream.__anext__())
+        run_task = asyncio.create_task(execute_workflow_logic(_fan_out_workflow(), run_id, {"value": 1}, is_test=False))
+        await client # The only local client goes away; clients on other workers may still be reading
+        await stream.aclose()
+        await run_task
+        return run_id
+
+    outbox = asyncio.Queue()
+    with patch.object(workflow_service, "_pubsub_outbox", outbox), \
+         patch('app.services.workflow_service.execute_node', side_effect=fake_execute_node), \
+         patch('app.services.workflow_service.schedule_save'), \
+         patch('app.services.workflow_service.save_individual_run_log'):
+        run_id = asyncio.run(scenario())
+
+    commands = [outbox.get_nowait() for _ in range(outbox.qsize())]
+    published = [args[1] for command, args, _ in commands if command == "publish"]
+    assert json.loads(published[-2][len(b"data: "):])["step"] == "__END__"
+    assert published[-1] == workflow_service._RELAY_END_MARKER
+    assert commands[-1] == ("delete", (f"stream:{run_id}",), {})
+    assert run_id not in workflow_service.stream_queues
+    run_log = persistence.workflow_runs["wf-fan-out"][0]
+    assert any(log.get("node_id") == "llm-a" for log in run_log)
+    assert run_log[-1]["status"] != "Aborted (Client Disconnected)"
+
+def test_cancelled_run_still_ends_its_local_and_relayed_streams():
+    async def fake_execute_node(node, input_data, workflow, run_outputs, render_cache=None):
+        await asyncio.sleep(10)
+
+    async def scenario():
+        run_id = "run-cancelled"
+        queue = asyncio.Queue()
+        workflow_service._register_stream(run_id).append(queue)
+        run_task = asyncio.create_task(execute_workflow_logic(_fan_out_workflow(), run_id, {"value": 1}, is_test=False))
+        await asyncio.sleep(0.01)
+        run_task.cancel()
+        await asyncio.gather(run_task, return_exceptions=True)
+        chunks = [queue.get_nowait() for _ in range(queue.qsize())]
+        return run_id, chunks
+
+    outbox = asyncio.Queue()
+    with patch.object(workflow_service, "_pubsub_outbox", outbox), \
+         patch.object(workflow_service, "SSE_FLUSH_DELAY_SECONDS", 0), \
+         patch('app.services.workflow_service.execute_node', side_effect=fake_execute_node):
+        run_id, chunks = asyncio.run(scenario())
+
+    commands = [outbox.get_nowait() for _ in range(outbox.qsize())]
+    assert isinstance(chunks[-1], workflow_service._EndOfStream)
+    assert commands[-2] == ("publish", (f"run:{run_id}", workflow_service._RELAY_END_MARKER), {})
+    assert commands[-1] == ("delete", (f"stream:{run_id}",), {})
+    assert run_id not in workflow_service.stream_queues
+
+def test_run_history_keeps_newest_runs_first_and_bounded():
+    with patch.dict(persistence.workflow_runs, {"wf-history": [[{"run_id": "loaded"}]]}):
+        runs = persistence.run_history("wf-history")
+        for i in range(persistence.MAX_RUNS_PER_WORKFLOW):
+            runs.appendleft([{"run_id": f"run-{i}"}])
+
+        assert persistence.run_history("wf-history") is runs
+        assert len(runs) == persistence.MAX_RUNS_PER_WORKFLOW
+        assert runs[0][0]["run_id"] == f"run-{persistence.MAX_RUNS_PER_WORKFLOW - 1}"
+        assert all(run[0]["run_id"] != "loaded" for run in runs)
+
+def test_test_runs_work_on_copies_of_the_node_data():
+    workflow = _fan_out_workflow()
+    workflow.nodes[1].data["settings"] = {"model": "gpt"}
+
+    executed = []
+
+    async def fake_execute_node(node, input_data, workflow, run_outputs, render_cache=None):
+        executed.append(node.id)
+        if "settings" in node.data:
+            node.data["settings"]["model"] = "changed"
+        return NodeExecutionResult(output={"from": node.id})
+
+    async def scenario():
+        workflow_service._register_stream("run-test-copy").append(asyncio.Queue())
+        await execute_workflow_logic(workflow, "run-test-copy", {"value": 1}, is_test=True)
+
+    with patch('app.services.workflow_service.execute_node', side_effect=fake_execute_node), \
+         patch('app.services.workflow_service.schedule_save'), \
+         patch('app.services.workflow_service.save_individual_run_log'):
+        asyncio.run(scenario())
+
+    assert "llm-a" in executed
+    assert workflow.nodes[1].data["settings"] == {"model": "gpt"}
+
+def test_store_run_mirrors_runs_to_redis_capped_and_expiring():
+    commands = []
+
+    class FakePipeline:
+        async def __aenter__(self):
+            return self
+        async def __aexit__(self, *exc_info):
+            return False
+        def __getattr__(self, name):
+            return lambda *args: commands.append((name, *args))
+        async def execute(self):
+            commands.append(("execute",))
+
+    class FakeRedis:
+        def pipeline(self, transaction=True):
+            return FakePipeline()
+
+    with patch.dict(persistence.workflow_runs, {}), patch.object(persistence, "_runs_redis", FakeRedis()):
+        assert asyncio.run(persistence.store_run("wf-redis", [{"run_id": "run-1"}])) is True
+        assert persistence.workflow_runs["wf-redis"][0] == [{"run_id": "run-1"}]
+        # Runs are in Redis, so full saves no longer rewrite the runs file
+        assert persistence.runs_file not in [path for path, _ in persistence._snapshot_files()]
+
+    assert commands == [
+        ("lpush", "runs:wf-redis", b'[{"run_id":"run-1"}]'),
+        ("ltrim", "runs:wf-redis", 0, persistence.MAX_RUNS_PER_WORKFLOW - 1),
+        ("expire", "runs:wf-redis", persistence.RUNS_TTL_SECONDS),
+        ("execute",),
+    ]
+
+def test_run_history_is_read_from_redis_so_other_workers_runs_show_up():
+    class FakeRedis:
+        async def lrange(self, key, start, end):
+            assert (key, start, end) == ("runs:wf-shared", 0, persistence.MAX_RUNS_PER_WORKFLOW - 1)
+            return [b'[{"run_id":"run-other-worker"}]', b'[{"run_id":"run-local"}]']
+
+    with patch.dict(persistence.workflow_runs, {"wf-shared": [[{"run_id": "run-local"}]]}):
+        asyncio.run(persistence.refresh_run_history("wf-shared")) # No Redis run store: memory is kept
+        assert persistence.get_run_logs("wf-shared", include_archived=False) == [[{"run_id": "run-local"}]]
+        with patch.object(persistence, "_runs_redis", FakeRedis()):
+            asyncio.run(persistence.refresh_run_history("wf-shared"))
+        assert persistence.get_run_logs("wf-shared", include_archived=False) == [
+            [{"run_id": "run-other-worker"}], [{"run_id": "run-local"}]]
+
+def test_long_log_fields_are_truncated_on_the_stream_only():
+    async def fake_execute_node(node, input_data, workflow, run_outputs, render_cache=None):
+        if node.id == "llm-a":
+            raise ValueError("x" * (workflow_service.SSE_MAX_FIELD_CHARS + 10))
+        return NodeExecutionResult(output={"from": node.id})
+
+    logs = _run(_fan_out_workflow(), fake_execute_node)
+
+    streamed_error = next(log["error"] for log in logs if log.get("node_id") == "llm-a" and log["status"] == "Failed")
+    assert streamed_error.endswith("...[+10 chars]")
+    stored_error = next(log["error"] for log in persistence.workflow_runs["wf-fan-out"][0]
+                        if log.get("node_id") == "llm-a" and log["status"] == "Failed")
+    assert len(stored_error) == workflow_service.SSE_MAX_FIELD_CHARS + 10
+
+def test_streamed_events_carry_the_run_fields():
+    async def fake_execute_node(node, input_data, workflow, run_outputs, render_cache=None):
+        return NodeExecutionResult(output={"from": node.id})
+
+    logs = _run(_fan_out_workflow(), fake_execute_node)
+
+    assert all(log["run_id"] == "run-fan-out" and log["is_test_log"] is False for log in logs)
+    assert logs[0]["step"] == "Starting Workflow Execution"
+
+def test_pending_events_of_a_tick_share_one_timestamp():
+    async def fake_execute_node(node, input_data, workflow, run_outputs, render_cache=None):
+        return NodeExecutionResult(output={"from": node.id})
+
+    logs = _run(_fan_out_workflow(), fake_execute_node)
+
+    pending = {log["node_id"]: log["timestamp"] for log in logs if log["step"].startswith("Executing Node")}
+    assert pending["llm-a"] == pending["llm-b"]
+
+def test_graph_analysis_is_memoized_until_the_graph_changes():
+    workflow = _fan_out_workflow()
+
+    graph = workflow_service.compile_graph(workflow)
+    assert graph.start_node_ids == ("start",)
+    assert graph.adjacency["start"] == ("llm-a", "llm-b")
+    assert graph.parent_counts == {"start": 0, "llm-a": 1, "llm-b": 1}
+    assert workflow_service.compile_graph(workflow) is graph
+
+    workflow.nodes.append(Node(id="join", type="llm", position={"x": 400, "y": 0}, data={}))
+    workflow.edges.append(Edge(id="e-a-join", source="llm-a", target="join"))
+    recompiled = workflow_service.compile_graph(workflow)
+    assert recompiled is not graph
+    assert recompiled.parent_counts["join"] == 1
+
+def test_prepared_workflows_run_with_the_precomputed_graph():
+    workflow = _fan_out_workflow()
+    workflow_service.prepare_workflow(workflow)
+
+    assert workflow._node_index is not None
+    prepared_graph = workflow._graph[1]
+    assert workflow_service.compile_graph(workflow) is prepared_graph
+
+def test_shutdown_cancels_runs_in_progress():
+    async def fake_execute_node(node, input_data, workflow, run_outputs, render_cache=None):
+        await asyncio.sleep(60)
+
+    async def scenario():
+        run_id = await workflow_service.run_workflow("wf-fan-out")
+        task = workflow_service._active_runs[run_id]
+        await asyncio.sleep(0.01)
+        await workflow_service.shutdown()
+        return task
+
+    with patch.dict(persistence.workflows_db, {"wf-fan-out": _fan_out_workflow()}), \
+         patch('app.services.workflow_service.execute_node', side_effect=fake_execute_node):
+        task = asyncio.run(scenario())
+
+    assert task.cancelled()
+    assert workflow_service._active_runs == {}